@@ -1,60 +1,281 @@
-import json
+import hmac
+import sys
+import threading
+import time
+from functools import partial
+from itertools import combinations
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify
 import numpy as np
 from transformers import AutoTokenizer
 from adapters import AutoAdapterModel
-import torch
-from sklearn.metrics.pairwise import cosine_similarity
 import os
-from supabase import create_client, Client
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.matching.index import (
+    normalize_query, normalize_queries, parse_topic_ids, rank_topic_supervisors, top_abstracts, top_topic_abstracts,
+)
+from backend.matching.encoder import encode_batch, encode_windows, window_starts
+from backend.matching.batcher import MicroBatcher
+from backend.matching.cache import EmbeddingCache, TopicResultCache
+from backend.matching.database import create_database_client
+from backend.matching.loader import fetch_indexes
+from backend.matching.snapshot import (
+    load_or_create_snapshot, load_snapshot, read_manifest, save_snapshot, snapshot_is_fresh, snapshot_lock, touch_indexes,
+)
+from backend.matching.reloader import IndexReloader, IndexStore
+from backend.matching.onnx_backend import OnnxEncoder, ensure_onnx_model
+from backend.matching.retrieval import (
+    RETRIEVAL_METHODS, add_ivf_index, add_prefilter_index, load_projection, retrieve_supervisors, retrieve_supervisors_batch,
+)
+from backend.matching.quantization import QUANTIZATION_METHODS, add_quantized_index, top_abstracts_int8
+from backend.matching.vector_store import VECTOR_BACKENDS, create_vector_store, fetch_vector_indexes
+from backend.matching.metrics import collect_profile, count_request, profile_milliseconds, render_prometheus, timed
+from backend.matching.variants import (
+    DEFAULT_MODEL, ENCODER_FAMILIES, PAPER_FAMILY, EncoderPool, load_encoder, model_family, parse_served_models,
+)
 
 """
 The backend application for the supervisor suggestion system.
 This application uses the SPECTER 2 model to generate embeddings for the student text and
-calculates cosine similarities to the supervisors embeddings, fetched from the database, 
-to suggest supervisors based on user input.
+calculates cosine similarities to the supervisors embeddings, loaded from a binary snapshot or the database
+and preloaded into a normalised embedding matrix at startup, to suggest supervisors based on user input.
 It also supports topic-based suggestions by calculating the similarity of user-selected topics
-to supervisors' topics in the database.
+to supervisors' topics in the database, using an inverted topic index built at startup.
+Requests can select any of the stored embedding variants with the 'model' field, whose query encoders are
+loaded on first use.
+With VECTOR_BACKEND=pgvector, the supervisors are instead searched inside a Postgres database with pgvector,
+and only the topic indexes are loaded at startup.
 """
 
 app = Flask(__name__)
 
+load_dotenv(".env.local")
+
+# Inference backend of the query encoder: "pytorch", "onnx" or "onnx-int8"
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "pytorch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx")
+
+def load_specter_model():
+    """
+    Loads the SPECTER 2 base model with the specter2 adapter activated.
+    """
+    model = AutoAdapterModel.from_pretrained('allenai/specter2_base')
+    model.load_adapter("allenai/specter2", source="hf", load_as="specter2", set_active=True)
+    return model
+
 specter_tokenizer = AutoTokenizer.from_pretrained('allenai/specter2_base')
-specter_model = AutoAdapterModel.from_pretrained('allenai/specter2_base')
 
-specter_model.load_adapter("allenai/specter2", source="hf", load_as="specter2", set_active=True)
+if ENCODER_BACKEND == "pytorch":
+    specter_model = load_specter_model()
+elif ENCODER_BACKEND in ("onnx", "onnx-int8"):
+    onnx_path = ensure_onnx_model(ONNX_MODEL_DIR, ENCODER_BACKEND == "onnx-int8", load_specter_model, specter_tokenizer)
+    specter_model = OnnxEncoder(onnx_path)
+else:
+    raise ValueError(f"Unknown ENCODER_BACKEND: {ENCODER_BACKEND}")
+
+# Index snapshot written by export_snapshot.py, the database is only used if it is missing or stale
+INDEX_SNAPSHOT_PATH = os.getenv("INDEX_SNAPSHOT_PATH", "snapshot")
+INDEX_SNAPSHOT_MAX_AGE_HOURS = os.getenv("INDEX_SNAPSHOT_MAX_AGE_HOURS")
+INDEX_SNAPSHOT_MMAP = os.getenv("INDEX_SNAPSHOT_MMAP", "true").lower() == "true"
+
+# Background reloading of the indexes, 0 seconds only reloads when triggered through /api/reload
+INDEX_RELOAD_INTERVAL_SECONDS = float(os.getenv("INDEX_RELOAD_INTERVAL_SECONDS", "0"))
+INDEX_RELOAD_TOKEN = os.getenv("INDEX_RELOAD_TOKEN")
+
+# Supervisor retrieval: "exact" (scan of all supervisors), "ivf", "prefilter", "int8" or "binary" (approximate,
+# with exact re-scoring of the candidates)
+SUPERVISOR_RETRIEVAL = os.getenv("SUPERVISOR_RETRIEVAL", "exact")
+IVF_LISTS = int(os.getenv("IVF_LISTS", "0")) # 0 uses about 4 * sqrt(number of supervisors) lists
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16")) # Lists scored per query, higher is slower with better recall
+PROJECTION_PATH = os.getenv("PROJECTION_PATH", "projection.npz") # Written by create_supervisors/main.py
+PREFILTER_DIM = int(os.getenv("PREFILTER_DIM", "128")) # Only used if there is no fitted projection
+PREFILTER_CANDIDATES = int(os.getenv("PREFILTER_CANDIDATES", "256")) # Candidates re-scored at full dimension per query
+BINARY_CANDIDATES = int(os.getenv("BINARY_CANDIDATES", "256")) # Candidates re-scored after the Hamming distance per query
+if SUPERVISOR_RETRIEVAL not in RETRIEVAL_METHODS:
+    raise ValueError(f"Unknown SUPERVISOR_RETRIEVAL: {SUPERVISOR_RETRIEVAL}")
+
+# Embedding variants that requests can select with the 'model' field: a comma-separated list of models or "all"
+SERVED_MODELS = parse_served_models(os.getenv("SERVED_MODELS", DEFAULT_MODEL))
+ENCODER_MEMORY_BUDGET_MB = float(os.getenv("ENCODER_MEMORY_BUDGET_MB", "2048"))
+
+# Supervisor vector search: "numpy" (the in-process indexes) or "pgvector" (inside the database, see matching/vector_store.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "numpy")
+if VECTOR_BACKEND not in VECTOR_BACKENDS:
+    raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+if VECTOR_BACKEND == "pgvector" and (SERVED_MODELS != (DEFAULT_MODEL,) or SUPERVISOR_RETRIEVAL != "exact"):
+    raise ValueError(f"VECTOR_BACKEND=pgvector only serves {DEFAULT_MODEL} with SUPERVISOR_RETRIEVAL=exact")
+vector_store = create_vector_store() if VECTOR_BACKEND == "pgvector" else None
+
+encoder_pool = EncoderPool(
+    load_encoder,
+    ENCODER_MEMORY_BUDGET_MB * 2**20,
+    pinned={PAPER_FAMILY: (specter_tokenizer, specter_model)},
+)
+
+def with_retrieval_index(indexes, previous=None):
+    """
+    Adds the index of the approximate retrieval to the matching indexes if it is enabled and they have none.
+    The IVF index reuses the centroids of the previous indexes if possible, the prefilter index uses the projection
+    fitted by the create_supervisors pipeline at PROJECTION_PATH. The int8 and binary retrieval also add int8 codes
+    of the abstract matrix, used to find the top paper.
+    """
+    if SUPERVISOR_RETRIEVAL == "ivf" and 'ivf' not in indexes['supervisors']:
+        print("Building the IVF supervisor index")
+        return add_ivf_index(indexes, IVF_LISTS or None, previous)
 
-load_dotenv(".env.local")
+    if SUPERVISOR_RETRIEVAL == "prefilter" and 'prefilter' not in indexes['supervisors']:
+        projection = load_projection(PROJECTION_PATH)
+        if projection is None:
+            print(f"No projection found at {PROJECTION_PATH}, fitting one on the supervisor embeddings")
+        return add_prefilter_index(indexes, projection, PREFILTER_DIM)
 
-url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-key = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+    if SUPERVISOR_RETRIEVAL in QUANTIZATION_METHODS and SUPERVISOR_RETRIEVAL not in indexes['supervisors']:
+        print(f"Quantizing the supervisor and abstract embeddings ({SUPERVISOR_RETRIEVAL})")
+        return add_quantized_index(indexes, SUPERVISOR_RETRIEVAL)
 
-supabase: Client = create_client(url, key)
+    return indexes
 
-BATCH_SIZE = 25
-offset = 0
-supervisors = []
+def fetch_indexes_from_database(previous=None):
+    """
+    Fetches the supervisor data from the database and builds the matching indexes, with a manifest
+    holding the time of the fetch, so scheduled polls only replace them with a newer snapshot.
+    """
+    print("Loading supervisors from the database")
+    created = time.time()
+    indexes = with_retrieval_index(fetch_indexes(create_database_client(), SERVED_MODELS), previous)
+    return dict(indexes, manifest={'created': created, 'source': "database"})
 
-while True: # Fetching supervisors in batches
-    response = (
-        supabase.table("supervisor")
-        .select("uuid", "specter2_averaged_embedding_with_keywords", "abstracts")
-        .eq("available", True)
-        .range(offset, offset + BATCH_SIZE - 1)
-        .execute()
-    )
-    batch = response.data or []
-    if not batch:
-        break
+def snapshot_max_age():
+    """
+    Returns INDEX_SNAPSHOT_MAX_AGE_HOURS in seconds, or None if snapshots do not expire.
+    """
+    return float(INDEX_SNAPSHOT_MAX_AGE_HOURS) * 3600 if INDEX_SNAPSHOT_MAX_AGE_HOURS else None
 
-    supervisors.extend(batch)
-    offset += BATCH_SIZE
+def fetch_topic_indexes():
+    """
+    Builds the matching indexes of the pgvector backend, which only hold the topic indexes, with a manifest
+    holding the time of the fetch.
+    """
+    created = time.time()
+    indexes = fetch_vector_indexes(vector_store, create_database_client())
+    return dict(indexes, manifest={'created': created, 'source': "database"})
 
-response = supabase.table("supervisor_topic").select("*").execute()
-supervisors_topic_db = response.data
+def load_indexes():
+    """
+    Loads the matching indexes from the binary snapshot, falling back to the database
+    when the snapshot is missing or stale. The snapshot is memory-mapped read-only by default,
+    so all worker processes share one copy of the embedding matrices. After a fallback to the
+    database the snapshot is rewritten, so the other workers can map it.
+    With the pgvector backend, only the topic indexes are loaded from the database.
+    """
+    if vector_store is not None:
+        print("Loading the topic indexes, the supervisors are searched with pgvector")
+        return fetch_topic_indexes()
+
+    max_age = snapshot_max_age()
+    if INDEX_SNAPSHOT_MMAP:
+        return with_retrieval_index(load_or_create_snapshot(
+            INDEX_SNAPSHOT_PATH, fetch_indexes_from_database, max_age, models=SERVED_MODELS,
+        ))
+
+    indexes = load_snapshot(INDEX_SNAPSHOT_PATH, max_age, models=SERVED_MODELS)
+    if indexes is not None:
+        return with_retrieval_index(indexes)
+    return fetch_indexes_from_database()
+
+def reload_indexes(force):
+    """
+    Builds new matching indexes for the background reloader, off the request path.
+    Scheduled polls (force=False) load the snapshot if it was rewritten by export_snapshot.py or another worker
+    after the current indexes were created, and is not older than INDEX_SNAPSHOT_MAX_AGE_HOURS,
+    and return None otherwise. Triggered reloads (force=True) fetch the supervisors from the database
+    and rewrite the snapshot, so the other workers pick up the new data on their next poll.
+    With the pgvector backend, triggered reloads rebuild the topic indexes and polls do nothing.
+    """
+    if vector_store is not None:
+        return fetch_topic_indexes() if force else None
+
+    previous = index_store.current()
+    if not force:
+        manifest = read_manifest(INDEX_SNAPSHOT_PATH)
+        loaded = previous.get('manifest') or {}
+        if not snapshot_is_fresh(manifest, snapshot_max_age(), SERVED_MODELS) or manifest['created'] <= loaded.get('created', 0):
+            return None
+        indexes = load_snapshot(INDEX_SNAPSHOT_PATH, snapshot_max_age(), INDEX_SNAPSHOT_MMAP, SERVED_MODELS)
+        return with_retrieval_index(indexes, previous) if indexes is not None else None
+
+    indexes = fetch_indexes_from_database(previous)
+    if not INDEX_SNAPSHOT_MMAP:
+        return indexes
+
+    try:
+        with snapshot_lock(INDEX_SNAPSHOT_PATH):
+            save_snapshot(INDEX_SNAPSHOT_PATH, indexes)
+    except OSError as e:
+        print(f"Error writing index snapshot: {e}")
+        return indexes
+    return load_snapshot(INDEX_SNAPSHOT_PATH, mmap=True) or indexes
+
+# Cache of topic suggestions by topic ids and index version, 0 entries disables the cache
+TOPIC_CACHE_SIZE = int(os.getenv("TOPIC_CACHE_SIZE", "4096"))
+TOPIC_CACHE_PREWARM = os.getenv("TOPIC_CACHE_PREWARM", "true").lower() == "true"
+TOPIC_CACHE_PREWARM_PAIR_TOPICS = int(os.getenv("TOPIC_CACHE_PREWARM_PAIR_TOPICS", "20")) # Most common topics whose pairs are pre-warmed
+
+topic_cache = TopicResultCache(TOPIC_CACHE_SIZE)
+
+def prewarm_topic_cache(indexes):
+    """
+    Fills the topic cache for the given indexes with the suggestions of every single topic and of every pair of the
+    TOPIC_CACHE_PREWARM_PAIR_TOPICS topics with the most supervisors, most common topics first.
+    """
+    if not TOPIC_CACHE_PREWARM or TOPIC_CACHE_SIZE <= 0:
+        return
+
+    topics = indexes['topics']['topics']
+    topic_ids = sorted(topics, key=lambda topic_id: len(topics[topic_id][0]), reverse=True)
+    queries = [(topic_id,) for topic_id in topic_ids]
+    queries += combinations(topic_ids[:TOPIC_CACHE_PREWARM_PAIR_TOPICS], 2)
+    for topic_ids in queries[:TOPIC_CACHE_SIZE]:
+        get_topic_suggestions([{'topicId': topic_id} for topic_id in topic_ids], indexes)
+    print(f"Pre-warmed the topic cache with {min(len(queries), TOPIC_CACHE_SIZE)} topic queries")
+
+def on_index_swap(indexes):
+    """
+    Warms new indexes after a reload: the pages of the snapshot are read in and the topic cache is pre-warmed.
+    """
+    touch_indexes(indexes)
+    prewarm_topic_cache(indexes)
+
+index_store = IndexStore(load_indexes())
+index_reloader = IndexReloader(index_store, reload_indexes, INDEX_RELOAD_INTERVAL_SECONDS, on_swap=on_index_swap)
 
 NUM_OF_SUPERVISORS = 6
+MAX_BATCH_ITEMS = 1000 # Maximum number of proposals in a single /api/batch request
+ENCODER_BATCH_SIZE = 32 # Maximum number of texts in one forward pass
+ENCODER_MAX_TOKENS = 16384 # Maximum padded tokens (texts x longest text) in one forward pass
+
+# Encoding of texts longer than the encoder's maximum length: "windows" (sliding window) or "truncate"
+LONG_TEXT_MODE = os.getenv("LONG_TEXT_MODE", "windows")
+ENCODER_WINDOW_OVERLAP = int(os.getenv("ENCODER_WINDOW_OVERLAP", "64"))
+ENCODER_MAX_WINDOWS = int(os.getenv("ENCODER_MAX_WINDOWS", "8"))
+if LONG_TEXT_MODE not in ("windows", "truncate"):
+    raise ValueError(f"Unknown LONG_TEXT_MODE: {LONG_TEXT_MODE}")
+
+# Cached embeddings are only reused with the same encoder configuration
+EMBEDDING_NAMESPACE = f"{ENCODER_BACKEND}:{LONG_TEXT_MODE}:{ENCODER_WINDOW_OVERLAP}:{ENCODER_MAX_WINDOWS}"
+
+# Micro-batching of concurrent /api requests, 0 ms disables the batching window
+MICRO_BATCH_WAIT_MS = float(os.getenv("MICRO_BATCH_WAIT_MS", "5"))
+MICRO_BATCH_SIZE = int(os.getenv("MICRO_BATCH_SIZE", "16"))
+MICRO_BATCH_MAX_TOKENS = int(os.getenv("MICRO_BATCH_MAX_TOKENS", "8192"))
+
+# Cache of query embeddings, 0 entries disables the cache
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "3600"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL_SECONDS, EMBEDDING_CACHE_PATH)
 
 @app.route('/api', methods=['POST'])
 def api(): 
@@ -64,214 +285,632 @@ def api():
         projectType: "specific" or "general"
         - If "specific": 
             text: The project description text.
+            model: Optional embedding variant, one of SERVED_MODELS (default "specter2_averaged_with_keywords").
         - If "general": 
             topics: List of topics related to the project.
     Returns:
         - For "specific": JSON list of 6 supervisor suggestions based on text embedding similarity.
         - For "general": JSON list of up to 6 supervisor suggestions based on topic similarity, each with supervisor ID and similarity score.
-        - On error: JSON object with an 'error' message and HTTP 400 status code.
+        - With the query parameter profile=1: JSON object with the suggestions under 'suggestions' and the
+          duration of each stage of the request in milliseconds under 'profile'.
+        - On error: JSON object with an 'error' message and HTTP 400 status code, also for a model that is not served.
     """
     data = request.get_json()
     project_type = data.get('projectType')
+    with collect_profile(request.args.get('profile') == '1') as profile:
+        try:
+            payload, status = suggest(data, index_store.current())
+        except Exception:
+            count_request(project_type, error=True)
+            raise
+        return metered_response(project_type, payload, status, profile)
+
+def suggest(data, indexes):
+    """
+    Calculates the suggestions of an /api request.
+
+    Returns a tuple (payload, HTTP status code).
+    """
+    project_type = data.get('projectType')
     if project_type == "specific":
         text = data.get('text')
-        if not text or not supervisors:
-            return jsonify({'error': 'Invalid input data'}), 400
+        if not text or not len(indexes['supervisors']['uuids']):
+            return {'error': 'Invalid input data'}, 400
+
+        model = request_model(data)
+        if model is None:
+            return {'error': 'Invalid model'}, 400
 
-        embedding = get_embedding(str(text))
-        suggestions = calculate_suggestions(embedding, supervisors)
-        return jsonify(suggestions)
+        embedding, paper_embedding = get_model_embeddings(str(text), model)
+        return calculate_suggestions(embedding, indexes, model, paper_embedding), 200
     
     elif project_type == "general":
         topics = data.get('topics')
         if not topics:
-            return jsonify({'error': 'Invalid input data'}), 400
-
-        suggestions = calculate_topic_suggestions(topics, supervisors_topic_db)
-        sorted_suggestions = sorted(suggestions.items(), key=lambda x: x[1], reverse=True)
-        top_suggestions = sorted_suggestions[:NUM_OF_SUPERVISORS]
-        top_suggestions_with_top_paper = calculate_top_topic_paper(topics, top_suggestions, supervisors)
-        final_suggestions = []
-        for supervisor_id, score, top_paper in top_suggestions_with_top_paper:
-            final_suggestions.append({
-                'supervisor': supervisor_id,
-                'similarity': score,
-                'top_paper': top_paper,
-            })
-        return jsonify(final_suggestions)
+            return {'error': 'Invalid input data'}, 400
+
+        return get_topic_suggestions(topics, indexes), 200
     
     else:
-        return jsonify({'error': 'Invalid project type'}), 400
+        return {'error': 'Invalid project type'}, 400
 
-def get_embedding(sentence):
+def request_model(data):
     """
-    Generates a mean-pooled embedding for a given sentence using the SPECTER model.
+    Returns the model selected by the 'model' field of a request, or None if that model is not served.
     """
-    inputs = specter_tokenizer(sentence, max_length=8192, truncation=True, return_tensors="pt")
-    with torch.no_grad():
-        outputs = specter_model(**inputs)
+    model = data.get('model') or DEFAULT_MODEL
+    return model if isinstance(model, str) and model in SERVED_MODELS else None
 
-    mask = inputs["attention_mask"].unsqueeze(-1)
-    token_embeddings = outputs.last_hidden_state
-    summed = (token_embeddings * mask).sum(dim=1)
-    counts = mask.sum(dim=1)
-    mean_pooled = summed / counts 
+def metered_response(project_type, payload, status, profile=None):
+    """
+    Returns the JSON response of a matching request, counting the request and timing the serialization.
+    If a profile was collected, the payload is returned under 'suggestions' with the stage durations under 'profile'.
+    """
+    count_request(project_type, error=status >= 400)
+    with timed("serialization"):
+        body = app.json.dumps(payload)
 
-    return mean_pooled.squeeze().detach() 
+    if profile is not None and status < 400:
+        body = f'{{"suggestions": {body}, "profile": {app.json.dumps(profile_milliseconds(profile))}}}'
+    return app.response_class(body + "\n", status=status, mimetype="application/json")
 
-def calculate_suggestions(embedding, supervisors):
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
     """
-    Calculates and returns a list of supervisor suggestions based on the cosine similarity
-    between a given embedding and each supervisor's embedding.
-
-    Returns a list of dictionaries, each containing:
-        - 'supervisor' (str): The UUID of the suggested supervisor.
-        - 'similarity' (float): The cosine similarity score between the input embedding and the supervisor's embedding.
-        - 'top_paper' (Any): The result of the calculate_top_paper function for the supervisor.
+    API endpoint to suggest supervisors for many proposals in one call.
+    Expects the following structure:
+        items: List of objects with the same structure as the /api endpoint, which may mix "specific" and "general".
+    All "specific" texts of the same encoder family are encoded together in length-bucketed batches, and the texts
+    of each model are scored against its supervisors with one matrix-matrix product.
+    Returns:
+        - JSON list aligned with items, where each element is the /api response for that item,
+          or a JSON object with an 'error' message if that item is invalid.
+        - With the query parameter profile=1: the same profile format as the /api endpoint.
+        - On error: JSON object with an 'error' message and HTTP 400 status code.
     """
-    similarities = []
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items or len(items) > MAX_BATCH_ITEMS:
+        return metered_response("batch", {'error': 'Invalid input data'}, 400)
 
-    # Ensure embedding is 2D
-    if len(embedding.shape) == 1:
-        embedding = embedding.reshape(1, -1)
+    with collect_profile(request.args.get('profile') == '1') as profile:
+        try:
+            indexes = index_store.current()
+            results, specific_items = prepare_batch(items, indexes)
+
+            if specific_items:
+                embeddings, paper_embeddings = get_batch_embeddings(specific_items)
+                fill_batch_results(results, specific_items, embeddings, paper_embeddings, indexes)
+        except Exception:
+            count_request("batch", error=True)
+            raise
+        return metered_response("batch", results, 200, profile)
+
+def prepare_batch(items, indexes):
+    """
+    Validates the items of a batch request and answers the "general" items.
 
-    for supervisor in supervisors:
-        embedding_str = supervisor.get('specter2_averaged_embedding_with_keywords', [])
+    Returns a tuple (results, specific_items), where results is aligned with items and still has None for the
+    "specific" items, which are returned for encoding as tuples (position, text, model).
+    """
+    results = [None] * len(items)
+    specific_items = []
 
-        if not embedding_str:
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[position] = {'error': 'Invalid input data'}
             continue
 
-        embedding_list = json.loads(embedding_str)
+        project_type = item.get('projectType')
+        if project_type == "specific":
+            text = item.get('text')
+            if not text or not len(indexes['supervisors']['uuids']):
+                results[position] = {'error': 'Invalid input data'}
+                continue
+            model = request_model(item)
+            if model is None:
+                results[position] = {'error': 'Invalid model'}
+                continue
+            specific_items.append((position, str(text), model))
+
+        elif project_type == "general":
+            topics = item.get('topics')
+            if not topics:
+                results[position] = {'error': 'Invalid input data'}
+                continue
+            results[position] = get_topic_suggestions(topics, indexes)
+
+        else:
+            results[position] = {'error': 'Invalid project type'}
+
+    return results, specific_items
+
+def get_batch_embeddings(specific_items):
+    """
+    Generates the query embeddings of the "specific" items of a batch request with the encoder of their model,
+    and the SPECTER 2 embeddings used for their top papers. The texts of each encoder family are encoded together.
 
-        try:
-            supervisor_embedding = np.array([float(x) for x in embedding_list]).reshape(1, -1)
-        except ValueError:
-            print('Error parsing supervisor embedding')
-            continue
+    Returns a tuple (embeddings, paper_embeddings) of lists aligned with specific_items.
+    """
+    texts = [text for _, text, _ in specific_items]
+    families = [model_family(model) for _, _, model in specific_items]
+    embeddings = [None] * len(specific_items)
+    paper_embeddings = [None] * len(specific_items)
+
+    for family in dict.fromkeys(families):
+        positions = [i for i, item_family in enumerate(families) if item_family == family]
+        for i, embedding in zip(positions, get_cached_embeddings([texts[i] for i in positions], family)):
+            embeddings[i] = embedding
+            if family == PAPER_FAMILY:
+                paper_embeddings[i] = embedding
+
+    missing = [i for i, embedding in enumerate(paper_embeddings) if embedding is None]
+    if missing:
+        for i, embedding in zip(missing, get_cached_embeddings([texts[i] for i in missing])):
+            paper_embeddings[i] = embedding
+
+    return embeddings, paper_embeddings
+
+def fill_batch_results(results, specific_items, embeddings, paper_embeddings, indexes):
+    """
+    Fills in the suggestions of the "specific" items of a batch request from their embeddings, one batch per model.
+    """
+    models = [model for _, _, model in specific_items]
+    for model in dict.fromkeys(models):
+        group = [i for i, item_model in enumerate(models) if item_model == model]
+        batch_suggestions = calculate_batch_suggestions(
+            np.stack([embeddings[i] for i in group]),
+            indexes,
+            model,
+            np.stack([paper_embeddings[i] for i in group]),
+        )
+        for i, suggestions in zip(group, batch_suggestions):
+            results[specific_items[i][0]] = suggestions
+
+@app.route('/api/batching', methods=['GET'])
+def api_batching():
+    """
+    API endpoint exposing the queue depth and batch size statistics of the embedding micro-batcher.
+    """
+    return jsonify(embedding_batcher.stats())
 
-        if embedding.shape[1] != supervisor_embedding.shape[1]:
-            continue
+@app.route('/api/cache', methods=['GET'])
+def api_cache():
+    """
+    API endpoint exposing the size and hit/miss counters of the query embedding cache,
+    with those of the topic suggestion cache under 'topics'.
+    """
+    return jsonify(dict(embedding_cache.stats(), topics=topic_cache.stats()))
 
-        similarity = cosine_similarity(embedding, supervisor_embedding).item()
+@app.route('/api/models', methods=['GET'])
+def api_models():
+    """
+    API endpoint exposing the served models, the default model and the query encoders that are currently loaded.
+    """
+    return jsonify({
+        'default': DEFAULT_MODEL,
+        'served': list(SERVED_MODELS),
+        'encoders': encoder_pool.stats(),
+    })
+
+@app.route('/api/reload', methods=['GET', 'POST'])
+def api_reload():
+    """
+    API endpoint to reload the matching indexes without restarting the server.
+    POST triggers a background reload from the database, GET only returns the reload status.
+    POST requests must send INDEX_RELOAD_TOKEN in the 'X-Reload-Token' header, and are rejected if it is not set.
+    Returns:
+        - JSON object with the current index version and the state of the reloader, with HTTP 202 status code for POST.
+        - On error: JSON object with an 'error' message and HTTP 403 status code.
+    """
+    if request.method == 'GET':
+        return jsonify(index_reloader.status())
 
-        similarities.append({
-            'supervisor': supervisor,
-            'similarity': similarity,
-        })
+    if not INDEX_RELOAD_TOKEN:
+        return jsonify({'error': 'Reloading is disabled, set INDEX_RELOAD_TOKEN to enable it'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Reload-Token', "").encode(), INDEX_RELOAD_TOKEN.encode()):
+        return jsonify({'error': 'Invalid reload token'}), 403
 
-    similarities.sort(key=lambda x: x['similarity'], reverse=True)
-    top_suggestions = similarities[:NUM_OF_SUPERVISORS]
+    index_reloader.trigger()
+    return jsonify(index_reloader.status()), 202
 
-    final_suggestions = []
-    for suggestion in top_suggestions:
-        supervisor = suggestion['supervisor']
-        top_paper = calculate_top_embedding_paper(embedding, supervisor)
-        final_suggestions.append({
-            'supervisor': supervisor.get('uuid'),
-            'similarity': suggestion['similarity'],
-            'top_paper': top_paper
-        })
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """
+    Liveness probe, answers as soon as the worker serves requests.
+    """
+    return jsonify({'status': 'ok'})
 
-    return final_suggestions
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    Readiness probe for the load balancer.
+    Returns:
+        - JSON object with the readiness checks, with HTTP 200 status code if the indexes hold supervisors
+          (with the pgvector backend, the supervisors in the vector store) and the warm-up is complete,
+          and HTTP 503 status code otherwise.
+    """
+    indexes = index_store.current()
+    checks = {
+        'indexes': len(indexes['supervisors']['uuids']) > 0,
+        'warmup': warmup_state['complete'],
+    }
+    status = {
+        'ready': all(checks.values()),
+        'checks': checks,
+        'index_version': indexes['version'],
+        'warmup_seconds': warmup_state['seconds'],
+        'warmup_error': warmup_state['error'],
+    }
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Endpoint exposing the stage latency histograms, the request and error counters by project type,
+    the micro-batcher queue depth, the embedding and topic cache counters and the index version in the Prometheus text format.
+    """
+    batching = embedding_batcher.stats()
+    cache = embedding_cache.stats()
+    topics = topic_cache.stats()
+    gauges = {
+        'matching_batcher_queue_depth': ("Texts waiting for the embedding micro-batcher.", batching['queue_depth']),
+        'matching_batcher_mean_batch_size': ("Mean number of texts per micro-batch.", batching['mean_batch_size']),
+        'matching_index_version': ("Version of the loaded matching indexes.", index_store.current()['version']),
+        'matching_ready': ("Whether the warm-up is complete.", int(warmup_state['complete'])),
+        'matching_encoder_memory_bytes': ("Memory used by the loaded query encoders.", encoder_pool.stats()['memory_bytes']),
+    }
+    counters = {
+        'matching_embedding_cache_hits_total': ("Query embedding cache hits.", cache['hits']),
+        'matching_embedding_cache_misses_total': ("Query embedding cache misses.", cache['misses']),
+        'matching_topic_cache_hits_total': ("Topic suggestion cache hits.", topics['hits']),
+        'matching_topic_cache_misses_total': ("Topic suggestion cache misses.", topics['misses']),
+    }
+    return app.response_class(render_prometheus(gauges, counters), mimetype="text/plain; version=0.0.4")
+
+def embedding_namespace(family):
+    """
+    Returns the cache namespace of the query embeddings of an encoder family.
+    """
+    return EMBEDDING_NAMESPACE if family == PAPER_FAMILY else f"{EMBEDDING_NAMESPACE}:{family}"
 
-def calculate_top_embedding_paper(embedding, supervisor):
+def get_embedding(sentence, family=PAPER_FAMILY):
+    """
+    Generates a mean-pooled embedding for a given sentence using the encoder of the given family (SPECTER 2 by default).
+    Cached embeddings are returned without tokenization or inference. Otherwise concurrent calls are
+    collected by the micro-batcher of the family and encoded together in one padded batch.
+    """
+    namespace = embedding_namespace(family)
+    uncased = ENCODER_FAMILIES[family]['uncased']
+    embedding = embedding_cache.get(sentence, namespace, uncased)
+    if embedding is None:
+        embedding = embedding_batcher_for(family).submit(sentence)
+        embedding_cache.put(sentence, embedding, namespace, uncased)
+    return embedding
+
+def get_model_embeddings(sentence, model):
     """
-    Calculates the most similar abstract for a given embedding from a supervisor's list of abstracts.
+    Generates the query embedding of a sentence for the given model, and the SPECTER 2 embedding used
+    to find the top papers, which is the same embedding for the SPECTER 2 models.
 
-    Returns a dictionary with the 'uuid' and 'similarity' of the most similar abstract, or None if no valid abstracts are found.
+    Returns a tuple (embedding, paper_embedding).
     """
-    abstracts = supervisor.get('abstracts', [])
+    family = model_family(model)
+    embedding = get_embedding(sentence, family)
+    paper_embedding = embedding if family == PAPER_FAMILY else get_embedding(sentence)
+    return embedding, paper_embedding
 
-    if not abstracts:
-        return None
+def get_cached_embeddings(sentences, family=PAPER_FAMILY):
+    """
+    Generates mean-pooled embeddings for a list of sentences, only encoding the sentences missing from the cache.
+    """
+    namespace = embedding_namespace(family)
+    uncased = ENCODER_FAMILIES[family]['uncased']
+    embeddings = [embedding_cache.get(sentence, namespace, uncased) for sentence in sentences]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
 
-    similarities = []
+    if missing:
+        encoded = get_embeddings([sentences[i] for i in missing], family)
+        for i, embedding in zip(missing, encoded):
+            embeddings[i] = embedding
+            embedding_cache.put(sentences[i], embedding, namespace, uncased)
 
-    for abstract in abstracts:
-        abstract_embedding = abstract.get('embedding', [])
-        if not abstract_embedding:
-            continue
+    return np.stack(embeddings)
 
-        try:
-            abstract_embedding = np.array([float(x) for x in abstract_embedding]).reshape(1, -1)
-        except ValueError:
-            print('Error parsing abstract embedding')
-            continue
+def get_embeddings(sentences, family=PAPER_FAMILY):
+    """
+    Generates mean-pooled embeddings for a list of sentences using the encoder of the given family.
+    The sentences are padded to the longest sentence in each length bucket, with one forward pass per bucket.
+    In the "windows" long text mode, sentences longer than the maximum length of the encoder are split into at most
+    ENCODER_MAX_WINDOWS overlapping windows, whose embeddings are combined with a length-weighted mean.
+    """
+    tokenizer, model = encoder_pool.get(family)
+    max_length = ENCODER_FAMILIES[family]['max_length']
+
+    if LONG_TEXT_MODE == "windows":
+        return encode_windows(
+            tokenizer,
+            model,
+            sentences,
+            window_size=max_length,
+            overlap=ENCODER_WINDOW_OVERLAP,
+            max_windows=ENCODER_MAX_WINDOWS,
+            max_batch_size=ENCODER_BATCH_SIZE,
+            max_tokens=ENCODER_MAX_TOKENS,
+        )
+
+    return encode_batch(
+        tokenizer,
+        model,
+        sentences,
+        max_length=max_length,
+        max_batch_size=ENCODER_BATCH_SIZE,
+        max_tokens=ENCODER_MAX_TOKENS,
+    )
 
-        if embedding.shape[1] != abstract_embedding.shape[1]:
-            continue
+def model_index(indexes, model):
+    """
+    Returns the supervisor index of a model.
+    """
+    return indexes['supervisors'] if model == DEFAULT_MODEL else indexes['variants'][model]
 
-        similarity = cosine_similarity(embedding, abstract_embedding).item()
-        similarities.append({
-            'uuid': abstract.get('uuid'),
-            'similarity': similarity,
+def calculate_suggestions(embedding, indexes, model=DEFAULT_MODEL, paper_embedding=None):
+    """
+    Calculates and returns a list of supervisor suggestions based on the cosine similarity
+    between a given embedding and each supervisor's embedding in the preloaded supervisor index of the model.
+    The top papers are found with paper_embedding, the SPECTER 2 embedding of the query, if the model is not SPECTER 2.
+    The similarities for all supervisors are computed with a single matrix-vector product, or, with the "ivf"
+    retrieval, only for the supervisors in the IVF_NPROBE closest lists, or, with the "prefilter" retrieval,
+    for the PREFILTER_CANDIDATES best supervisors in the reduced dimension, or, with the "int8" and "binary" retrieval,
+    for the supervisors whose quantized codes score best. With the pgvector backend, the supervisors and their
+    top papers are found by the match_supervisors function in the database.
+
+    Returns a list of dictionaries, each containing:
+        - 'supervisor' (str): The UUID of the suggested supervisor.
+        - 'similarity' (float): The cosine similarity score between the input embedding and the supervisor's embedding.
+        - 'top_paper' (Any): The result of the calculate_top_embedding_paper function for the supervisor.
+    """
+    if vector_store is not None:
+        with timed("supervisor_scoring"):
+            return vector_store.match_supervisors(normalize_query(embedding), NUM_OF_SUPERVISORS)
+
+    supervisor_index = model_index(indexes, model)
+    with timed("supervisor_scoring"):
+        query = normalize_query(embedding)
+        rows, scores = retrieve_supervisors(query, supervisor_index, NUM_OF_SUPERVISORS, **retrieval_options())
+
+    paper_query = query if paper_embedding is None else normalize_query(paper_embedding)
+    top_papers = calculate_top_embedding_paper(paper_query, abstract_rows(supervisor_index, rows), indexes['abstracts'])
+
+    final_suggestions = []
+    for row, score, top_paper in zip(rows, scores, top_papers):
+        final_suggestions.append({
+            'supervisor': supervisor_index['uuids'][row],
+            'similarity': float(score),
+            'top_paper': top_paper
         })
 
-    similarities.sort(key=lambda x: x['similarity'], reverse=True)
+    return final_suggestions
 
-    if similarities:
-        similarities.sort(key=lambda x: x['similarity'], reverse=True)
-        top_paper = similarities[0]
-        return top_paper
-    return None
+def calculate_batch_suggestions(embeddings, indexes, model=DEFAULT_MODEL, paper_embeddings=None):
+    """
+    Calculates the supervisor suggestions for a batch of embeddings, scoring all of them against
+    the preloaded supervisor index of the model with a single matrix-matrix product, or, with the pgvector backend,
+    sending their queries to the database in one pipeline.
 
-def calculate_topic_suggestions(topics, supervisors_topic_db):
+    Returns a list aligned with embeddings, with a list of suggestions for each embedding,
+    in the same format as calculate_suggestions.
+    """
+    if vector_store is not None:
+        with timed("supervisor_scoring"):
+            return vector_store.match_supervisors_batch(normalize_queries(embeddings), NUM_OF_SUPERVISORS)
+
+    supervisor_index = model_index(indexes, model)
+    with timed("supervisor_scoring"):
+        queries = normalize_queries(embeddings)
+        rows, scores = retrieve_supervisors_batch(queries, supervisor_index, NUM_OF_SUPERVISORS, **retrieval_options())
+
+    paper_queries = queries if paper_embeddings is None else normalize_queries(paper_embeddings)
+    batch_suggestions = []
+    for paper_query, query_rows, query_scores in zip(paper_queries, rows, scores):
+        top_papers = calculate_top_embedding_paper(
+            paper_query, abstract_rows(supervisor_index, query_rows), indexes['abstracts'],
+        )
+        batch_suggestions.append([
+            {
+                'supervisor': supervisor_index['uuids'][row],
+                'similarity': float(score),
+                'top_paper': top_paper
+            }
+            for row, score, top_paper in zip(query_rows, query_scores, top_papers)
+        ])
+
+    return batch_suggestions
+
+def retrieval_options():
+    """
+    Returns the options of the configured supervisor retrieval, no options give the exact scan.
+    """
+    if SUPERVISOR_RETRIEVAL == "ivf":
+        return {'nprobe': IVF_NPROBE}
+    if SUPERVISOR_RETRIEVAL == "prefilter":
+        return {'candidates': PREFILTER_CANDIDATES}
+    if SUPERVISOR_RETRIEVAL == "int8":
+        return {'quantization': "int8"}
+    if SUPERVISOR_RETRIEVAL == "binary":
+        return {'quantization': "binary", 'candidates': BINARY_CANDIDATES}
+    return {}
+
+def abstract_rows(supervisor_index, rows):
+    """
+    Maps rows of a supervisor index to the rows of the abstract index, which follows the default supervisor index.
+    Supervisors of a variant index that are missing from the default index get -1.
     """
-    Calculates suggested supervisors based on the overlap between provided topics and a database of supervisor-topic associations.
+    if 'abstract_rows' not in supervisor_index:
+        return rows
+    return supervisor_index['abstract_rows'][rows]
 
-    Returns a dictionary mapping supervisor UUIDs to their accumulated suggestion scores based on matching topics.
+def calculate_top_embedding_paper(query, rows, abstract_index):
     """
-    suggested_supervisors = {}
+    Calculates the most similar abstract for a normalised SPECTER 2 query embedding for each of the given rows
+    of the abstract index, using the preloaded abstract index. All abstracts of the suggested supervisors are
+    scored in one matrix product, or, if the abstract index has int8 codes, the codes are scored first and only the
+    abstracts that can be the top paper of their supervisor are scored exactly.
 
-    for supervisor_topic in supervisors_topic_db:
-        supervisor_id = supervisor_topic.get('uuid')
-        if not supervisor_id:
+    Returns a list aligned with rows, with a dictionary with the 'uuid' and 'similarity' of the most similar abstract,
+    or None if no valid abstracts are found for that supervisor or its row is -1.
+    """
+    rows = np.asarray(rows)
+    valid = np.flatnonzero(rows >= 0)
+    abstracts = [None] * len(rows)
+    find_top_abstracts = top_abstracts_int8 if 'int8' in abstract_index else top_abstracts
+    with timed("top_paper"):
+        for i, top_abstract in zip(valid, find_top_abstracts(query, abstract_index, rows[valid])):
+            abstracts[i] = top_abstract
+
+    top_papers = []
+    for top_abstract in abstracts:
+        if top_abstract is None:
+            top_papers.append(None)
             continue
 
-        for topic in topics:
-            topic_id = topic.get('topicId')
+        abstract_id, similarity = top_abstract
+        top_papers.append({
+            'uuid': abstract_id,
+            'similarity': similarity,
+        })
+    return top_papers
+
+def get_topic_suggestions(topics, indexes):
+    """
+    Calculates the topic-based supervisor suggestions, each with the supervisor ID, the similarity score
+    and the most relevant paper for the selected topics.
+    The suggestions are cached by the selected topic ids and the version of the indexes.
+    """
+    topic_ids = parse_topic_ids(topics)
+    cached = topic_cache.get(indexes['version'], topic_ids)
+    if cached is not None:
+        return cached
+
+    top_suggestions = calculate_topic_suggestions(topics, indexes['topics'])
+    top_suggestions_with_top_paper = calculate_top_topic_paper(topics, top_suggestions, indexes['topic_papers'])
+    final_suggestions = []
+    for supervisor_id, score, top_paper in top_suggestions_with_top_paper:
+        final_suggestions.append({
+            'supervisor': supervisor_id,
+            'similarity': score,
+            'top_paper': top_paper,
+        })
+    topic_cache.put(indexes['version'], topic_ids, final_suggestions)
+    return final_suggestions
 
-            if supervisor_topic.get('topic_id') == topic_id:
-                supervisor_score = supervisor_topic.get('score', 0)
-                suggested_supervisors[supervisor_id] = suggested_supervisors.get(supervisor_id, 0) + supervisor_score
+def calculate_topic_suggestions(topics, topic_index):
+    """
+    Calculates suggested supervisors based on the overlap between provided topics and the supervisor-topic associations,
+    using the preloaded inverted topic index.
 
-    return suggested_supervisors
+    Returns a list of up to NUM_OF_SUPERVISORS tuples (supervisor UUID, accumulated score), sorted by descending score.
+    """
+    with timed("topic_scoring"):
+        topic_ids = parse_topic_ids(topics)
+        rows, scores = rank_topic_supervisors(topic_ids, topic_index, NUM_OF_SUPERVISORS)
+    return [(topic_index['uuids'][row], float(score)) for row, score in zip(rows, scores)]
 
-def calculate_top_topic_paper(topics, top_suggestions, supervisors):
+def calculate_top_topic_paper(topics, top_suggestions, topic_paper_index):
     """
     Calculates the most relevant paper for each supervisor based on the provided topics.
     """
-
-    topic_ids = {int(topic['topicId']) for topic in topics}
+    with timed("topic_top_paper"):
+        topic_ids = parse_topic_ids(topics)
+        supervisor_ids = [supervisor_id for supervisor_id, _ in top_suggestions]
+        top_papers = top_topic_abstracts(topic_ids, topic_paper_index, supervisor_ids)
 
     top_suggestions_with_papers = []
-
-    for supervisor_id, score in top_suggestions:
-
+    for (supervisor_id, score), top_paper in zip(top_suggestions, top_papers):
         best_paper = {
             'uuid': None,
             'score': -1
         }
-
-        supervisor_abstracts = []
-        for supervisor in supervisors:
-            if supervisor.get('uuid') == supervisor_id:
-                supervisor_abstracts = supervisor.get('abstracts', [])
-                break
-
-        for abstract in supervisor_abstracts:
-            abstract_score = 0
-            for topic_id, topic_score in abstract.get('topics', {}).items():
-                if int(topic_id) in topic_ids:
-                    abstract_score += topic_score
-                
-            if abstract_score > best_paper['score']:
-                best_paper = {
-                    'uuid': abstract.get('uuid'),
-                    'score': abstract_score
-                }
+        if top_paper is not None:
+            best_paper = {
+                'uuid': top_paper[0],
+                'score': top_paper[1]
+            }
         top_suggestions_with_papers.append((supervisor_id, score, best_paper))
     return top_suggestions_with_papers
 
+def count_tokens(sentence, family=PAPER_FAMILY):
+    """
+    Returns the number of tokens the encoder of the given family runs for a sentence: its length after truncation,
+    or, in the "windows" long text mode, the total length of its windows.
+    """
+    tokenizer, _ = encoder_pool.get(family)
+    max_length = ENCODER_FAMILIES[family]['max_length']
+    if LONG_TEXT_MODE != "windows":
+        return len(tokenizer(sentence, max_length=max_length, truncation=True)['input_ids'])
+
+    num_tokens = len(tokenizer(sentence, add_special_tokens=False)['input_ids'])
+    special_tokens = tokenizer.num_special_tokens_to_add(pair=False)
+    size = max_length - special_tokens
+    starts = window_starts(num_tokens, size, ENCODER_WINDOW_OVERLAP, ENCODER_MAX_WINDOWS)
+    return sum(min(size, num_tokens - start) + special_tokens for start in starts)
+
+embedding_batchers = {}
+embedding_batchers_lock = threading.Lock()
+
+def embedding_batcher_for(family):
+    """
+    Returns the micro-batcher of an encoder family, creating it on first use.
+    """
+    with embedding_batchers_lock:
+        if family not in embedding_batchers:
+            embedding_batchers[family] = MicroBatcher(
+                partial(get_embeddings, family=family),
+                partial(count_tokens, family=family),
+                max_wait=MICRO_BATCH_WAIT_MS / 1000,
+                max_batch_size=MICRO_BATCH_SIZE,
+                max_tokens=MICRO_BATCH_MAX_TOKENS,
+            )
+        return embedding_batchers[family]
+
+embedding_batcher = embedding_batcher_for(PAPER_FAMILY)
+
+# Warm-up after startup, in the background so /healthz answers while /readyz reports the worker as not ready
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_LENGTHS = [int(length) for length in os.getenv("WARMUP_LENGTHS", "16,128,512").split(",") if length.strip()]
+
+warmup_state = {'complete': False, 'seconds': None, 'error': None}
+
+def warm_up():
+    """
+    Runs representative dummy requests before the worker reports ready: the SPECTER 2 encoder encodes texts of
+    WARMUP_LENGTHS tokens through the micro-batcher, which initializes the kernels and grows the allocator,
+    the pages of the index arrays are read in, a suggestion is calculated and the topic cache is pre-warmed.
+    The dummy texts bypass the embedding cache.
+    """
+    start = time.perf_counter()
+    try:
+        indexes = index_store.current()
+        touch_indexes(indexes)
+        for length in WARMUP_LENGTHS:
+            embedding = embedding_batcher.submit(" ".join(["warm"] * length))
+            if len(indexes['supervisors']['uuids']):
+                calculate_suggestions(embedding, indexes)
+        prewarm_topic_cache(indexes)
+    except Exception as e:
+        print(f"Error warming up: {e}")
+        warmup_state['error'] = str(e)
+        return
+
+    warmup_state['seconds'] = time.perf_counter() - start
+    warmup_state['complete'] = True
+    print(f"Warm-up completed in {warmup_state['seconds']:.1f} s")
+
+if WARMUP_ENABLED:
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+else:
+    prewarm_topic_cache(index_store.current())
+    warmup_state['complete'] = True
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
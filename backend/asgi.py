@@ -0,0 +1,166 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend import app as server
+from backend.matching.metrics import collect_profile, count_request, profile_milliseconds, timed
+
+"""
+Async serving mode for the supervisor suggestion system.
+The /api and /api/batch endpoints run on the event loop, so request parsing, the topic path and the ranking math
+never wait for the encoder. Only model inference is offloaded to a bounded thread pool with its own concurrency
+limit, and requests are answered with HTTP 503 when the inference queue is full. With VECTOR_BACKEND=pgvector,
+the supervisor search is a database round trip, which is offloaded to the default thread pool as well.
+All other endpoints are served by the Flask application.
+
+Run with: cd backend -> uvicorn asgi:application
+"""
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "4"))
+INFERENCE_QUEUE_LIMIT = int(os.getenv("INFERENCE_QUEUE_LIMIT", "32"))
+
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+inference_pending = 0 # Only changed on the event loop, so it needs no lock
+
+class InferenceQueueFull(Exception):
+    pass
+
+async def run_inference(function, *args):
+    """
+    Runs an inference function in the inference thread pool, in a copy of the current context
+    so its stage timings count towards the profile of the request.
+    Raises InferenceQueueFull if INFERENCE_QUEUE_LIMIT calls are already running or waiting.
+    """
+    global inference_pending
+    if inference_pending >= INFERENCE_QUEUE_LIMIT:
+        raise InferenceQueueFull()
+
+    inference_pending += 1
+    call = functools.partial(contextvars.copy_context().run, function, *args)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(inference_executor, call)
+    finally:
+        inference_pending -= 1
+
+async def run_supervisor_search(function, *args):
+    """
+    Runs a supervisor search function on the event loop, or, with the pgvector backend, whose database round trips
+    would block the event loop, in the default thread pool, in a copy of the current context.
+    """
+    if server.vector_store is None:
+        return function(*args)
+
+    call = functools.partial(contextvars.copy_context().run, function, *args)
+    return await asyncio.get_running_loop().run_in_executor(None, call)
+
+def queue_full_response(project_type):
+    count_request(project_type, error=True)
+    return JSONResponse(
+        {'error': 'The server is busy encoding other proposals, please try again shortly'},
+        status_code=503,
+        headers={'Retry-After': '1'},
+    )
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def metered_response(project_type, payload, status=200, profile=None):
+    """
+    Returns the JSON response of a matching request, counting the request and timing the serialization,
+    in the same format as the Flask application.
+    """
+    count_request(project_type, error=status >= 400)
+    with timed("serialization"):
+        body = json.dumps(payload)
+
+    if profile is not None and status < 400:
+        body = f'{{"suggestions": {body}, "profile": {json.dumps(profile_milliseconds(profile))}}}'
+    return Response(body, status_code=status, media_type="application/json")
+
+async def api(request):
+    """
+    Async version of the /api endpoint, with the same request and response format.
+    """
+    data = await read_json(request)
+    project_type = data.get('projectType')
+    with collect_profile(request.query_params.get('profile') == '1') as profile:
+        try:
+            return await suggest(data, project_type, profile)
+        except Exception:
+            count_request(project_type, error=True)
+            raise
+
+async def suggest(data, project_type, profile):
+    indexes = server.index_store.current()
+    if project_type == "specific":
+        text = data.get('text')
+        if not text or not len(indexes['supervisors']['uuids']):
+            return metered_response(project_type, {'error': 'Invalid input data'}, 400)
+
+        model = server.request_model(data)
+        if model is None:
+            return metered_response(project_type, {'error': 'Invalid model'}, 400)
+
+        try:
+            embedding, paper_embedding = await run_inference(server.get_model_embeddings, str(text), model)
+        except InferenceQueueFull:
+            return queue_full_response(project_type)
+
+        suggestions = await run_supervisor_search(server.calculate_suggestions, embedding, indexes, model, paper_embedding)
+        return metered_response(project_type, suggestions, profile=profile)
+
+    elif project_type == "general":
+        topics = data.get('topics')
+        if not topics:
+            return metered_response(project_type, {'error': 'Invalid input data'}, 400)
+
+        return metered_response(project_type, server.get_topic_suggestions(topics, indexes), profile=profile)
+
+    else:
+        return metered_response(project_type, {'error': 'Invalid project type'}, 400)
+
+async def api_batch(request):
+    """
+    Async version of the /api/batch endpoint, with the same request and response format.
+    """
+    data = await read_json(request)
+    items = data.get('items')
+    if not isinstance(items, list) or not items or len(items) > server.MAX_BATCH_ITEMS:
+        return metered_response("batch", {'error': 'Invalid input data'}, 400)
+
+    with collect_profile(request.query_params.get('profile') == '1') as profile:
+        try:
+            indexes = server.index_store.current()
+            results, specific_items = server.prepare_batch(items, indexes)
+
+            if specific_items:
+                try:
+                    embeddings, paper_embeddings = await run_inference(server.get_batch_embeddings, specific_items)
+                except InferenceQueueFull:
+                    return queue_full_response("batch")
+                await run_supervisor_search(
+                    server.fill_batch_results, results, specific_items, embeddings, paper_embeddings, indexes,
+                )
+        except Exception:
+            count_request("batch", error=True)
+            raise
+        return metered_response("batch", results, profile=profile)
+
+application = Starlette(routes=[
+    Route('/api', api, methods=['POST']),
+    Route('/api/batch', api_batch, methods=['POST']),
+    Mount('/', app=WSGIMiddleware(server.app)),
+])
@@ -0,0 +1,27 @@
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.matching.database import LocalClient
+from backend.matching.fixtures import synthetic_fixtures, write_fixtures
+
+"""
+Creates a local database with synthetic supervisors, topics and supervisor-topic relations.
+Run the server, export_snapshot.py or the benchmarks with DATABASE_BACKEND=local on the created database
+to use them without the network: python backend/create_fixtures.py [num_supervisors] [num_topics]
+The database is written to LOCAL_DATABASE_PATH, and its contents are replaced.
+"""
+
+load_dotenv(".env.local")
+
+path = os.getenv("LOCAL_DATABASE_PATH", "local.db")
+num_supervisors = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+num_topics = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+seed = int(os.getenv("FIXTURE_SEED", "0"))
+
+supervisors, topics, supervisor_topics = synthetic_fixtures(num_supervisors, num_topics, seed)
+write_fixtures(LocalClient(path), supervisors, topics, supervisor_topics)
+
+print(f"Wrote {len(supervisors)} supervisors, {len(topics)} topics and "
+      f"{len(supervisor_topics)} supervisor-topic relations to {path}")
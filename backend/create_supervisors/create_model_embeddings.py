@@ -1,21 +1,93 @@
+import os
+import sys
+import numpy as np
 from transformers import BertTokenizer, BertModel
-import torch
 from transformers import AutoTokenizer, AutoModel
 from adapters import AutoAdapterModel
 from tqdm import tqdm
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.matching.encoder import encode_batch
+
 """
 This module provides functions to compute embeddings for supervisors using various models.
 It includes functions for ModernBERT, BERT, SciBERT, and SPECTER2 models.
 SPECTER 2 is also responsible for assigning embeddings to each abstract, enabling the top paper calculation, for each supervisor.
 Note that ModernBERT handles both concatenated and averaged embeddings, and therefore is slower.
+The abstract texts and keyword strings of all supervisors are collected and encoded together: they are sorted by
+token length and run in batches padded to their longest text under a token budget, and the mean-pooled vectors
+are scattered back to the supervisors.
 """
 
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64")) # Maximum number of texts in one forward pass
+EMBEDDING_MAX_TOKENS = int(os.getenv("EMBEDDING_MAX_TOKENS", "32768")) # Maximum padded tokens in one forward pass
+CHUNK_SIZE = 2048 # Texts tokenized and bucketed at a time, the unit of the progress bar
+
 def average_pooling(embeddings):
     """
-    Computes the average of a list of embedding tensors.
+    Computes the average of a list of embedding vectors.
+    """
+    return np.mean(np.stack(embeddings), axis=0)
+
+def collect_texts(supervisors, concatenated=False):
+    """
+    Collects the abstract texts and keyword strings of all supervisors, and, if concatenated is set,
+    their concatenated abstract texts without and with the keywords, into one list of texts.
+
+    Returns a tuple (texts, slots), with a dictionary per supervisor with its 'abstracts' with a text,
+    the (start, stop) positions of their texts under 'abstract_rows', and the positions of its 'keywords',
+    'concatenated' and 'concatenated_with_keywords' texts (None if not collected).
+    """
+    texts = []
+    slots = []
+    for supervisor in supervisors:
+        abstracts = [abstract for abstract in supervisor.get('abstracts') or [] if abstract and abstract.get('text')]
+        slot = {'abstracts': abstracts, 'abstract_rows': (len(texts), len(texts) + len(abstracts))}
+        texts.extend(abstract['text'] for abstract in abstracts)
+
+        keywords = " ".join(supervisor.get("keywords") or [])
+        # The keyword embedding is only used in the averages, which are empty without abstracts
+        slot['keywords'] = len(texts) if abstracts else None
+        if abstracts:
+            texts.append(keywords)
+
+        slot['concatenated'] = slot['concatenated_with_keywords'] = None
+        if concatenated:
+            concat_text = "".join(abstract['text'] + " " for abstract in abstracts)
+            slot['concatenated'] = len(texts)
+            slot['concatenated_with_keywords'] = len(texts) + 1
+            texts.extend([concat_text, concat_text + " " + keywords])
+        slots.append(slot)
+    return texts, slots
+
+def encode_texts(tokenizer, model, texts, max_length, desc):
+    """
+    Encodes texts truncated to max_length tokens in length-bucketed batches padded to their longest text,
+    with at most EMBEDDING_BATCH_SIZE texts and EMBEDDING_MAX_TOKENS padded tokens per forward pass.
+
+    Returns a float32 np.ndarray with the mean-pooled embedding of each text, aligned with texts.
+    """
+    chunks = [texts[i:i + CHUNK_SIZE] for i in range(0, len(texts), CHUNK_SIZE)]
+    embeddings = [
+        encode_batch(tokenizer, model, chunk, max_length, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_TOKENS)
+        for chunk in tqdm(chunks, desc=f"{desc} ({len(texts)} texts)")
+    ]
+    return np.concatenate(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+
+def averaged_embeddings(embeddings, slot):
+    """
+    Returns the averaged embeddings of a supervisor without and with its keywords, as lists, or empty lists
+    if the supervisor has no abstract texts.
     """
-    return torch.mean(torch.stack(embeddings), dim=0)
+    start, stop = slot['abstract_rows']
+    if start == stop:
+        return [], []
+
+    abstract_embeddings = list(embeddings[start:stop])
+    return (
+        average_pooling(abstract_embeddings).tolist(),
+        average_pooling(abstract_embeddings + [embeddings[slot['keywords']]]).tolist(),
+    )
 
 modernbert_model_id = "answerdotai/ModernBERT-base"
 modernbert_tokenizer = AutoTokenizer.from_pretrained(modernbert_model_id)
@@ -28,48 +100,15 @@ def get_modernbert_embeddings(supervisors):
     Creates both concatenated and averaged embeddings, with and without keywords,
     for each supervisor's abstracts. Updates supervisor records in-place.
     """
-    def embed(text):
-        inputs = modernbert_tokenizer(text, max_length=8192, truncation=True, return_tensors="pt")
-        with torch.no_grad():
-            outputs = modernbert_model(**inputs)
-
-        # Mean pooling for the entire text
-        mask = inputs["attention_mask"].unsqueeze(-1)
-        token_embeddings = outputs.last_hidden_state
-        summed = (token_embeddings * mask).sum(dim=1)
-        counts = mask.sum(dim=1)
-        mean_pooled = summed / counts
-
-        return mean_pooled.squeeze().detach() 
-    
-    for supervisor in tqdm(supervisors, desc="ModernBERT"):
-        embeddings = []
-        abstracts = supervisor.get('abstracts') or []
-        concat_text = ""
-
-        for abstract in abstracts:
-            if not abstract:
-                continue
-            text = abstract.get('text', '')
-            if not text:
-                continue
-            concat_text += text + " "
-            embedding = embed(text)
-            embeddings.append(embedding)
-
-        concat_embedding = embed(concat_text)
-
-        supervisor['modernbert_concatenated_embedding'] = concat_embedding.tolist()
-        supervisor['modernbert_averaged_embedding'] = average_pooling(embeddings).tolist() if embeddings else []
-
-        keywords = " ".join(supervisor.get("keywords") or [])
-        embeddings_keywords = embed(keywords)
-
-        concat_text_with_keywords = concat_text + " " + keywords
-        concat_embeddings_with_keywords = embed(concat_text_with_keywords)
-
-        supervisor['modernbert_concatenated_embedding_with_keywords'] = concat_embeddings_with_keywords.tolist()
-        supervisor['modernbert_averaged_embedding_with_keywords'] = average_pooling(embeddings + [embeddings_keywords]).tolist() if embeddings else []
+    texts, slots = collect_texts(supervisors, concatenated=True)
+    embeddings = encode_texts(modernbert_tokenizer, modernbert_model, texts, 8192, "ModernBERT")
+
+    for supervisor, slot in zip(supervisors, slots):
+        averaged, averaged_with_keywords = averaged_embeddings(embeddings, slot)
+        supervisor['modernbert_concatenated_embedding'] = embeddings[slot['concatenated']].tolist()
+        supervisor['modernbert_averaged_embedding'] = averaged
+        supervisor['modernbert_concatenated_embedding_with_keywords'] = embeddings[slot['concatenated_with_keywords']].tolist()
+        supervisor['modernbert_averaged_embedding_with_keywords'] = averaged_with_keywords
     
     return supervisors
 
@@ -78,43 +117,13 @@ bert_tokenizer = BertTokenizer.from_pretrained(bert_model_id)
 bert_model = BertModel.from_pretrained(bert_model_id)
 
 def get_bert_embeddings(supervisors):
+    texts, slots = collect_texts(supervisors)
+    embeddings = encode_texts(bert_tokenizer, bert_model, texts, 512, "BERT")
 
-    def embed(text):
-        inputs = bert_tokenizer(
-            text, 
-            max_length=512, 
-            padding="max_length", 
-            truncation=True, 
-            return_tensors="pt"
-        )
-        with torch.no_grad():
-            outputs = bert_model(**inputs)
-
-        # Mean pooling for the entire text
-        mask = inputs["attention_mask"].unsqueeze(-1)
-        token_embeddings = outputs.last_hidden_state
-        summed = (token_embeddings * mask).sum(dim=1)
-        counts = mask.sum(dim=1)
-        mean_pooled = summed / counts 
-        return mean_pooled.squeeze().detach() 
-
-    for supervisor in tqdm(supervisors, desc="BERT"):
-        embeddings = []
-        abstracts = supervisor.get('abstracts') or []
-        for abstract in abstracts:
-            if not abstract:
-                continue
-            text = abstract.get('text', '')
-            if not text:
-                continue
-            embedding = embed(text)
-            embeddings.append(embedding)
-
-        supervisor['bert_averaged_embedding'] = average_pooling(embeddings).tolist() if embeddings else []
-
-        keywords = " ".join(supervisor.get("keywords") or [])
-        embeddings_keywords = embed(keywords)
-        supervisor['bert_averaged_embedding_with_keywords'] = average_pooling(embeddings + [embeddings_keywords]).tolist() if embeddings else []
+    for supervisor, slot in zip(supervisors, slots):
+        averaged, averaged_with_keywords = averaged_embeddings(embeddings, slot)
+        supervisor['bert_averaged_embedding'] = averaged
+        supervisor['bert_averaged_embedding_with_keywords'] = averaged_with_keywords
 
     return supervisors
 
@@ -123,43 +132,13 @@ scibert_tokenizer = BertTokenizer.from_pretrained(scibert_model_id)
 scibert_model = BertModel.from_pretrained(scibert_model_id)
 
 def get_scibert_embeddings(supervisors):
-    def embed(text):
-        inputs = scibert_tokenizer(
-            text, 
-            max_length=512, 
-            padding='max_length', 
-            truncation=True, 
-            return_tensors="pt"
-        )
-        with torch.no_grad():
-            outputs = scibert_model(**inputs)
-
-        # Mean pooling for the entire text
-        mask = inputs["attention_mask"].unsqueeze(-1)
-        token_embeddings = outputs.last_hidden_state
-        summed = (token_embeddings * mask).sum(dim=1)
-        counts = mask.sum(dim=1)
-        mean_pooled = summed / counts 
-        return mean_pooled.squeeze().detach() 
-
-    for supervisor in tqdm(supervisors, desc="SciBERT"):
-        embeddings = []
-        abstracts = supervisor.get('abstracts') or []
-
-        for abstract in abstracts:
-            if not abstract:
-                continue
-            text = abstract.get('text', '')
-            if not text:
-                continue
-            embedding = embed(text)
-            embeddings.append(embedding)
-
-        supervisor['scibert_averaged_embedding'] = average_pooling(embeddings).tolist() if embeddings else []
+    texts, slots = collect_texts(supervisors)
+    embeddings = encode_texts(scibert_tokenizer, scibert_model, texts, 512, "SciBERT")
 
-        keywords = " ".join(supervisor.get("keywords") or [])
-        embeddings_keywords = embed(keywords)
-        supervisor['scibert_averaged_embedding_with_keywords'] = average_pooling(embeddings + [embeddings_keywords]).tolist() if embeddings else []
+    for supervisor, slot in zip(supervisors, slots):
+        averaged, averaged_with_keywords = averaged_embeddings(embeddings, slot)
+        supervisor['scibert_averaged_embedding'] = averaged
+        supervisor['scibert_averaged_embedding_with_keywords'] = averaged_with_keywords
 
     return supervisors
 
@@ -169,44 +148,16 @@ specter_model = AutoAdapterModel.from_pretrained('allenai/specter2_base')
 specter_model.load_adapter("allenai/specter2", source="hf", load_as="specter2", set_active=True)
 
 def get_specter2_embeddings(supervisors):
-    def embed(text):
-        inputs = specter_tokenizer(
-            text,
-            truncation=True,
-            max_length=512,
-            padding='max_length',
-            return_tensors="pt"
-        )
-
-        with torch.no_grad():
-            outputs = specter_model(**inputs)
-
-        mask = inputs["attention_mask"].unsqueeze(-1)
-        token_embeddings = outputs.last_hidden_state
-        summed = (token_embeddings * mask).sum(dim=1)
-        counts = mask.sum(dim=1)
-        mean_pooled = summed / counts 
-        return mean_pooled.squeeze().detach() 
-
-    for supervisor in tqdm(supervisors, desc="SPECTER 2"):
-        embeddings = []
-        abstracts = supervisor.get('abstracts') or []
-
-        for abstract in abstracts:
-            if not abstract:
-                continue
-            text = abstract.get("text", "")
-            if not text:
-                continue
-            embedding = embed(text)
-            embeddings.append(embedding)
-
-            abstract['embedding'] = embedding.tolist() if embedding is not None else []
-
-        supervisor['specter2_averaged_embedding'] = average_pooling(embeddings).tolist() if embeddings else []
+    texts, slots = collect_texts(supervisors)
+    embeddings = encode_texts(specter_tokenizer, specter_model, texts, 512, "SPECTER 2")
 
-        keywords = " ".join(supervisor.get("keywords") or [])
-        embeddings_keywords = embed(keywords)
-        supervisor['specter2_averaged_embedding_with_keywords'] = average_pooling(embeddings + [embeddings_keywords]).tolist() if embeddings else []
+    for supervisor, slot in zip(supervisors, slots):
+        start, _ = slot['abstract_rows']
+        for row, abstract in enumerate(slot['abstracts'], start):
+            abstract['embedding'] = embeddings[row].tolist()
+
+        averaged, averaged_with_keywords = averaged_embeddings(embeddings, slot)
+        supervisor['specter2_averaged_embedding'] = averaged
+        supervisor['specter2_averaged_embedding_with_keywords'] = averaged_with_keywords
 
-    return supervisors
\ No newline at end of file
+    return supervisors
@@ -0,0 +1,25 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.matching.index import EMBEDDING_COLUMN, build_supervisor_index
+from backend.matching.retrieval import fit_projection, save_projection
+
+"""
+Fits the projection used by the "prefilter" supervisor retrieval of the matching API.
+The projection is fitted on the normalised supervisor embeddings that the API serves by default, and saved to a file
+next to the other artifacts of the pipeline. The API loads it to build the reduced copy of the supervisor matrix.
+"""
+
+def create_projection(supervisors, path, dim=128, method="pca"):
+    """
+    Fits a projection of the supervisors' embeddings to dim dimensions and saves it to path.
+    """
+    supervisor_index = build_supervisor_index(supervisors, EMBEDDING_COLUMN)
+    if supervisor_index['matrix'].shape[0] == 0:
+        print("No supervisor embeddings to fit the projection on")
+        return
+
+    projection = fit_projection(supervisor_index['matrix'], dim, method)
+    save_projection(path, projection, EMBEDDING_COLUMN)
+    print(f"Saved the {method} projection to {projection['components'].shape[0]} dimensions to {path}")
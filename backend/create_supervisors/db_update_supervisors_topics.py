@@ -1,14 +1,16 @@
 from backend.create_supervisors.utils import valid_supervisor_topic
+from backend.matching.embedding_codec import encode_supervisor_embeddings
 
-def db_update_supervisors_topics(supabase, supervisors, topics, supervisor_topics):
+def db_update_supervisors_topics(supabase, supervisors, topics, supervisor_topics, embedding_dtype="float32"):
     """
     Update the supervisors, topics and the supervisor_topic relations in the database.
+    The embeddings are stored in the binary embedding encoding with the given dtype ("float32" or "float16").
     """
     # Updating the DB
     batch_size = 5 # We're upserting in batches to avoid size limitations
 
     for i in range(0, len(supervisors), batch_size):
-        batch = supervisors[i:i+batch_size]
+        batch = [encode_supervisor_embeddings(supervisor, embedding_dtype) for supervisor in supervisors[i:i+batch_size]]
         batch_num = (i // batch_size) + 1
         
         try:
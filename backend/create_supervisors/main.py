@@ -2,7 +2,6 @@ import sys
 from tqdm import tqdm
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 from backend.create_supervisors.create_model_embeddings import get_bert_embeddings, get_modernbert_embeddings, get_scibert_embeddings, get_specter2_embeddings
@@ -10,6 +9,8 @@ from backend.create_supervisors.topic_modeling import topic_modelling
 from backend.create_supervisors.get_supervisors import get_supervisors
 from backend.create_supervisors.utils import extract_email, extract_keywords
 from backend.create_supervisors.db_update_supervisors_topics import db_update_supervisors_topics
+from backend.create_supervisors.create_projection import create_projection
+from backend.matching.database import create_database_client
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
@@ -17,16 +18,14 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 The main script to create and update supervisors in the database.
 This script fetches supervisors from the PURE API, processes their data to extract keywords and abstracts, 
 creates topics using topic modeling, generates embeddings for each supervisor using various models,
+fits the projection used by the prefilter retrieval of the API,
 and updates the database with their embeddings and topics.
 """
 
 # PURE setup
 load_dotenv("backend/.env.local")
 
-url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-key = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
-
-supabase: Client = create_client(url, key)
+supabase = create_database_client() # Supabase, or the local database with DATABASE_BACKEND=local
 
 researchers, all_researchers = get_supervisors()
 
@@ -70,11 +69,15 @@ models = {
 for model_name, model_function in tqdm(models.items(), desc="Adding embeddings"):
     supervisor_updates = model_function(supervisor_updates)
 
+create_projection(supervisor_updates, "backend/projection.npz")
+
 for supervisor in supervisor_updates:
     supervisor.pop("keywords", None)
     for abstract in supervisor.get("abstracts", []):
         abstract.pop("text", None)
 
-db_update_supervisors_topics(supabase, supervisor_updates, unique_topics, supervisor_topics)
+db_update_supervisors_topics(
+    supabase, supervisor_updates, unique_topics, supervisor_topics, os.getenv("EMBEDDING_STORAGE_DTYPE", "float32"),
+)
 
 print("Update completed")
\ No newline at end of file
@@ -0,0 +1,40 @@
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.matching.database import create_database_client
+from backend.matching.loader import fetch_indexes
+from backend.matching.quantization import QUANTIZATION_METHODS, add_quantized_index
+from backend.matching.retrieval import add_ivf_index, add_prefilter_index, load_projection
+from backend.matching.snapshot import save_snapshot
+from backend.matching.variants import DEFAULT_MODEL, parse_served_models
+
+"""
+Exports the matching indexes to a binary snapshot.
+This script fetches the supervisors and supervisor-topic relations from the database once, builds the indexes
+used by the matching API and writes them to INDEX_SNAPSHOT_PATH, so the server can start without the network.
+Run it after the supervisors have been updated with create_supervisors/main.py.
+The supervisor matrices of all SERVED_MODELS are included.
+With SUPERVISOR_RETRIEVAL=ivf, prefilter, int8 or binary, the index of the approximate retrieval is stored in the snapshot as well.
+"""
+
+load_dotenv(".env.local")
+
+snapshot_path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("INDEX_SNAPSHOT_PATH", "snapshot")
+
+supabase = create_database_client()
+
+indexes = fetch_indexes(supabase, parse_served_models(os.getenv("SERVED_MODELS", DEFAULT_MODEL)))
+retrieval = os.getenv("SUPERVISOR_RETRIEVAL", "exact")
+if retrieval == "ivf":
+    indexes = add_ivf_index(indexes, int(os.getenv("IVF_LISTS", "0")) or None)
+elif retrieval == "prefilter":
+    projection = load_projection(os.getenv("PROJECTION_PATH", "projection.npz"))
+    indexes = add_prefilter_index(indexes, projection, int(os.getenv("PREFILTER_DIM", "128")))
+elif retrieval in QUANTIZATION_METHODS:
+    indexes = add_quantized_index(indexes, retrieval)
+save_snapshot(snapshot_path, indexes)
+
+print(f"Exported {len(indexes['supervisors']['uuids'])} supervisors and "
+      f"{len(indexes['abstracts']['uuids'])} abstracts to {snapshot_path}")
@@ -0,0 +1,110 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from backend.matching.metrics import active_profiles, attach_profiles
+
+"""
+Dynamic micro-batching of concurrent embedding requests.
+Requests that arrive within a short window are collected by a single worker thread, up to a maximum
+batch size and padded token budget, and encoded together in one padded batch. Each caller blocks until
+its own pooled vector is ready, so the batching is invisible to the request handlers.
+The stage timings of a batch are added to the profiles of all requests in it.
+"""
+
+class MicroBatcher:
+    """
+    Collects texts submitted from concurrent request threads and encodes them in batches.
+
+    Parameters:
+        encode: Function that takes a list of texts and returns their embeddings, aligned with the texts.
+        count_tokens: Function that returns the number of tokens of a text.
+        max_wait: Seconds to wait for more requests after the first request of a batch arrives.
+        max_batch_size: Maximum number of texts in one batch.
+        max_tokens: Maximum padded tokens (texts x longest text) in one batch.
+    """
+
+    def __init__(self, encode, count_tokens, max_wait=0.005, max_batch_size=16, max_tokens=8192):
+        self._encode = encode
+        self._count_tokens = count_tokens
+        self._max_wait = max_wait
+        self._max_batch_size = max_batch_size
+        self._max_tokens = max_tokens
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._max_observed_batch_size = 0
+        self._batch_sizes = {}
+
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        """
+        Queues a text for encoding and blocks until its embedding is ready.
+        """
+        future = Future()
+        self._queue.put((text, self._count_tokens(text), future, active_profiles()))
+        return future.result()
+
+    def stats(self):
+        """
+        Returns the queue depth and batch size statistics of the batcher.
+        """
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'requests': self._requests,
+                'batches': self._batches,
+                'mean_batch_size': self._requests / self._batches if self._batches else 0.0,
+                'max_batch_size': self._max_observed_batch_size,
+                'batch_sizes': dict(sorted(self._batch_sizes.items())),
+            }
+
+    def _run(self):
+        carried = None
+
+        while True:
+            first = carried or self._queue.get()
+            carried = None
+            batch = [first]
+            longest = max(first[1], 1)
+            deadline = time.monotonic() + self._max_wait
+
+            while len(batch) < self._max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                # Requests that would exceed the token budget start the next batch
+                if (len(batch) + 1) * max(longest, item[1]) > self._max_tokens:
+                    carried = item
+                    break
+
+                batch.append(item)
+                longest = max(longest, item[1])
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        try:
+            with attach_profiles(profile for *_, profiles in batch for profile in profiles):
+                embeddings = self._encode([text for text, *_ in batch])
+        except Exception as e:
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for (_, _, future, _), embedding in zip(batch, embeddings):
+            future.set_result(embedding)
+
+        with self._lock:
+            self._requests += len(batch)
+            self._batches += 1
+            self._max_observed_batch_size = max(self._max_observed_batch_size, len(batch))
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
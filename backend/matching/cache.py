@@ -0,0 +1,214 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+"""
+Caching of query embeddings and topic suggestions.
+Students often resubmit the same or a slightly edited proposal, so pooled query embeddings are cached
+in a bounded in-memory LRU cache keyed by a hash of the whitespace-normalised text, which is also lowercased
+for the uncased encoders, whose tokenizers lowercase the text anyway.
+An optional SQLite file can be shared between worker processes, so they reuse each other's entries.
+The topic suggestions only depend on the selected topics and the loaded indexes, and students choose from a small
+fixed topic list, so they are cached by the sorted topic ids and the index version.
+"""
+
+def normalize_text(text, uncased=False):
+    """
+    Normalises a text for cache lookups by collapsing all whitespace, and lowercasing it if uncased.
+    """
+    text = str(text).lower() if uncased else str(text)
+    return " ".join(text.split())
+
+def text_key(text, namespace="", uncased=False):
+    """
+    Returns the cache key of a text, a SHA-256 hash of the namespace and the normalised text.
+    """
+    return hashlib.sha256(f"{namespace}\n{normalize_text(text, uncased)}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings with a time-to-live.
+
+    Parameters:
+        max_size: Maximum number of entries kept in memory. 0 disables the cache.
+        ttl: Seconds an entry stays valid.
+        path: Optional path of a SQLite file used as a shared on-disk backend.
+    """
+
+    def __init__(self, max_size=1024, ttl=3600, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._disk_hits = 0
+
+        self._db = None
+        if path and max_size > 0:
+            self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache "
+                "(key TEXT PRIMARY KEY, created REAL NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, text, namespace="", uncased=False):
+        """
+        Returns the cached embedding of a text, or None if it is missing or expired.
+        With uncased, texts that only differ in case share an entry.
+        """
+        if self.max_size <= 0:
+            return None
+
+        key = text_key(text, namespace, uncased)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, vector = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return vector
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, vector FROM embedding_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[0] <= self.ttl:
+                    vector = np.frombuffer(row[1], dtype=np.float32)
+                    self._store(key, row[0], vector)
+                    self._hits += 1
+                    self._disk_hits += 1
+                    return vector
+
+            self._misses += 1
+            return None
+
+    def put(self, text, embedding, namespace="", uncased=False):
+        """
+        Stores the embedding of a text in the cache, and in the shared on-disk backend if configured.
+        """
+        if self.max_size <= 0:
+            return
+
+        key = text_key(text, namespace, uncased)
+        created = time.time()
+        vector = np.array(embedding, dtype=np.float32).reshape(-1)
+        vector.setflags(write=False)
+
+        with self._lock:
+            self._store(key, created, vector)
+
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embedding_cache (key, created, dim, vector) VALUES (?, ?, ?, ?)",
+                        (key, created, vector.shape[0], vector.tobytes()),
+                    )
+                    self._db.execute("DELETE FROM embedding_cache WHERE created < ?", (created - self.ttl,))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"Error writing embedding cache: {e}")
+
+    def stats(self):
+        """
+        Returns the size and hit/miss counters of the cache.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+            }
+
+    def _store(self, key, created, vector):
+        self._entries[key] = (created, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+class TopicResultCache:
+    """
+    Bounded LRU cache of topic suggestions, keyed by the index version and the sorted topic ids.
+    Entries of older index versions are dropped as soon as a newer version is seen, so a reload invalidates the cache.
+
+    Parameters:
+        max_size: Maximum number of entries. 0 disables the cache.
+    """
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, version, topic_ids):
+        """
+        Returns the cached suggestions for the topic ids at the given index version, or None if they are missing.
+        """
+        if self.max_size <= 0:
+            return None
+
+        key = tuple(sorted(topic_ids))
+        with self._lock:
+            self._set_version(version)
+            result = self._entries.get(key) if version == self._version else None
+            if result is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return result
+
+    def put(self, version, topic_ids, result):
+        """
+        Stores the suggestions for the topic ids at the given index version.
+        Results of an index version older than the cached one are not stored.
+        """
+        if self.max_size <= 0:
+            return
+
+        key = tuple(sorted(topic_ids))
+        with self._lock:
+            self._set_version(version)
+            if version != self._version:
+                return
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """
+        Returns the size, the index version and the hit/miss counters of the cache.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'version': self._version,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+            }
+
+    def _set_version(self, version):
+        if self._version is None or version > self._version:
+            self._entries.clear()
+            self._version = version
@@ -0,0 +1,207 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+
+"""
+Database clients of the server and the create_supervisors pipeline.
+DATABASE_BACKEND selects Supabase (the default) or a local SQLite stand-in at LOCAL_DATABASE_PATH,
+which serves the supervisor, topic and supervisor_topic tables from a single file, so startup, ingestion and
+the query paths can be run and benchmarked deterministically without the network.
+The local client supports the query builder operations the code uses: select (with an exact count), eq, neq, order,
+range, insert, upsert and delete, with execute returning a response with the rows under 'data'. Rows are stored as JSON, and upserts
+only update the given columns, like Supabase.
+Fill a local database with synthetic supervisors with create_fixtures.py.
+"""
+
+DATABASE_BACKENDS = ("supabase", "local")
+
+# Primary key columns of the tables, used by upsert
+TABLE_KEYS = {
+    'supervisor': ("uuid",),
+    'topic': ("topic_id",),
+    'supervisor_topic': ("uuid", "topic_id"),
+}
+
+# Column defaults of the database schema that the code relies on
+TABLE_DEFAULTS = {
+    'supervisor': {'available': True},
+}
+
+COLUMN_PATTERN = re.compile(r"^\w+$")
+
+def create_database_client():
+    """
+    Returns the database client selected by DATABASE_BACKEND: a Supabase client with the NEXT_PUBLIC_SUPABASE_URL
+    and NEXT_PUBLIC_SUPABASE_ANON_KEY credentials, or a LocalClient on LOCAL_DATABASE_PATH.
+    """
+    backend = os.getenv("DATABASE_BACKEND", "supabase")
+    if backend == "local":
+        return LocalClient(os.getenv("LOCAL_DATABASE_PATH", "local.db"))
+    if backend == "supabase":
+        from supabase import create_client
+
+        return create_client(os.getenv("NEXT_PUBLIC_SUPABASE_URL"), os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY"))
+    raise ValueError(f"Unknown DATABASE_BACKEND: {backend}")
+
+def json_path(column):
+    """
+    Returns the SQLite JSON path of a column, rejecting names that are not plain identifiers.
+    """
+    if not COLUMN_PATTERN.match(column):
+        raise ValueError(f"Invalid column: {column}")
+    return f'$."{column}"'
+
+class LocalResponse:
+    """
+    Response of a local query, with the rows under 'data' and the exact count of a select under 'count',
+    like a Supabase response.
+    """
+
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class LocalQuery:
+    """
+    Query builder of a table of a LocalClient, with the subset of the Supabase query builder used by the code.
+    """
+
+    def __init__(self, client, table):
+        if table not in TABLE_KEYS:
+            raise ValueError(f"Unknown table: {table}")
+        self._client = client
+        self._table = table
+        self._operation = "select"
+        self._columns = None
+        self._rows = None
+        self._filters = []
+        self._order = []
+        self._range = None
+        self._count = None
+
+    def select(self, *columns, count=None):
+        self._operation = "select"
+        self._columns = None if not columns or "*" in columns else [column.strip() for column in columns]
+        self._count = count
+        return self
+
+    def insert(self, rows):
+        self._operation = "insert"
+        self._rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows):
+        self._operation = "upsert"
+        self._rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def delete(self):
+        self._operation = "delete"
+        return self
+
+    def eq(self, column, value):
+        self._filters.append((column, "=", value))
+        return self
+
+    def neq(self, column, value):
+        self._filters.append((column, "!=", value))
+        return self
+
+    def order(self, column, desc=False):
+        self._order.append((column, desc))
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def execute(self):
+        return self._client._execute(self)
+
+class LocalClient:
+    """
+    SQLite stand-in for the Supabase client.
+    Each table is stored as rows of JSON objects, with the JSON-encoded primary key in a unique 'key' column.
+
+    Parameters:
+        path: Path of the SQLite file, created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        for table in TABLE_KEYS:
+            self._db.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" '
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE, data TEXT NOT NULL)"
+            )
+        self._db.commit()
+
+    def table(self, name):
+        return LocalQuery(self, name)
+
+    def _execute(self, query):
+        where, parameters = self._where(query._filters)
+        with self._lock:
+            if query._operation == "select":
+                count = None
+                if query._count is not None:
+                    count = self._db.execute(f'SELECT COUNT(*) FROM "{query._table}"{where}', parameters).fetchone()[0]
+
+                order = "".join(f"json_extract(data, ?){' DESC' if desc else ''}, " for _, desc in query._order)
+                sql = f'SELECT data FROM "{query._table}"{where} ORDER BY {order}id'
+                parameters = parameters + [json_path(column) for column, _ in query._order]
+                if query._range is not None:
+                    start, end = query._range
+                    sql += " LIMIT ? OFFSET ?"
+                    parameters += [max(end - start + 1, 0), start]
+                rows = [json.loads(data) for data, in self._db.execute(sql, parameters)]
+                if query._columns is not None:
+                    rows = [{column: row.get(column) for column in query._columns} for row in rows]
+                return LocalResponse(rows, count)
+
+            if query._operation == "delete":
+                sql = f'SELECT data FROM "{query._table}"{where}'
+                rows = [json.loads(data) for data, in self._db.execute(sql, parameters)]
+                self._db.execute(f'DELETE FROM "{query._table}"{where}', parameters)
+                self._db.commit()
+                return LocalResponse(rows)
+
+            rows = [self._write(query._table, row, query._operation == "upsert") for row in query._rows]
+            self._db.commit()
+            return LocalResponse(rows)
+
+    def _where(self, filters):
+        clauses = []
+        parameters = []
+        for column, operator, value in filters:
+            if value is None:
+                clauses.append(f"json_extract(data, ?) IS {'NOT ' if operator == '!=' else ''}NULL")
+                parameters.append(json_path(column))
+                continue
+            clauses.append(f"json_extract(data, ?) {operator} ?")
+            parameters.extend([json_path(column), value])
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), parameters
+
+    def _write(self, table, row, upsert):
+        key_columns = TABLE_KEYS[table]
+        key = json.dumps([row.get(column) for column in key_columns]) if all(
+            row.get(column) is not None for column in key_columns
+        ) else None
+
+        existing = None
+        if upsert and key is not None:
+            found = self._db.execute(f'SELECT data FROM "{table}" WHERE key = ?', (key,)).fetchone()
+            existing = json.loads(found[0]) if found else None
+
+        if existing is not None:
+            data = dict(existing, **row)
+            self._db.execute(f'UPDATE "{table}" SET data = ? WHERE key = ?', (json.dumps(data), key))
+        else:
+            data = dict(TABLE_DEFAULTS.get(table, {}), **row)
+            self._db.execute(f'INSERT INTO "{table}" (key, data) VALUES (?, ?)', (key, json.dumps(data)))
+        return data
@@ -0,0 +1,78 @@
+import base64
+import json
+import numpy as np
+
+"""
+Binary encoding of the stored embeddings.
+Embeddings used to be stored as JSON lists of floats, about 20 characters per dimension, which are slow to transfer
+and to parse. They are now stored as text with a short header and the base64-encoded little-endian values:
+"emb1:f32:<base64>" for float32 (about 5.3 characters per dimension) or "emb1:f16:<base64>" for float16 (about 2.7).
+Decoding is a base64 decode and a zero-copy np.frombuffer. JSON lists, as strings or lists, can still be decoded,
+so rows written before the migration (migrate_embeddings.py) keep working.
+"""
+
+EMBEDDING_HEADER = "emb1"
+EMBEDDING_DTYPES = {'float32': ("f32", "<f4"), 'float16': ("f16", "<f2")}
+DTYPE_CODES = {code: dtype for code, dtype in EMBEDDING_DTYPES.values()}
+
+def encode_embedding(vector, dtype="float32"):
+    """
+    Encodes an embedding (a list of numbers, an array or a JSON string) as a binary embedding string.
+    Empty, missing, invalid and already encoded embeddings are returned unchanged.
+    """
+    if isinstance(vector, str) and not vector.startswith(f"{EMBEDDING_HEADER}:"):
+        decoded = decode_embedding(vector)
+        vector = vector if decoded is None else decoded
+    if vector is None or isinstance(vector, str) or len(vector) == 0:
+        return vector
+    code, numpy_dtype = EMBEDDING_DTYPES[dtype]
+    data = np.asarray(vector, dtype=numpy_dtype).reshape(-1).tobytes()
+    return f"{EMBEDDING_HEADER}:{code}:{base64.b64encode(data).decode('ascii')}"
+
+def decode_embedding(value):
+    """
+    Decodes a stored embedding, a binary embedding string, a JSON string or a list of numbers, into a float32 vector.
+    Returns None if the embedding is missing or cannot be decoded.
+    """
+    if value is None or len(value) == 0:
+        return None
+
+    if isinstance(value, str) and value.startswith(f"{EMBEDDING_HEADER}:"):
+        try:
+            _, code, data = value.split(":", 2)
+            vector = np.frombuffer(base64.b64decode(data), dtype=DTYPE_CODES[code])
+        except (KeyError, ValueError):
+            return None
+        vector = vector.astype(np.float32) if vector.dtype != np.float32 else vector
+    else:
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                return None
+        try:
+            vector = np.asarray(value, dtype=np.float32).reshape(-1)
+        except (TypeError, ValueError):
+            return None
+
+    if vector.size == 0:
+        return None
+    return vector
+
+def encode_supervisor_embeddings(supervisor, dtype="float32"):
+    """
+    Returns a copy of a supervisor row with its embedding columns (all columns named *_embedding*)
+    and abstract embeddings in the binary encoding.
+    """
+    encoded = dict(supervisor)
+    for column in supervisor:
+        if "_embedding" in column:
+            encoded[column] = encode_embedding(encoded[column], dtype)
+
+    if isinstance(encoded.get('abstracts'), list):
+        encoded['abstracts'] = [
+            dict(abstract, embedding=encode_embedding(abstract.get('embedding'), dtype))
+            if isinstance(abstract, dict) and 'embedding' in abstract else abstract
+            for abstract in encoded['abstracts']
+        ]
+    return encoded
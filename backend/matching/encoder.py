@@ -0,0 +1,140 @@
+import numpy as np
+import torch
+
+from backend.matching.metrics import timed
+
+"""
+Batched text encoding for the matching API.
+Texts are tokenized together, sorted by token length and split into length buckets under a token budget,
+so each forward pass only pads to the longest text in its bucket. The mean-pooled embeddings are
+scattered back to the order of the input texts.
+Texts longer than the model's 512 positions are encoded as overlapping windows with a capped window count,
+which gives a predictable cost for multi-page proposals instead of one huge or failing forward pass.
+"""
+
+def mean_pool(token_embeddings, attention_mask):
+    """
+    Mean-pools token embeddings over the non-padding tokens of each sequence.
+    """
+    mask = attention_mask.unsqueeze(-1).to(token_embeddings.dtype)
+    summed = (token_embeddings * mask).sum(dim=1)
+    counts = mask.sum(dim=1).clamp(min=1)
+    return summed / counts
+
+def length_buckets(lengths, max_batch_size, max_tokens):
+    """
+    Groups item indices into batches of similar token length.
+    Each batch holds at most max_batch_size items, and its padded size (items x longest length)
+    stays within max_tokens, except for a single item that is longer than the budget on its own.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+
+    buckets = []
+    bucket = []
+    for i in order:
+        longest = max(lengths[i], 1)
+        if bucket and (len(bucket) >= max_batch_size or (len(bucket) + 1) * longest > max_tokens):
+            buckets.append(bucket)
+            bucket = []
+        bucket.append(i)
+
+    if bucket:
+        buckets.append(bucket)
+    return buckets
+
+def encode_features(tokenizer, model, features, max_batch_size=32, max_tokens=16384):
+    """
+    Runs tokenized features through the model, one padded forward pass per length bucket.
+
+    Returns a float32 np.ndarray with the mean-pooled embedding of each feature, aligned with features.
+    """
+    lengths = [len(feature['input_ids']) for feature in features]
+
+    embeddings = None
+    for bucket in length_buckets(lengths, max_batch_size, max_tokens):
+        with timed("tokenization"):
+            inputs = tokenizer.pad([features[i] for i in bucket], padding="longest", return_tensors="pt")
+        with timed("forward"), torch.no_grad():
+            outputs = model(**inputs)
+
+        with timed("pooling"):
+            pooled = mean_pool(outputs.last_hidden_state, inputs["attention_mask"]).detach().cpu().numpy()
+        if embeddings is None:
+            embeddings = np.zeros((len(features), pooled.shape[1]), dtype=np.float32)
+        embeddings[bucket] = pooled
+
+    return embeddings
+
+def encode_batch(tokenizer, model, texts, max_length, max_batch_size=32, max_tokens=16384):
+    """
+    Generates mean-pooled embeddings for a list of texts, truncated to max_length tokens,
+    running one padded forward pass per length bucket.
+
+    Returns a float32 np.ndarray of shape (len(texts), hidden_size), aligned with texts.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    with timed("tokenization"):
+        encoded = tokenizer(list(texts), max_length=max_length, truncation=True)
+        features = [{key: encoded[key][i] for key in encoded.keys()} for i in range(len(texts))]
+    return encode_features(tokenizer, model, features, max_batch_size, max_tokens)
+
+def window_starts(num_tokens, size, overlap, max_windows):
+    """
+    Returns the start positions of overlapping windows of size tokens covering num_tokens tokens.
+    If more than max_windows windows are needed, max_windows evenly spaced windows are kept,
+    which bounds the cost of very long texts.
+    """
+    step = max(size - overlap, 1)
+    starts = [0]
+    while starts[-1] + size < num_tokens:
+        starts.append(starts[-1] + step)
+
+    if len(starts) > max_windows:
+        keep = np.unique(np.linspace(0, len(starts) - 1, max_windows).round().astype(int))
+        starts = [starts[i] for i in keep]
+    return starts
+
+def encode_windows(
+    tokenizer, model, texts, window_size=512, overlap=64, max_windows=8, max_batch_size=32, max_tokens=16384,
+):
+    """
+    Generates embeddings for texts of any length with a sliding window.
+    Each text is split into overlapping windows of at most window_size tokens (including special tokens),
+    the windows of all texts are encoded together in length-bucketed padded batches, and the window embeddings
+    of each text are combined with a mean weighted by the number of tokens in each window.
+    Texts that fit in one window give the same embedding as encode_batch.
+
+    Returns a float32 np.ndarray of shape (len(texts), hidden_size), aligned with texts.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    size = window_size - tokenizer.num_special_tokens_to_add(pair=False)
+    with_token_types = "token_type_ids" in tokenizer.model_input_names
+
+    features = []
+    owners = []
+    weights = []
+    with timed("tokenization"):
+        token_ids = tokenizer(list(texts), add_special_tokens=False)['input_ids']
+        for text_index, ids in enumerate(token_ids):
+            for start in window_starts(len(ids), size, overlap, max_windows):
+                input_ids = tokenizer.build_inputs_with_special_tokens(ids[start:start + size])
+                feature = {'input_ids': input_ids, 'attention_mask': [1] * len(input_ids)}
+                if with_token_types:
+                    feature['token_type_ids'] = [0] * len(input_ids)
+                features.append(feature)
+                owners.append(text_index)
+                weights.append(len(input_ids))
+
+    window_embeddings = encode_features(tokenizer, model, features, max_batch_size, max_tokens)
+
+    with timed("pooling"):
+        owners = np.array(owners)
+        weights = np.array(weights, dtype=np.float32)
+        summed = np.zeros((len(texts), window_embeddings.shape[1]), dtype=np.float32)
+        np.add.at(summed, owners, window_embeddings * weights[:, None])
+        totals = np.bincount(owners, weights=weights, minlength=len(texts)).astype(np.float32)
+        return summed / totals[:, None]
@@ -0,0 +1,90 @@
+import uuid
+import numpy as np
+
+from backend.matching.embedding_codec import encode_supervisor_embeddings
+from backend.matching.variants import EMBEDDING_VARIANTS
+
+"""
+Synthetic supervisor fixtures for offline benchmarks.
+Generates supervisors, topics and supervisor-topic relations in the format of the database tables.
+The embeddings are clustered by topic: each abstract is close to the centroids of its topics,
+and each supervisor embedding is the mean of its abstract embeddings, so the similarity structure
+(and with it the behaviour of the approximate retrieval) resembles that of real supervisors.
+The embeddings are stored in the binary embedding encoding, like the pipeline writes them.
+The fixtures only depend on the seed.
+"""
+
+EMBEDDING_DIM = 768
+
+def normalized(matrix):
+    return matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)
+
+def random_uuid(rng):
+    return str(uuid.UUID(bytes=rng.bytes(16)))
+
+def synthetic_fixtures(num_supervisors, num_topics=50, seed=0, models=tuple(EMBEDDING_VARIANTS), embedding_dtype="float32"):
+    """
+    Generates num_supervisors supervisors with 1-10 abstracts and 1-5 topics each, with the embedding columns
+    of the given models, encoded with the given dtype.
+
+    Returns a tuple (supervisors, topics, supervisor_topics) of lists of table rows.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = normalized(rng.standard_normal((num_topics, EMBEDDING_DIM)).astype(np.float32))
+
+    topics = [
+        {'topic_id': topic_id, 'label': f"Topic {topic_id}", 'keywords': [f"keyword {topic_id}.{i}" for i in range(10)]}
+        for topic_id in range(num_topics)
+    ]
+    supervisors = []
+    supervisor_topics = []
+
+    for _ in range(num_supervisors):
+        supervisor_id = random_uuid(rng)
+        topic_ids = rng.choice(num_topics, size=int(rng.integers(1, min(5, num_topics) + 1)), replace=False)
+
+        abstracts = []
+        vectors = []
+        for _ in range(int(rng.integers(1, 11))):
+            abstract_topics = rng.choice(topic_ids, size=int(rng.integers(1, len(topic_ids) + 1)), replace=False)
+            weights = rng.random(len(abstract_topics))
+            vector = normalized(weights @ centroids[abstract_topics] + 0.05 * rng.standard_normal(EMBEDDING_DIM))
+            vectors.append(vector)
+            abstracts.append({
+                'uuid': random_uuid(rng),
+                'embedding': vector,
+                'topics': {str(topic_id): float(weight) for topic_id, weight in zip(abstract_topics, weights)},
+            })
+
+        supervisor = {
+            'uuid': supervisor_id,
+            'email': f"{supervisor_id[:8]}@example.org",
+            'available': True,
+            'abstracts': abstracts,
+        }
+        mean = np.mean(vectors, axis=0)
+        for model in models:
+            noise = 0.02 * rng.standard_normal(EMBEDDING_DIM)
+            supervisor[EMBEDDING_VARIANTS[model][1]] = normalized(mean + noise)
+        supervisors.append(encode_supervisor_embeddings(supervisor, embedding_dtype))
+
+        supervisor_topics.extend(
+            {'uuid': supervisor_id, 'topic_id': int(topic_id), 'score': float(rng.random())} for topic_id in topic_ids
+        )
+
+    return supervisors, topics, supervisor_topics
+
+def write_fixtures(client, supervisors, topics, supervisor_topics, batch_size=50):
+    """
+    Replaces the contents of the supervisor, topic and supervisor_topic tables of a database client with fixtures.
+    """
+    client.table("supervisor").delete().neq("uuid", "").execute()
+    client.table("supervisor_topic").delete().neq("uuid", "").execute()
+    client.table("topic").delete().neq("label", "").execute()
+
+    for i in range(0, len(supervisors), batch_size):
+        client.table("supervisor").upsert(supervisors[i:i + batch_size]).execute()
+    if topics:
+        client.table("topic").insert(topics).execute()
+    if supervisor_topics:
+        client.table("supervisor_topic").insert(supervisor_topics).execute()
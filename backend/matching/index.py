@@ -0,0 +1,398 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from backend.matching.embedding_codec import decode_embedding
+
+"""
+In-memory indexes used by the matching API.
+The stored supervisor embeddings are decoded once at startup into a single contiguous,
+L2-normalised float32 matrix, so ranking a query is one matrix-vector product followed by a top-k,
+instead of parsing and comparing every supervisor embedding on every request.
+The abstract embeddings are stored the same way, as one matrix with CSR-style offsets per supervisor,
+so the top paper for all suggested supervisors is found with one gather, one matmul and a segmented argmax.
+The supervisor-topic relations are kept as an inverted index from topic id to supervisor rows and scores,
+and the abstract topic distributions as a sparse abstract x topic matrix, for the topic-based ("general") path.
+"""
+
+EMBEDDING_COLUMN = "specter2_averaged_embedding_with_keywords"
+
+def parse_embedding(value):
+    """
+    Parses a stored embedding (a binary embedding string, a JSON string or a list of numbers) into a float32 vector.
+    Returns None if the embedding is missing or cannot be parsed.
+    """
+    return decode_embedding(value)
+
+def normalize_rows(matrix):
+    """
+    L2-normalises the rows of a float32 matrix in place. Zero rows are left as zeros,
+    which gives them a cosine similarity of 0, matching sklearn's cosine_similarity.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+def normalize_query(embedding):
+    """
+    Converts a query embedding (torch tensor or array-like) into an L2-normalised float32 vector.
+    """
+    query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(query)
+    if norm > 0:
+        query = query / norm
+    return query
+
+def build_supervisor_index(supervisors, column=EMBEDDING_COLUMN):
+    """
+    Builds the supervisor embedding index from the supervisor rows fetched from the database.
+    Supervisors without a valid embedding, or with an embedding of a different dimension than the rest, are skipped.
+
+    Returns a dictionary containing:
+        - 'uuids' (np.ndarray): The supervisor UUIDs, aligned with the rows of 'matrix'.
+        - 'matrix' (np.ndarray): Contiguous, L2-normalised float32 matrix of shape (n_supervisors, dim).
+    """
+    uuids = []
+    vectors = []
+
+    for supervisor in supervisors:
+        vector = parse_embedding(supervisor.get(column))
+        if vector is None:
+            continue
+
+        if vectors and vector.shape[0] != vectors[0].shape[0]:
+            print(f"Skipping supervisor {supervisor.get('uuid')}: embedding dimension mismatch")
+            continue
+
+        uuids.append(supervisor.get('uuid'))
+        vectors.append(vector)
+
+    if vectors:
+        matrix = np.ascontiguousarray(np.stack(vectors), dtype=np.float32)
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+
+    return {
+        'uuids': np.array(uuids, dtype=object),
+        'matrix': normalize_rows(matrix),
+    }
+
+def top_k(scores, k):
+    """
+    Returns the indices of the k highest scores, sorted by descending score.
+    Uses argpartition so only the k candidates are sorted.
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+def top_k_rows(scores, k):
+    """
+    Returns the indices of the k highest scores in each row of a 2D score matrix, sorted by descending score.
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.intp)
+
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+def normalize_queries(embeddings):
+    """
+    Converts a batch of query embeddings into a matrix of L2-normalised float32 rows.
+    """
+    queries = np.array(embeddings, dtype=np.float32, ndmin=2)
+    return normalize_rows(queries)
+
+def rank_supervisors_batch(queries, supervisor_index, k):
+    """
+    Ranks the supervisors in the index against a batch of normalised query vectors with one matrix-matrix product.
+
+    Returns a tuple (rows, scores) of arrays of shape (n_queries, k) with the best matching rows and their cosine similarities.
+    """
+    matrix = supervisor_index['matrix']
+    if matrix.shape[0] == 0 or matrix.shape[1] != queries.shape[1]:
+        empty = (queries.shape[0], 0)
+        return np.empty(empty, dtype=np.intp), np.empty(empty, dtype=np.float32)
+
+    scores = queries @ matrix.T
+    rows = top_k_rows(scores, k)
+    return rows, np.take_along_axis(scores, rows, axis=1)
+
+def rank_supervisors(query, supervisor_index, k):
+    """
+    Ranks the supervisors in the index against a normalised query vector.
+
+    Returns a tuple (rows, scores) with the k best matching rows of the index and their cosine similarities.
+    """
+    matrix = supervisor_index['matrix']
+    if matrix.shape[0] == 0 or matrix.shape[1] != query.shape[0]:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+    scores = matrix @ query
+    rows = top_k(scores, k)
+    return rows, scores[rows]
+
+def build_abstract_index(supervisors, supervisor_uuids):
+    """
+    Builds the abstract embedding index for the supervisors in a supervisor index.
+    The abstracts of the supervisor in row i are stored in rows offsets[i]:offsets[i] + lengths[i] of 'matrix'.
+    Abstracts without a valid embedding, or with a different dimension than the rest, are skipped.
+
+    Returns a dictionary containing:
+        - 'uuids' (np.ndarray): The abstract UUIDs, aligned with the rows of 'matrix'.
+        - 'matrix' (np.ndarray): Contiguous, L2-normalised float32 matrix of shape (n_abstracts, dim).
+        - 'offsets' (np.ndarray): The first abstract row of each supervisor.
+        - 'lengths' (np.ndarray): The number of abstracts of each supervisor.
+    """
+    supervisors_by_uuid = {supervisor.get('uuid'): supervisor for supervisor in supervisors}
+
+    uuids = []
+    vectors = []
+    offsets = np.zeros(len(supervisor_uuids), dtype=np.int64)
+    lengths = np.zeros(len(supervisor_uuids), dtype=np.int64)
+
+    for row, supervisor_id in enumerate(supervisor_uuids):
+        offsets[row] = len(vectors)
+        supervisor = supervisors_by_uuid.get(supervisor_id) or {}
+
+        for abstract in supervisor.get('abstracts') or []:
+            if not isinstance(abstract, dict):
+                continue
+
+            vector = parse_embedding(abstract.get('embedding'))
+            if vector is None:
+                continue
+
+            if vectors and vector.shape[0] != vectors[0].shape[0]:
+                print(f"Skipping abstract {abstract.get('uuid')}: embedding dimension mismatch")
+                continue
+
+            uuids.append(abstract.get('uuid'))
+            vectors.append(vector)
+
+        lengths[row] = len(vectors) - offsets[row]
+
+    if vectors:
+        matrix = np.ascontiguousarray(np.stack(vectors), dtype=np.float32)
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+
+    return {
+        'uuids': np.array(uuids, dtype=object),
+        'matrix': normalize_rows(matrix),
+        'offsets': offsets,
+        'lengths': lengths,
+    }
+
+def gather_segments(offsets, lengths, rows):
+    """
+    Gathers the CSR segments of the given rows into one flat array of positions.
+
+    Returns a tuple (positions, segment_lengths).
+    """
+    segment_lengths = lengths[rows]
+    total = int(segment_lengths.sum())
+    segment_starts = np.cumsum(segment_lengths) - segment_lengths
+    positions = np.repeat(offsets[rows] - segment_starts, segment_lengths) + np.arange(total)
+    return positions, segment_lengths
+
+def segment_argmax(scores, segment_lengths):
+    """
+    Returns, for each consecutive segment of scores, the position of its highest score in 'scores'.
+    Ties resolve to the first position, and empty segments give -1.
+    """
+    result = np.full(segment_lengths.shape[0], -1, dtype=np.int64)
+    if scores.shape[0] == 0:
+        return result
+
+    segment_ids = np.repeat(np.arange(segment_lengths.shape[0]), segment_lengths)
+    order = np.lexsort((-scores, segment_ids))
+    segment_starts = np.cumsum(segment_lengths) - segment_lengths
+    non_empty = segment_lengths > 0
+    result[non_empty] = order[segment_starts[non_empty]]
+    return result
+
+def top_abstracts(query, abstract_index, rows):
+    """
+    Finds the most similar abstract of each supervisor row for a normalised query vector.
+
+    Returns a list aligned with rows, with a tuple (abstract_uuid, similarity) per row, or None if the
+    supervisor has no valid abstracts.
+    """
+    matrix = abstract_index['matrix']
+    if matrix.shape[0] == 0 or matrix.shape[1] != query.shape[0]:
+        return [None] * len(rows)
+
+    positions, segment_lengths = gather_segments(abstract_index['offsets'], abstract_index['lengths'], rows)
+    scores = matrix[positions] @ query
+    best = segment_argmax(scores, segment_lengths)
+
+    results = []
+    for position in best:
+        if position < 0:
+            results.append(None)
+            continue
+        results.append((abstract_index['uuids'][positions[position]], float(scores[position])))
+    return results
+
+def parse_topic_ids(topics):
+    """
+    Extracts the integer topic ids from the topics selected by the user, skipping invalid entries.
+    The ids are sorted, so the suggestions do not depend on the order in which the topics were selected.
+    """
+    topic_ids = []
+    for topic in topics:
+        try:
+            topic_ids.append(int(topic.get('topicId')))
+        except (AttributeError, TypeError, ValueError):
+            continue
+    return sorted(topic_ids)
+
+def build_topic_index(supervisors_topic_db):
+    """
+    Builds an inverted index from the supervisor_topic relations in the database.
+
+    Returns a dictionary containing:
+        - 'uuids' (np.ndarray): The UUIDs of all supervisors with at least one topic.
+        - 'topics' (dict): Maps each topic id to a tuple (rows, scores) of np.ndarrays,
+          with the supervisor rows in 'uuids' and their scores for the topic.
+    """
+    rows_by_uuid = {}
+    postings = {}
+
+    for supervisor_topic in supervisors_topic_db:
+        supervisor_id = supervisor_topic.get('uuid')
+        if not supervisor_id:
+            continue
+
+        try:
+            topic_id = int(supervisor_topic.get('topic_id'))
+        except (TypeError, ValueError):
+            continue
+
+        row = rows_by_uuid.setdefault(supervisor_id, len(rows_by_uuid))
+        rows, scores = postings.setdefault(topic_id, ([], []))
+        rows.append(row)
+        scores.append(supervisor_topic.get('score', 0) or 0)
+
+    topics = {
+        topic_id: (np.array(rows, dtype=np.int64), np.array(scores, dtype=np.float64))
+        for topic_id, (rows, scores) in postings.items()
+    }
+
+    return {
+        'uuids': np.array(list(rows_by_uuid), dtype=object),
+        'topics': topics,
+    }
+
+def rank_topic_supervisors(topic_ids, topic_index, k):
+    """
+    Scores the supervisors by the accumulated scores of the selected topics and returns the k best.
+    Only supervisors with at least one of the selected topics are ranked.
+
+    Returns a tuple (rows, scores) with the best rows in the topic index and their scores.
+    """
+    num_supervisors = len(topic_index['uuids'])
+    postings = [topic_index['topics'][topic_id] for topic_id in topic_ids if topic_id in topic_index['topics']]
+    if not postings:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+
+    rows = np.concatenate([rows for rows, _ in postings])
+    weights = np.concatenate([scores for _, scores in postings])
+    scores = np.bincount(rows, weights=weights, minlength=num_supervisors)
+    matched = np.flatnonzero(np.bincount(rows, minlength=num_supervisors))
+
+    best = top_k(scores[matched], k)
+    return matched[best], scores[matched[best]]
+
+def build_topic_paper_index(supervisors):
+    """
+    Builds the index used to find the most relevant paper of a supervisor for a set of topics.
+    The abstracts of the supervisor in row i are stored in rows offsets[i]:offsets[i] + lengths[i] of 'matrix'.
+
+    Returns a dictionary containing:
+        - 'rows' (dict): Maps each supervisor UUID to its row.
+        - 'offsets' (np.ndarray): The first abstract row of each supervisor.
+        - 'lengths' (np.ndarray): The number of abstracts of each supervisor.
+        - 'uuids' (np.ndarray): The abstract UUIDs, aligned with the rows of 'matrix'.
+        - 'columns' (dict): Maps each topic id to its column in 'matrix'.
+        - 'matrix' (csr_matrix): Sparse abstract x topic matrix with the topic scores of each abstract.
+    """
+    rows = {}
+    offsets = np.zeros(len(supervisors), dtype=np.int64)
+    lengths = np.zeros(len(supervisors), dtype=np.int64)
+    uuids = []
+    columns = {}
+    indptr = [0]
+    indices = []
+    data = []
+
+    for supervisor in supervisors:
+        supervisor_id = supervisor.get('uuid')
+        if supervisor_id in rows:
+            continue
+
+        row = len(rows)
+        rows[supervisor_id] = row
+        offsets[row] = len(uuids)
+
+        for abstract in supervisor.get('abstracts') or []:
+            if not isinstance(abstract, dict):
+                continue
+
+            for topic_id, topic_score in (abstract.get('topics') or {}).items():
+                if not topic_score:
+                    continue
+                indices.append(columns.setdefault(int(topic_id), len(columns)))
+                data.append(topic_score)
+
+            uuids.append(abstract.get('uuid'))
+            indptr.append(len(indices))
+
+        lengths[row] = len(uuids) - offsets[row]
+
+    matrix = csr_matrix(
+        (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+        shape=(len(uuids), len(columns)),
+    )
+
+    return {
+        'rows': rows,
+        'offsets': offsets[:len(rows)],
+        'lengths': lengths[:len(rows)],
+        'uuids': np.array(uuids, dtype=object),
+        'columns': columns,
+        'matrix': matrix,
+    }
+
+def top_topic_abstracts(topic_ids, topic_paper_index, supervisor_ids):
+    """
+    Finds the abstract with the highest accumulated score for the selected topics for each supervisor.
+
+    Returns a list aligned with supervisor_ids, with a tuple (abstract_uuid, score) per supervisor,
+    or None if the supervisor has no abstracts.
+    """
+    query = np.zeros(len(topic_paper_index['columns']), dtype=np.float64)
+    for topic_id in set(topic_ids):
+        column = topic_paper_index['columns'].get(topic_id)
+        if column is not None:
+            query[column] = 1.0
+
+    known = [topic_paper_index['rows'][supervisor_id] for supervisor_id in supervisor_ids if supervisor_id in topic_paper_index['rows']]
+    rows = np.array(known, dtype=np.int64)
+    positions, segment_lengths = gather_segments(topic_paper_index['offsets'], topic_paper_index['lengths'], rows)
+    scores = topic_paper_index['matrix'][positions] @ query
+    best = iter(segment_argmax(scores, segment_lengths))
+
+    results = []
+    for supervisor_id in supervisor_ids:
+        position = next(best) if supervisor_id in topic_paper_index['rows'] else -1
+        if position < 0:
+            results.append(None)
+            continue
+        results.append((topic_paper_index['uuids'][positions[position]], float(scores[position])))
+    return results
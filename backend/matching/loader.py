@@ -0,0 +1,61 @@
+from backend.matching.index import (
+    EMBEDDING_COLUMN, build_abstract_index, build_supervisor_index, build_topic_index, build_topic_paper_index,
+)
+from backend.matching.paging import fetch_rows
+from backend.matching.variants import DEFAULT_MODEL, EMBEDDING_VARIANTS, build_variant_indexes
+
+"""
+Loading of the supervisor data used by the matching API.
+Fetches the available supervisors and the supervisor-topic relations from the database in parallel pages
+(see paging.py) and builds the in-memory indexes from them.
+"""
+
+def fetch_supervisors(supabase, columns=(EMBEDDING_COLUMN,), abstract_fields=None, available_only=True):
+    """
+    Fetches the supervisors with the given embedding columns and their abstracts from the database, in parallel pages.
+    Only the available supervisors are fetched if available_only is set. If abstract_fields is given, the abstracts
+    only keep those fields, e.g. ("uuid", "embedding") to drop the topic distributions, and () skips the abstracts.
+    """
+    projection = ("uuid", *columns) if abstract_fields == () else ("uuid", *columns, "abstracts")
+    filters = (("available", True),) if available_only else ()
+    supervisors = fetch_rows(supabase, "supervisor", projection, filters)
+
+    if abstract_fields:
+        for supervisor in supervisors:
+            supervisor['abstracts'] = [
+                {field: abstract.get(field) for field in abstract_fields} if isinstance(abstract, dict) else abstract
+                for abstract in supervisor.get('abstracts') or []
+            ]
+    return supervisors
+
+def fetch_supervisor_topics(supabase):
+    """
+    Fetches all supervisor-topic relations from the database.
+    """
+    return fetch_rows(supabase, "supervisor_topic", ("*",), order=("uuid", "topic_id"))
+
+def build_indexes(supervisors, supervisors_topic_db, models=(DEFAULT_MODEL,)):
+    """
+    Builds all indexes used by the matching API.
+
+    Returns a dictionary containing the 'supervisors', 'abstracts', 'topics' and 'topic_papers' indexes,
+    and the supervisor indexes of the other served models under 'variants'.
+    """
+    supervisor_index = build_supervisor_index(supervisors)
+    return {
+        'supervisors': supervisor_index,
+        'abstracts': build_abstract_index(supervisors, supervisor_index['uuids']),
+        'topics': build_topic_index(supervisors_topic_db),
+        'topic_papers': build_topic_paper_index(supervisors),
+        'variants': build_variant_indexes(supervisors, models, supervisor_index['uuids']),
+    }
+
+def fetch_indexes(supabase, models=(DEFAULT_MODEL,)):
+    """
+    Fetches the supervisor data from the database and builds all indexes used by the matching API,
+    with the supervisor index of each of the given models.
+    """
+    columns = [EMBEDDING_VARIANTS[model][1] for model in dict.fromkeys((DEFAULT_MODEL,) + tuple(models))]
+    supervisors = fetch_supervisors(supabase, columns)
+    supervisors_topic_db = fetch_supervisor_topics(supabase)
+    return build_indexes(supervisors, supervisors_topic_db, models)
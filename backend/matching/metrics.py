@@ -0,0 +1,155 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+"""
+Low-overhead latency metrics for the matching API.
+Each stage of a request (tokenization, forward pass, pooling, scoring, top paper lookup, serialization) is timed
+into a fixed-bucket histogram, and requests and errors are counted by project type. The metrics are rendered in
+the Prometheus text format. A request can also collect its own stage breakdown, which is shared with the
+micro-batcher thread so the encoder stages of a batch are attributed to every request in it.
+"""
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROJECT_TYPES = ("specific", "general", "batch")
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_profiles = contextvars.ContextVar("profiles", default=())
+
+class Histogram:
+    """
+    Cumulative histogram of durations in seconds, with the Prometheus default-style buckets in BUCKETS.
+    """
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+def observe(stage, seconds):
+    """
+    Records the duration of a stage, in the stage histogram and in the profiles of the current request.
+    """
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+    for profile in _profiles.get():
+        profile[stage] = profile.get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage):
+    """
+    Times the enclosed block as the given stage.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+def project_type_label(project_type):
+    """
+    Maps a requested project type to a metric label, so invalid input cannot create new time series.
+    """
+    return project_type if project_type in PROJECT_TYPES else "invalid"
+
+def count_request(project_type, error=False):
+    """
+    Counts a request, and an error if it failed, by project type.
+    """
+    label = project_type_label(project_type)
+    with _lock:
+        _counters[("matching_requests_total", label)] = _counters.get(("matching_requests_total", label), 0) + 1
+        if error:
+            _counters[("matching_errors_total", label)] = _counters.get(("matching_errors_total", label), 0) + 1
+
+@contextmanager
+def collect_profile(enabled=True):
+    """
+    Collects the stage durations of the current request into the yielded dictionary, if enabled.
+    """
+    if not enabled:
+        yield None
+        return
+
+    profile = {}
+    token = _profiles.set(_profiles.get() + (profile,))
+    try:
+        yield profile
+    finally:
+        _profiles.reset(token)
+
+def active_profiles():
+    """
+    Returns the profiles collecting for the current request, to hand over to another thread.
+    """
+    return _profiles.get()
+
+@contextmanager
+def attach_profiles(profiles):
+    """
+    Makes stage durations recorded in the enclosed block count towards the given profiles.
+    """
+    token = _profiles.set(tuple(profiles))
+    try:
+        yield
+    finally:
+        _profiles.reset(token)
+
+def profile_milliseconds(profile):
+    """
+    Converts a collected profile to milliseconds for the API response.
+    """
+    return {stage: round(seconds * 1000, 3) for stage, seconds in profile.items()}
+
+def render_prometheus(gauges=None, counters=None):
+    """
+    Renders all histograms and counters, and the given gauges and counters, in the Prometheus text format.
+    gauges and counters map metric names to a tuple (help text, value), counter names end with _total.
+    """
+    lines = [
+        "# HELP matching_stage_seconds Latency of the stages of the matching API.",
+        "# TYPE matching_stage_seconds histogram",
+    ]
+
+    with _lock:
+        for stage, histogram in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'matching_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'matching_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'matching_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'matching_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        for name, help_text in [
+            ("matching_requests_total", "Requests to the matching API by project type."),
+            ("matching_errors_total", "Failed requests to the matching API by project type."),
+        ]:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (counter, label), value in sorted(_counters.items()):
+                if counter == name:
+                    lines.append(f'{name}{{project_type="{label}"}} {value}')
+
+    for metric_type, metrics in (("counter", counters), ("gauge", gauges)):
+        for name, (help_text, value) in (metrics or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
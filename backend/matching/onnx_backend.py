@@ -0,0 +1,110 @@
+import os
+from types import SimpleNamespace
+import numpy as np
+import torch
+
+"""
+ONNX Runtime inference backend for the query encoder.
+The adapter-activated SPECTER 2 model is exported once to ONNX, optionally with a dynamically
+int8-quantized variant, and run with ONNX Runtime on the CPU. OnnxEncoder is called like the PyTorch model
+and returns the last hidden state as a tensor, so the batched encoding and pooling code is shared by all backends.
+onnx and onnxruntime are only imported when an ONNX backend is selected.
+"""
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model.int8.onnx"
+INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+
+class LastHiddenState(torch.nn.Module):
+    """
+    Wraps a transformer model so its forward pass returns only the last hidden state, for the ONNX export.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)
+        return outputs.last_hidden_state
+
+def export_onnx(model, tokenizer, path):
+    """
+    Exports the model to ONNX at path, with dynamic batch and sequence dimensions.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    inputs = tokenizer(["Exporting the query encoder", "to ONNX"], padding=True, return_tensors="pt")
+    if "token_type_ids" not in inputs:
+        inputs["token_type_ids"] = torch.zeros_like(inputs["input_ids"])
+
+    model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHiddenState(model),
+            tuple(inputs[name] for name in INPUT_NAMES),
+            path,
+            input_names=INPUT_NAMES,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in INPUT_NAMES + ["last_hidden_state"]},
+            opset_version=17,
+        )
+
+def quantize_onnx(path, quantized_path):
+    """
+    Writes a dynamically int8-quantized copy of the ONNX model at path to quantized_path.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8)
+
+def ensure_onnx_model(model_dir, quantized, load_model, tokenizer):
+    """
+    Returns the path of the ONNX model in model_dir, exporting (and quantizing) it first if it does not exist.
+    load_model is only called when an export is needed, so the PyTorch model is not loaded otherwise.
+    """
+    path = os.path.join(model_dir, ONNX_MODEL_FILE)
+    if not os.path.exists(path):
+        print(f"Exporting query encoder to {path}")
+        export_onnx(load_model(), tokenizer, path)
+
+    if not quantized:
+        return path
+
+    quantized_path = os.path.join(model_dir, ONNX_INT8_MODEL_FILE)
+    if not os.path.exists(quantized_path):
+        print(f"Quantizing query encoder to {quantized_path}")
+        quantize_onnx(path, quantized_path)
+    return quantized_path
+
+class OnnxEncoder:
+    """
+    Runs an exported encoder with ONNX Runtime. Calling it with the tokenizer outputs returns an object
+    with a 'last_hidden_state' tensor, like the PyTorch model.
+
+    Parameters:
+        path: Path of the ONNX model.
+        num_threads: Optional number of intra-op threads used by ONNX Runtime.
+    """
+
+    def __init__(self, path, num_threads=None):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        self.path = path
+        self._session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._input_names = [session_input.name for session_input in self._session.get_inputs()]
+
+    def __call__(self, **inputs):
+        feed = {}
+        for name in self._input_names:
+            value = inputs.get(name)
+            if value is None:
+                value = torch.zeros_like(inputs["input_ids"])
+            feed[name] = np.asarray(value, dtype=np.int64)
+
+        last_hidden_state = self._session.run(["last_hidden_state"], feed)[0]
+        return SimpleNamespace(last_hidden_state=torch.from_numpy(last_hidden_state))
@@ -0,0 +1,82 @@
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Parallel paged loading of database tables.
+Tables used to be paged through serially in small fixed pages, so the loading time grew with the number of round trips.
+fetch_rows counts the matching rows with the first page, sizes the other pages so each holds about
+DATABASE_FETCH_PAGE_BYTES of JSON, and fetches them concurrently over the pooled HTTP connections of the client.
+Failed pages are retried with exponential backoff and a halved page size, which also gets past statement timeouts
+and payload limits of large pages. Pages are ordered by the key columns, so concurrent pages never overlap.
+"""
+
+FETCH_CONCURRENCY = int(os.getenv("DATABASE_FETCH_CONCURRENCY", "8"))
+FETCH_PAGE_BYTES = int(os.getenv("DATABASE_FETCH_PAGE_BYTES", str(4 * 2**20)))
+FIRST_PAGE_SIZE = 20 # Rows of the first page, used to estimate the row size
+MAX_PAGE_SIZE = 1000 # The default max-rows of PostgREST, larger pages are truncated by Supabase
+MAX_RETRIES = 4
+RETRY_BACKOFF_SECONDS = 0.5
+
+def fetch_rows(client, table, columns, filters=(), order=("uuid",), concurrency=FETCH_CONCURRENCY,
+               page_bytes=FETCH_PAGE_BYTES):
+    """
+    Fetches the given columns of all rows of a table that match the (column, value) equality filters,
+    ordered by the order columns, which should be unique.
+
+    Returns the list of rows.
+    """
+    def query(start, end, count=None):
+        builder = client.table(table).select(*columns, count=count)
+        for column, value in filters:
+            builder = builder.eq(column, value)
+        for column in order:
+            builder = builder.order(column)
+        return builder.range(start, end)
+
+    def fetch_range(start, end, page_size):
+        """
+        Fetches the rows start to end (inclusive, None for all remaining rows) in pages of up to page_size rows.
+        """
+        rows = []
+        failures = 0
+        while end is None or start <= end:
+            stop = start + page_size - 1 if end is None else min(end, start + page_size - 1)
+            try:
+                batch = query(start, stop).execute().data or []
+            except Exception as e:
+                failures += 1
+                if failures > MAX_RETRIES:
+                    raise
+                print(f"Error fetching rows {start}-{stop} of {table}, retrying: {e}")
+                page_size = max(page_size // 2, 1)
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** (failures - 1) * (1 + random.random()))
+                continue
+
+            if not batch:
+                break
+            failures = 0
+            rows.extend(batch)
+            start += len(batch)
+        return rows
+
+    response = query(0, FIRST_PAGE_SIZE - 1, count="exact").execute()
+    rows = response.data or []
+    total = response.count
+    if not rows or (total is not None and len(rows) >= total):
+        return rows
+
+    row_bytes = max(len(json.dumps(rows)) / len(rows), 1)
+    page_size = int(min(max(page_bytes // row_bytes, 1), MAX_PAGE_SIZE))
+    if total is None:
+        return rows + fetch_range(len(rows), None, page_size)
+
+    ranges = [(start, min(start + page_size, total) - 1) for start in range(len(rows), total, page_size)]
+    with ThreadPoolExecutor(max_workers=max(min(concurrency, len(ranges)), 1)) as executor:
+        pages = list(executor.map(lambda page: fetch_range(*page, page_size), ranges))
+
+    # Rows added after the count are fetched after the last page
+    tail = fetch_range(total, None, page_size) if len(pages[-1]) == ranges[-1][1] - ranges[-1][0] + 1 else []
+    return rows + [row for page in pages for row in page] + tail
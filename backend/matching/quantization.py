@@ -0,0 +1,194 @@
+import numpy as np
+
+from backend.matching.index import gather_segments, segment_argmax, top_k
+
+"""
+Quantized representations of the supervisor and abstract embedding matrices.
+Int8 codes store each normalised vector as int8 values with a per-vector scale (4x smaller than float32),
+and binary codes store only the sign bit of each dimension (32x smaller), compared with popcount Hamming distances.
+Both only generate candidates, which are re-scored exactly against the float32 matrix. When the snapshot is
+memory-mapped, only the re-scored rows of the float32 matrix are paged in, so the codes are what each worker
+process scans and keeps resident.
+The int8 codes also store the norm of the quantization error of each vector, which bounds the error of its score
+for a normalised query, so the candidates of the int8 search always contain the exact top k.
+"""
+
+QUANTIZATION_METHODS = ("int8", "binary")
+CHUNK_SIZE = 1024 # Rows converted to float32 per matrix product, small enough to stay in the CPU cache
+SCORE_TOLERANCE = 1e-5 # Added to the error bounds to cover the float32 rounding of the approximate scores
+
+def quantize_int8(matrix):
+    """
+    Quantizes the rows of a matrix to int8 with a symmetric per-row scale.
+
+    Returns a dictionary with the int8 'codes', the float32 'scales' and the float32 'errors',
+    the norm of the difference between each row and its dequantized codes.
+    """
+    codes = np.empty(matrix.shape, dtype=np.int8)
+    scales = np.empty(matrix.shape[0], dtype=np.float32)
+    errors = np.empty(matrix.shape[0], dtype=np.float32)
+
+    for start in range(0, matrix.shape[0], CHUNK_SIZE):
+        chunk = np.asarray(matrix[start:start + CHUNK_SIZE], dtype=np.float32)
+        chunk_scales = np.abs(chunk).max(axis=1) / 127
+        chunk_scales[chunk_scales == 0] = 1
+        chunk_codes = np.clip(np.rint(chunk / chunk_scales[:, None]), -127, 127)
+
+        codes[start:start + CHUNK_SIZE] = chunk_codes
+        scales[start:start + CHUNK_SIZE] = chunk_scales
+        errors[start:start + CHUNK_SIZE] = np.linalg.norm(chunk - chunk_codes * chunk_scales[:, None], axis=1)
+
+    return {'codes': codes, 'scales': scales, 'errors': errors}
+
+def add_quantized_index(indexes, method):
+    """
+    Adds the int8 or binary codes of the supervisor matrix to the supervisor index, under the name of the method,
+    and the int8 codes of the abstract matrix to the abstract index, if they have none.
+
+    Returns a new dictionary of matching indexes, the given indexes are not modified.
+    """
+    supervisor_index = indexes['supervisors']
+    abstract_index = indexes['abstracts']
+    if method not in supervisor_index:
+        quantize = quantize_int8 if method == "int8" else quantize_binary
+        supervisor_index = dict(supervisor_index, **{method: quantize(supervisor_index['matrix'])})
+    if 'int8' not in abstract_index:
+        abstract_index = dict(abstract_index, int8=quantize_int8(abstract_index['matrix']))
+    return dict(indexes, supervisors=supervisor_index, abstracts=abstract_index)
+
+def int8_scores(queries, quantized, rows=None):
+    """
+    Scores a batch of queries against the int8 codes (optionally only the given rows), converting the codes to float32
+    in cache-sized chunks so the matrix product runs in BLAS.
+
+    Returns a float32 array of shape (n_queries, n_rows).
+    """
+    codes = quantized['codes'] if rows is None else quantized['codes'][rows]
+    scales = quantized['scales'] if rows is None else quantized['scales'][rows]
+
+    scores = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+    buffer = np.empty((min(CHUNK_SIZE, codes.shape[0]), codes.shape[1]), dtype=np.float32)
+    for start in range(0, codes.shape[0], CHUNK_SIZE):
+        end = min(start + CHUNK_SIZE, codes.shape[0])
+        chunk = buffer[:end - start]
+        np.copyto(chunk, codes[start:end], casting="unsafe")
+        np.matmul(queries, chunk.T, out=scores[:, start:end])
+
+    scores *= scales
+    return scores
+
+def quantize_binary(matrix):
+    """
+    Encodes the sign bit of each dimension of the rows of a matrix, packed into bytes
+    and padded with zero bits to a multiple of 64 bits.
+
+    Returns a dictionary with the uint8 'codes' of shape (n_rows, padded_dim / 8).
+    """
+    padded_dim = -(-matrix.shape[1] // 64) * 64
+    codes = np.zeros((matrix.shape[0], padded_dim // 8), dtype=np.uint8)
+    for start in range(0, matrix.shape[0], CHUNK_SIZE):
+        chunk = np.asarray(matrix[start:start + CHUNK_SIZE]) > 0
+        codes[start:start + CHUNK_SIZE, :-(-matrix.shape[1] // 8)] = np.packbits(chunk, axis=1)
+    return {'codes': codes}
+
+def hamming_distances(queries, binary):
+    """
+    Returns the Hamming distances between the sign bits of each query and the binary codes,
+    as an int32 array of shape (n_queries, n_rows).
+    """
+    codes = np.ascontiguousarray(binary['codes']).view(np.uint64)
+    query_codes = np.ascontiguousarray(quantize_binary(queries)['codes']).view(np.uint64)
+
+    distances = np.empty((queries.shape[0], codes.shape[0]), dtype=np.int32)
+    for i, query_code in enumerate(query_codes):
+        np.sum(np.bitwise_count(codes ^ query_code), axis=1, out=distances[i])
+    return distances
+
+def rescore(query, matrix, candidates, k):
+    """
+    Scores the candidate rows exactly and returns the tuple (rows, scores) of the best k.
+    The candidates are sorted, so ties resolve like the exact scan.
+    """
+    candidates = np.sort(candidates)
+    scores = matrix[candidates] @ query
+    best = top_k(scores, k)
+    return candidates[best], scores[best]
+
+def search_int8(queries, matrix, quantized, k):
+    """
+    Retrieves the k most similar rows of the matrix for each normalised query, scoring the int8 codes first.
+    Every row whose score could still be in the top k given its quantization error is re-scored exactly,
+    so the result is the same as the exact scan.
+
+    Returns a tuple (rows, scores) of arrays of shape (n_queries, k), like rank_supervisors_batch.
+    """
+    k = min(k, matrix.shape[0])
+    rows = np.empty((queries.shape[0], k), dtype=np.intp)
+    scores = np.empty((queries.shape[0], k), dtype=np.float32)
+    if k == 0:
+        return rows, scores
+
+    errors = quantized['errors'] + SCORE_TOLERANCE
+    approximate = int8_scores(queries, quantized)
+    for i, query in enumerate(queries):
+        threshold = np.partition(approximate[i] - errors, -k)[-k]
+        candidates = np.flatnonzero(approximate[i] + errors >= threshold)
+        rows[i], scores[i] = rescore(query, matrix, candidates, k)
+
+    return rows, scores
+
+def search_binary(queries, matrix, binary, k, candidates):
+    """
+    Retrieves the k most similar rows of the matrix for each normalised query, re-scoring exactly
+    the candidates with the smallest Hamming distance between the sign bits.
+
+    Returns a tuple (rows, scores) of arrays of shape (n_queries, k), like rank_supervisors_batch.
+    """
+    k = min(k, matrix.shape[0])
+    candidates = min(max(candidates, k), matrix.shape[0])
+    rows = np.empty((queries.shape[0], k), dtype=np.intp)
+    scores = np.empty((queries.shape[0], k), dtype=np.float32)
+    if k == 0:
+        return rows, scores
+
+    distances = hamming_distances(queries, binary)
+    for i, query in enumerate(queries):
+        nearest = np.argpartition(distances[i], candidates - 1)[:candidates]
+        rows[i], scores[i] = rescore(query, matrix, nearest, k)
+
+    return rows, scores
+
+def top_abstracts_int8(query, abstract_index, rows):
+    """
+    Finds the most similar abstract of each supervisor row like top_abstracts, scoring the int8 codes of the
+    abstracts first and re-scoring exactly only the abstracts that could be the most similar of their supervisor.
+
+    Returns a list aligned with rows, with a tuple (abstract_uuid, similarity) per row, or None if the
+    supervisor has no valid abstracts.
+    """
+    matrix = abstract_index['matrix']
+    quantized = abstract_index['int8']
+    if matrix.shape[0] == 0 or matrix.shape[1] != query.shape[0]:
+        return [None] * len(rows)
+
+    positions, segment_lengths = gather_segments(abstract_index['offsets'], abstract_index['lengths'], rows)
+    approximate = int8_scores(query[None, :], quantized, positions)[0]
+    errors = quantized['errors'][positions] + SCORE_TOLERANCE
+
+    # The most similar abstract of a supervisor scores at least the best lower bound of its abstracts
+    segment_ids = np.repeat(np.arange(segment_lengths.shape[0]), segment_lengths)
+    best_lower = np.full(segment_lengths.shape[0], -np.inf, dtype=np.float32)
+    np.maximum.at(best_lower, segment_ids, approximate - errors)
+    candidates = np.flatnonzero(approximate + errors >= best_lower[segment_ids])
+
+    scores = np.full(positions.shape[0], -np.inf, dtype=np.float32)
+    scores[candidates] = matrix[positions[candidates]] @ query
+    best = segment_argmax(scores, segment_lengths)
+
+    results = []
+    for position in best:
+        if position < 0:
+            results.append(None)
+            continue
+        results.append((abstract_index['uuids'][positions[position]], float(scores[position])))
+    return results
@@ -0,0 +1,113 @@
+import threading
+import time
+
+"""
+Hot reloading of the matching indexes.
+The indexes are held by an IndexStore, and request handlers read the current version once at the start of
+a request. A background IndexReloader builds new indexes off the request path, on a schedule or when
+triggered, and swaps them in atomically behind a new version number. In-flight requests keep using the
+version they started with, so updating the supervisors causes no restart and no cold start.
+"""
+
+class IndexStore:
+    """
+    Holds the current version of the matching indexes.
+    """
+
+    def __init__(self, indexes):
+        self._lock = threading.Lock()
+        self._current = dict(indexes, version=1)
+
+    def current(self):
+        """
+        Returns the current indexes. The returned dictionary is never modified, so a request can keep using it
+        even if new indexes are swapped in.
+        """
+        return self._current
+
+    def swap(self, indexes):
+        """
+        Atomically replaces the current indexes and returns the new version number.
+        """
+        with self._lock:
+            version = self._current['version'] + 1
+            self._current = dict(indexes, version=version)
+            return version
+
+class IndexReloader:
+    """
+    Rebuilds the matching indexes in a background thread and swaps them into an IndexStore.
+
+    Parameters:
+        store: The IndexStore to update.
+        load: Function that takes a 'force' flag and returns new indexes, or None if nothing changed.
+              Scheduled polls call it with force=False, triggered reloads with force=True.
+        interval: Seconds between scheduled polls. None or 0 only reloads when triggered.
+        on_swap: Optional function called with the current indexes after each swap, e.g. to warm caches.
+    """
+
+    def __init__(self, store, load, interval=None, on_swap=None):
+        self._store = store
+        self._load = load
+        self._on_swap = on_swap
+        self._interval = interval or None
+        self._trigger = threading.Event()
+        self._lock = threading.Lock()
+        self._force = False
+        self._reloading = False
+        self._last_reload = None
+        self._last_error = None
+
+        self._thread = threading.Thread(target=self._run, name="index-reloader", daemon=True)
+        self._thread.start()
+
+    def trigger(self):
+        """
+        Requests an immediate reload. Returns without waiting for the reload to finish.
+        """
+        with self._lock:
+            self._force = True
+        self._trigger.set()
+
+    def status(self):
+        """
+        Returns the current index version and the state of the reloader.
+        """
+        with self._lock:
+            return {
+                'version': self._store.current()['version'],
+                'reloading': self._reloading,
+                'last_reload': self._last_reload,
+                'last_error': self._last_error,
+                'interval': self._interval,
+            }
+
+    def _run(self):
+        while True:
+            self._trigger.wait(self._interval)
+            self._trigger.clear()
+
+            with self._lock:
+                force = self._force
+                self._force = False
+                self._reloading = True
+
+            swapped = False
+            error = None
+            try:
+                indexes = self._load(force)
+                if indexes is not None:
+                    version = self._store.swap(indexes)
+                    swapped = True
+                    print(f"Reloaded matching indexes, now at version {version}")
+                    if self._on_swap is not None:
+                        self._on_swap(self._store.current())
+            except Exception as e:
+                print(f"Error reloading matching indexes: {e}")
+                error = str(e)
+
+            with self._lock:
+                self._reloading = False
+                self._last_error = error
+                if swapped:
+                    self._last_reload = time.time()
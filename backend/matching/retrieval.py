@@ -0,0 +1,353 @@
+import numpy as np
+
+from backend.matching.index import (
+    EMBEDDING_COLUMN, gather_segments, normalize_rows, rank_supervisors, rank_supervisors_batch, top_k,
+)
+from backend.matching.quantization import QUANTIZATION_METHODS, search_binary, search_int8
+
+"""
+Supervisor retrieval for large supervisor sets.
+Besides the exact scan of the supervisor matrix, the supervisors can be retrieved with an approximate
+inverted file (IVF) index: the normalised embeddings are clustered with spherical k-means, and a query only
+scores the supervisors in the nprobe lists whose centroids are closest to it. The candidates are re-scored
+exactly against the supervisor matrix, so the returned similarities are the exact cosine similarities and
+nprobe only trades recall for latency. Probing all lists gives the same ranking as the exact scan.
+Alternatively, a two-stage prefilter scores all supervisors against a reduced copy of the matrix, projected to a few
+dimensions with PCA or a random projection fitted by the create_supervisors pipeline, and re-scores only the best
+candidates at full dimension.
+The supervisors can also be scored against int8 or binary codes of the matrix first (see quantization.py).
+The IVF, prefilter and quantized indexes are dictionaries of arrays, so they are stored in the index snapshot alongside
+the supervisor matrix.
+"""
+
+RETRIEVAL_METHODS = ("exact", "ivf", "prefilter") + QUANTIZATION_METHODS
+PROJECTION_METHODS = ("pca", "random")
+TRAINING_POINTS_PER_LIST = 64 # Sample size of the k-means training per list
+ASSIGN_CHUNK_SIZE = 8192 # Rows assigned to their nearest centroid per matrix product
+
+def default_num_lists(num_rows):
+    """
+    Returns the default number of IVF lists for num_rows supervisors, about 4 * sqrt(num_rows).
+    """
+    return max(1, int(round(4 * np.sqrt(num_rows))))
+
+def nearest_lists(matrix, centroids):
+    """
+    Returns the index of the most similar centroid of each row of matrix, in chunks to bound the memory use.
+    """
+    assignments = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], ASSIGN_CHUNK_SIZE):
+        chunk = np.asarray(matrix[start:start + ASSIGN_CHUNK_SIZE])
+        assignments[start:start + ASSIGN_CHUNK_SIZE] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+def train_ivf(matrix, num_lists, iterations=10, seed=0):
+    """
+    Clusters the rows of a normalised matrix into num_lists lists with spherical k-means,
+    on a random sample of at most TRAINING_POINTS_PER_LIST rows per list.
+
+    Returns the normalised float32 centroids, of shape (num_lists, dim).
+    """
+    rng = np.random.default_rng(seed)
+    num_rows = matrix.shape[0]
+    num_lists = max(1, min(num_lists, num_rows))
+
+    sample_size = min(num_rows, TRAINING_POINTS_PER_LIST * num_lists)
+    sample = np.asarray(matrix[np.sort(rng.choice(num_rows, sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, num_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = nearest_lists(sample, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=num_lists)
+        empty = counts == 0
+
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(sample[order], (np.cumsum(counts) - counts)[~empty], axis=0)
+
+        # Lists that lost all their rows are reseeded with random rows
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+def ivf_lists(assignments, num_lists):
+    """
+    Groups the rows by list. Rows with a negative assignment are not assigned yet and left out.
+
+    Returns a tuple (order, offsets), where the rows of list i are order[offsets[i]:offsets[i + 1]], in ascending order.
+    """
+    live = np.flatnonzero(assignments >= 0)
+    order = live[np.argsort(assignments[live], kind="stable")]
+    offsets = np.zeros(num_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignments[live], minlength=num_lists), out=offsets[1:])
+    return order, offsets
+
+def ivf_add(ivf, matrix, rows):
+    """
+    Adds (or re-assigns) the given rows of the supervisor matrix to their nearest list.
+    Rows beyond the current size of the index are added, so the matrix can grow between calls.
+
+    Returns a new IVF index, the given one is not modified.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    assignments = np.full(matrix.shape[0], -1, dtype=np.int64)
+    kept = min(matrix.shape[0], ivf['assignments'].shape[0])
+    assignments[:kept] = ivf['assignments'][:kept]
+    assignments[rows] = nearest_lists(matrix[rows], ivf['centroids'])
+
+    order, offsets = ivf_lists(assignments, ivf['centroids'].shape[0])
+    return {'centroids': ivf['centroids'], 'assignments': assignments, 'order': order, 'offsets': offsets}
+
+def build_ivf_index(matrix, num_lists=None, centroids=None, assignments=None):
+    """
+    Builds an IVF index over the rows of a normalised supervisor matrix.
+    If centroids of a previous index are given, they are reused instead of training new ones, as long as they
+    have the same dimension and their number is within a factor of 2 of num_lists. This makes rebuilding the index
+    after the supervisors changed as cheap as assigning the rows to their lists. With reused centroids, the rows
+    with a list in assignments keep it, and only the rows with -1 are assigned.
+
+    Returns a dictionary with the 'centroids', the list of each row under 'assignments', and the rows grouped
+    by list under 'order' and 'offsets'.
+    """
+    num_lists = num_lists or default_num_lists(matrix.shape[0])
+    reusable = (
+        centroids is not None
+        and centroids.shape[1] == matrix.shape[1]
+        and num_lists / 2 <= centroids.shape[0] <= num_lists * 2
+    )
+    if not reusable:
+        if matrix.shape[0] == 0:
+            centroids = np.zeros((0, matrix.shape[1]), dtype=np.float32)
+        else:
+            centroids = train_ivf(matrix, num_lists)
+
+    empty = {'centroids': centroids, 'assignments': np.zeros(0, dtype=np.int64)}
+    if centroids.shape[0] == 0:
+        order, offsets = ivf_lists(empty['assignments'], 0)
+        return dict(empty, order=order, offsets=offsets)
+    if reusable and assignments is not None:
+        return ivf_add(dict(empty, assignments=assignments), matrix, np.flatnonzero(assignments < 0))
+    return ivf_add(empty, matrix, np.arange(matrix.shape[0]))
+
+def unchanged_assignments(supervisor_index, previous_index):
+    """
+    Returns the IVF list in the previous supervisor index of each row of a supervisor index whose supervisor
+    has the same embedding in both, and -1 for new and changed supervisors.
+    """
+    previous_rows = {uuid: row for row, uuid in enumerate(previous_index['uuids'])}
+    rows = np.array([previous_rows.get(uuid, -1) for uuid in supervisor_index['uuids']], dtype=np.int64)
+    assignments = np.full(rows.shape[0], -1, dtype=np.int64)
+    if supervisor_index['matrix'].shape[1] != previous_index['matrix'].shape[1]:
+        return assignments
+
+    known = np.flatnonzero(rows >= 0)
+    same = np.all(supervisor_index['matrix'][known] == previous_index['matrix'][rows[known]], axis=1)
+    assignments[known[same]] = previous_index['ivf']['assignments'][rows[known[same]]]
+    return assignments
+
+def add_ivf_index(indexes, num_lists=None, previous=None):
+    """
+    Returns a copy of the matching indexes with an IVF index of the supervisor matrix under 'supervisors' -> 'ivf'.
+    The centroids of the IVF index in the previous indexes are reused if possible, and then only the supervisors
+    that were added or whose embedding changed are assigned to a list. Removed supervisors are not in the new
+    supervisor matrix, so they drop out of the lists.
+    """
+    supervisor_index = indexes['supervisors']
+    previous_ivf = previous['supervisors'].get('ivf') if previous else None
+    ivf = build_ivf_index(
+        supervisor_index['matrix'],
+        num_lists,
+        previous_ivf['centroids'] if previous_ivf is not None else None,
+        unchanged_assignments(supervisor_index, previous['supervisors']) if previous_ivf is not None else None,
+    )
+    return dict(indexes, supervisors=dict(supervisor_index, ivf=ivf))
+
+def fit_projection(matrix, dim=128, method="pca", seed=0):
+    """
+    Fits a linear projection of the rows of a normalised matrix to dim dimensions, with PCA (the top principal
+    components) or an orthonormal random projection.
+
+    Returns a dictionary with the 'method', the row 'mean' and the float32 'components' of shape (dim, matrix dim).
+    """
+    if method not in PROJECTION_METHODS:
+        raise ValueError(f"Unknown projection method: {method}")
+
+    dim = min(dim, matrix.shape[1])
+    mean = np.asarray(matrix, dtype=np.float64).mean(axis=0)
+
+    if method == "pca":
+        centered = np.asarray(matrix, dtype=np.float64) - mean
+        _, eigenvectors = np.linalg.eigh(centered.T @ centered)
+        components = eigenvectors[:, ::-1][:, :dim].T
+    else:
+        rng = np.random.default_rng(seed)
+        components, _ = np.linalg.qr(rng.normal(size=(matrix.shape[1], dim)))
+        components = components.T
+
+    return {
+        'method': method,
+        'mean': mean.astype(np.float32),
+        'components': np.ascontiguousarray(components, dtype=np.float32),
+    }
+
+def save_projection(path, projection, column=EMBEDDING_COLUMN):
+    """
+    Saves a fitted projection of the embeddings in the given database column to an .npz file at path.
+    """
+    np.savez(
+        path,
+        column=np.array(column),
+        method=np.array(projection['method']),
+        mean=projection['mean'],
+        components=projection['components'],
+    )
+
+def load_projection(path, column=EMBEDDING_COLUMN):
+    """
+    Loads the projection saved at path. Returns None if there is no readable projection of the given column.
+    """
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if str(data['column']) != column:
+                return None
+            return {'method': str(data['method']), 'mean': data['mean'], 'components': data['components']}
+    except (OSError, KeyError, ValueError):
+        return None
+
+def build_prefilter_index(matrix, projection):
+    """
+    Builds the reduced copy of a normalised supervisor matrix for the prefilter.
+    The rows are centred before the projection, which changes all scores of a query by the same constant,
+    so the ranking is preserved while the components capture the variation between supervisors.
+
+    Returns a dictionary with the projection 'components' and 'mean', and the reduced float32 'matrix'.
+    """
+    components = projection['components']
+    if matrix.shape[0] == 0 or components.shape[1] != matrix.shape[1]:
+        reduced = np.zeros((matrix.shape[0], components.shape[0]), dtype=np.float32)
+    else:
+        reduced = (np.asarray(matrix) - projection['mean']) @ components.T
+    return {
+        'components': components,
+        'mean': projection['mean'],
+        'matrix': np.ascontiguousarray(reduced, dtype=np.float32),
+    }
+
+def add_prefilter_index(indexes, projection=None, dim=128):
+    """
+    Returns a copy of the matching indexes with a prefilter index of the supervisor matrix under
+    'supervisors' -> 'prefilter'. If no projection fitted by the create_supervisors pipeline is given,
+    a PCA projection to dim dimensions is fitted on the supervisor matrix.
+    """
+    supervisor_index = indexes['supervisors']
+    matrix = supervisor_index['matrix']
+    if projection is None or projection['components'].shape[1] != matrix.shape[1]:
+        projection = fit_projection(matrix, dim) if matrix.shape[0] else {
+            'method': "pca",
+            'mean': np.zeros(matrix.shape[1], dtype=np.float32),
+            'components': np.zeros((0, matrix.shape[1]), dtype=np.float32),
+        }
+    prefilter = build_prefilter_index(matrix, projection)
+    return dict(indexes, supervisors=dict(supervisor_index, prefilter=prefilter))
+
+def search_prefilter(queries, matrix, prefilter, k, candidates):
+    """
+    Retrieves the k most similar rows of the supervisor matrix for each normalised query in two stages:
+    all rows are scored against the reduced matrix, and the best candidates are re-scored exactly.
+
+    Returns a tuple (rows, scores) of arrays of shape (n_queries, k), like rank_supervisors_batch.
+    """
+    k = min(k, matrix.shape[0])
+    candidates = min(max(candidates, k), matrix.shape[0])
+    rows = np.empty((queries.shape[0], k), dtype=np.intp)
+    scores = np.empty((queries.shape[0], k), dtype=np.float32)
+    if k == 0:
+        return rows, scores
+
+    approximate = (queries @ prefilter['components'].T) @ prefilter['matrix'].T
+    # Sorted candidates resolve ties like the exact scan
+    candidate_rows = np.sort(np.argpartition(-approximate, candidates - 1, axis=1)[:, :candidates], axis=1)
+
+    for i, query in enumerate(queries):
+        candidate_scores = matrix[candidate_rows[i]] @ query
+        best = top_k(candidate_scores, k)
+        rows[i] = candidate_rows[i][best]
+        scores[i] = candidate_scores[best]
+
+    return rows, scores
+
+def search_ivf(queries, matrix, ivf, k, nprobe):
+    """
+    Retrieves the k most similar rows of the supervisor matrix for each normalised query, scoring the rows
+    in the nprobe closest lists exactly. More lists are probed if they hold fewer than k rows.
+
+    Returns a tuple (rows, scores) of arrays of shape (n_queries, k), like rank_supervisors_batch.
+    """
+    order, offsets = ivf['order'], ivf['offsets']
+    k = min(k, order.shape[0])
+    rows = np.empty((queries.shape[0], k), dtype=np.intp)
+    scores = np.empty((queries.shape[0], k), dtype=np.float32)
+    if k == 0:
+        return rows, scores
+
+    list_sizes = np.diff(offsets)
+    probe_order = np.argsort(-(queries @ ivf['centroids'].T), axis=1, kind="stable")
+
+    for i, query in enumerate(queries):
+        lists = probe_order[i]
+        num_probed = max(nprobe, int(np.searchsorted(np.cumsum(list_sizes[lists]), k)) + 1)
+        positions, _ = gather_segments(offsets[:-1], list_sizes, lists[:num_probed])
+
+        # Sorted candidates resolve ties like the exact scan
+        candidates = np.sort(order[positions])
+        candidate_scores = matrix[candidates] @ query
+        best = top_k(candidate_scores, k)
+        rows[i] = candidates[best]
+        scores[i] = candidate_scores[best]
+
+    return rows, scores
+
+def approximate_search(queries, supervisor_index, k, nprobe=None, candidates=None, quantization=None):
+    """
+    Runs the approximate search selected by the options, if the supervisor index supports it.
+    Returns None if the exact scan should be used.
+    """
+    matrix = supervisor_index['matrix']
+    if matrix.shape[0] == 0 or matrix.shape[1] != queries.shape[1]:
+        return None
+    if quantization == "int8" and supervisor_index.get('int8') is not None:
+        return search_int8(queries, matrix, supervisor_index['int8'], k)
+    if quantization == "binary" and candidates and supervisor_index.get('binary') is not None:
+        return search_binary(queries, matrix, supervisor_index['binary'], k, candidates)
+    if candidates and supervisor_index.get('prefilter') is not None:
+        return search_prefilter(queries, matrix, supervisor_index['prefilter'], k, candidates)
+    if nprobe and supervisor_index.get('ivf') is not None:
+        return search_ivf(queries, matrix, supervisor_index['ivf'], k, nprobe)
+    return None
+
+def retrieve_supervisors_batch(queries, supervisor_index, k, nprobe=None, candidates=None, quantization=None):
+    """
+    Retrieves the k best matching supervisors for a batch of normalised queries.
+    Uses the int8 or binary codes of the supervisor index if it has the ones selected by quantization
+    (the binary codes with candidates), the prefilter index of the supervisor index if it has one and candidates is set, the IVF index if it has one
+    and nprobe is set, and the exact scan otherwise.
+
+    Returns a tuple (rows, scores) of arrays of shape (n_queries, k).
+    """
+    result = approximate_search(queries, supervisor_index, k, nprobe, candidates, quantization)
+    if result is None:
+        return rank_supervisors_batch(queries, supervisor_index, k)
+    return result
+
+def retrieve_supervisors(query, supervisor_index, k, nprobe=None, candidates=None, quantization=None):
+    """
+    Retrieves the k best matching supervisors for a normalised query, like retrieve_supervisors_batch.
+
+    Returns a tuple (rows, scores).
+    """
+    result = approximate_search(query[None, :], supervisor_index, k, nprobe, candidates, quantization)
+    if result is None:
+        return rank_supervisors(query, supervisor_index, k)
+    rows, scores = result
+    return rows[0], scores[0]
@@ -0,0 +1,317 @@
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from backend.matching.variants import DEFAULT_MODEL
+
+try:
+    import fcntl
+except ImportError: # Not available on Windows, where snapshots are written without locking
+    fcntl = None
+
+"""
+Binary snapshots of the matching indexes.
+A snapshot is a directory with one .npy file per array (float32 embedding matrices, uuid arrays,
+CSR offsets, the topic CSR, the optional IVF, prefilter and quantized retrieval indexes and the supervisor matrices of the other
+served embedding variants) and a manifest.json with the snapshot version and creation time.
+Loading a snapshot takes milliseconds and needs no network, so the server only has to fall back
+to the database when the snapshot is missing or stale.
+Snapshots can be loaded memory-mapped and read-only, so all server worker processes on a host share
+one copy of the embedding matrices through the page cache instead of each holding their own.
+"""
+
+SNAPSHOT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+def index_arrays(indexes):
+    """
+    Flattens the matching indexes into a dictionary of named NumPy arrays.
+    """
+    supervisor_index = indexes['supervisors']
+    abstract_index = indexes['abstracts']
+    topic_index = indexes['topics']
+    topic_paper_index = indexes['topic_papers']
+
+    topic_ids = sorted(topic_index['topics'])
+    postings = [topic_index['topics'][topic_id] for topic_id in topic_ids]
+    topic_indptr = np.cumsum([0] + [len(rows) for rows, _ in postings])
+
+    paper_matrix = topic_paper_index['matrix']
+    paper_columns = sorted(topic_paper_index['columns'], key=topic_paper_index['columns'].get)
+    paper_supervisors = sorted(topic_paper_index['rows'], key=topic_paper_index['rows'].get)
+
+    arrays = {
+        'supervisor_uuids': np.array(supervisor_index['uuids'], dtype=str),
+        'supervisor_matrix': supervisor_index['matrix'],
+        'abstract_uuids': np.array(abstract_index['uuids'], dtype=str),
+        'abstract_matrix': abstract_index['matrix'],
+        'abstract_offsets': abstract_index['offsets'],
+        'abstract_lengths': abstract_index['lengths'],
+        'topic_supervisor_uuids': np.array(topic_index['uuids'], dtype=str),
+        'topic_ids': np.array(topic_ids, dtype=np.int64),
+        'topic_indptr': np.array(topic_indptr, dtype=np.int64),
+        'topic_rows': np.concatenate([rows for rows, _ in postings]) if postings else np.zeros(0, dtype=np.int64),
+        'topic_scores': np.concatenate([scores for _, scores in postings]) if postings else np.zeros(0, dtype=np.float64),
+        'topic_paper_supervisor_uuids': np.array(paper_supervisors, dtype=str),
+        'topic_paper_offsets': topic_paper_index['offsets'],
+        'topic_paper_lengths': topic_paper_index['lengths'],
+        'topic_paper_uuids': np.array(topic_paper_index['uuids'], dtype=str),
+        'topic_paper_columns': np.array(paper_columns, dtype=np.int64),
+        'topic_paper_data': paper_matrix.data,
+        'topic_paper_indices': paper_matrix.indices,
+        'topic_paper_indptr': paper_matrix.indptr,
+    }
+
+    ivf = supervisor_index.get('ivf')
+    if ivf is not None:
+        arrays.update({f"supervisor_ivf_{name}": array for name, array in ivf.items()})
+
+    prefilter = supervisor_index.get('prefilter')
+    if prefilter is not None:
+        arrays.update({f"supervisor_prefilter_{name}": array for name, array in prefilter.items()})
+
+    for method in ('int8', 'binary'):
+        quantized = supervisor_index.get(method)
+        if quantized is not None:
+            arrays.update({f"supervisor_{method}_{name}": array for name, array in quantized.items()})
+
+    abstract_int8 = abstract_index.get('int8')
+    if abstract_int8 is not None:
+        arrays.update({f"abstract_int8_{name}": array for name, array in abstract_int8.items()})
+
+    for model, variant_index in indexes.get('variants', {}).items():
+        arrays[f"variant_{model}_uuids"] = np.array(variant_index['uuids'], dtype=str)
+        arrays[f"variant_{model}_matrix"] = variant_index['matrix']
+        arrays[f"variant_{model}_abstract_rows"] = variant_index['abstract_rows']
+    return arrays
+
+def snapshot_models(arrays):
+    """
+    Returns the models of the variant supervisor indexes in the named arrays of a snapshot.
+    """
+    return sorted(
+        name[len("variant_"):-len("_matrix")] for name in arrays
+        if name.startswith("variant_") and name.endswith("_matrix")
+    )
+
+def indexes_from_arrays(arrays):
+    """
+    Rebuilds the matching indexes from the named NumPy arrays of a snapshot.
+    """
+    topic_indptr = arrays['topic_indptr']
+    topics = {
+        int(topic_id): (arrays['topic_rows'][start:end], arrays['topic_scores'][start:end])
+        for topic_id, start, end in zip(arrays['topic_ids'], topic_indptr[:-1], topic_indptr[1:])
+    }
+
+    paper_columns = arrays['topic_paper_columns']
+    paper_uuids = arrays['topic_paper_uuids']
+    paper_matrix = csr_matrix(
+        (arrays['topic_paper_data'], arrays['topic_paper_indices'], arrays['topic_paper_indptr']),
+        shape=(len(paper_uuids), len(paper_columns)),
+    )
+
+    supervisor_index = {
+        'uuids': arrays['supervisor_uuids'],
+        'matrix': arrays['supervisor_matrix'],
+    }
+    if 'supervisor_ivf_centroids' in arrays:
+        supervisor_index['ivf'] = {
+            name: arrays[f"supervisor_ivf_{name}"] for name in ('centroids', 'assignments', 'order', 'offsets')
+        }
+    if 'supervisor_prefilter_matrix' in arrays:
+        supervisor_index['prefilter'] = {
+            name: arrays[f"supervisor_prefilter_{name}"] for name in ('components', 'mean', 'matrix')
+        }
+    if 'supervisor_int8_codes' in arrays:
+        supervisor_index['int8'] = {name: arrays[f"supervisor_int8_{name}"] for name in ('codes', 'scales', 'errors')}
+    if 'supervisor_binary_codes' in arrays:
+        supervisor_index['binary'] = {'codes': arrays['supervisor_binary_codes']}
+
+    abstract_index = {
+        'uuids': arrays['abstract_uuids'],
+        'matrix': arrays['abstract_matrix'],
+        'offsets': arrays['abstract_offsets'],
+        'lengths': arrays['abstract_lengths'],
+    }
+    if 'abstract_int8_codes' in arrays:
+        abstract_index['int8'] = {name: arrays[f"abstract_int8_{name}"] for name in ('codes', 'scales', 'errors')}
+
+    return {
+        'supervisors': supervisor_index,
+        'abstracts': abstract_index,
+        'topics': {
+            'uuids': arrays['topic_supervisor_uuids'],
+            'topics': topics,
+        },
+        'topic_papers': {
+            'rows': {str(uuid): row for row, uuid in enumerate(arrays['topic_paper_supervisor_uuids'])},
+            'offsets': arrays['topic_paper_offsets'],
+            'lengths': arrays['topic_paper_lengths'],
+            'uuids': paper_uuids,
+            'columns': {int(topic_id): column for column, topic_id in enumerate(paper_columns)},
+            'matrix': paper_matrix,
+        },
+        'variants': {
+            model: {
+                'uuids': arrays[f"variant_{model}_uuids"],
+                'matrix': arrays[f"variant_{model}_matrix"],
+                'abstract_rows': arrays[f"variant_{model}_abstract_rows"],
+            }
+            for model in snapshot_models(arrays)
+        },
+    }
+
+def save_snapshot(path, indexes):
+    """
+    Writes the matching indexes as a versioned binary snapshot to the directory at path.
+    The snapshot is written to a temporary directory first and then moved into place,
+    so a server never loads a partially written snapshot.
+    """
+    arrays = index_arrays(indexes)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'created': time.time(),
+        'num_supervisors': int(len(arrays['supervisor_uuids'])),
+        'num_abstracts': int(len(arrays['abstract_uuids'])),
+        'num_topics': int(len(arrays['topic_ids'])),
+        'models': snapshot_models(arrays),
+        'arrays': sorted(arrays),
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    old_path = f"{path}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def read_manifest(path):
+    """
+    Reads the manifest of the snapshot at path. Returns None if there is no readable manifest.
+    """
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def snapshot_is_fresh(manifest, max_age=None, models=()):
+    """
+    Checks that a snapshot manifest has the current version and the variant indexes of the given models
+    (except the default model, which is always included) and, if max_age is given, is at most max_age seconds old.
+    """
+    if not manifest or manifest.get('version') != SNAPSHOT_VERSION:
+        return False
+    if not set(models) - {DEFAULT_MODEL} <= set(manifest.get('models', [])):
+        return False
+    if max_age is not None and time.time() - manifest.get('created', 0) > max_age:
+        return False
+    return True
+
+def load_snapshot(path, max_age=None, mmap=False, models=(), lock=True):
+    """
+    Loads the matching indexes from the snapshot at path, with the snapshot manifest under 'manifest'.
+    With mmap, the arrays are memory-mapped read-only instead of read into process memory.
+    With lock, the snapshot is read under a shared snapshot lock, so a worker rewriting the snapshot
+    cannot replace it between the manifest and the arrays. Callers already holding the exclusive lock pass lock=False.
+    Returns None if the snapshot is missing, has another version, lacks one of the given models,
+    is older than max_age seconds or cannot be read.
+    """
+    if lock:
+        with snapshot_lock(path, shared=True):
+            return load_snapshot(path, max_age, mmap, models, lock=False)
+
+    manifest = read_manifest(path)
+    if not snapshot_is_fresh(manifest, max_age, models):
+        return None
+
+    try:
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None, allow_pickle=False)
+            for name in manifest['arrays']
+        }
+        return dict(indexes_from_arrays(arrays), manifest=manifest)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error loading index snapshot: {e}")
+        return None
+
+def touch_indexes(indexes):
+    """
+    Reads every numeric array of the matching indexes once, so the pages of a memory-mapped snapshot
+    are in memory before the first request needs them. The float32 supervisor and abstract matrices are skipped
+    if they have quantized codes, since only the rows of the candidates are read from them.
+    """
+    skipped = set()
+    if any(method in indexes['supervisors'] for method in ('int8', 'binary')):
+        skipped.add('supervisor_matrix')
+    if 'int8' in indexes['abstracts']:
+        skipped.add('abstract_matrix')
+
+    for name, array in index_arrays(indexes).items():
+        if name not in skipped and array.dtype.kind in "biuf" and array.size:
+            np.max(array)
+
+@contextmanager
+def snapshot_lock(path, shared=False):
+    """
+    Holds an exclusive lock on the snapshot at path, so only one worker process writes it at a time,
+    or with shared a shared lock, so readers never see a snapshot that is being replaced.
+    Readers of a snapshot in a read-only directory, where the lock file cannot be created, read without a lock.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        lock_file = open(f"{path}.lock", "a")
+    except OSError:
+        if not shared:
+            raise
+        yield
+        return
+
+    with lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def load_or_create_snapshot(path, build, max_age=None, mmap=True, models=()):
+    """
+    Loads the matching indexes from the snapshot at path. If the snapshot is missing or stale, the indexes
+    are built with the build function and written as a new snapshot, which is then loaded, so every worker
+    process maps the same files. Only one worker builds the snapshot, the others wait for it and load it.
+    """
+    indexes = load_snapshot(path, max_age, mmap, models)
+    if indexes is not None:
+        return indexes
+
+    with snapshot_lock(path):
+        # Another worker may have written the snapshot while we waited for the lock
+        indexes = load_snapshot(path, max_age, mmap, models, lock=False)
+        if indexes is not None:
+            return indexes
+
+        indexes = build()
+        try:
+            save_snapshot(path, indexes)
+        except OSError as e:
+            print(f"Error writing index snapshot: {e}")
+            return indexes
+
+    return load_snapshot(path, None, mmap) or indexes
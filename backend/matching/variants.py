@@ -0,0 +1,185 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from backend.matching.index import EMBEDDING_COLUMN, build_supervisor_index
+
+"""
+Embedding variants served by the matching API.
+The database stores ten supervisor embeddings per supervisor, from four encoder families (ModernBERT, BERT, SciBERT
+and SPECTER 2), averaged over the abstracts or computed on the concatenated abstracts, with and without keywords.
+A request selects a variant with its 'model' field. The supervisor matrix of each served variant is preloaded
+like the default SPECTER 2 matrix, and the query encoder of each family is loaded on first use by an EncoderPool,
+which evicts the least recently used encoders when they exceed a memory budget.
+"""
+
+DEFAULT_MODEL = "specter2_averaged_with_keywords"
+PAPER_FAMILY = "specter2" # The abstract embeddings used for the top paper are SPECTER 2 embeddings
+
+# 'uncased' marks the families whose tokenizers lowercase the text, so the case does not change their embeddings
+ENCODER_FAMILIES = {
+    'modernbert': {'model_id': "answerdotai/ModernBERT-base", 'max_length': 8192, 'uncased': False},
+    'bert': {'model_id': "bert-base-uncased", 'max_length': 512, 'uncased': True},
+    'scibert': {'model_id': "allenai/scibert_scivocab_uncased", 'max_length': 512, 'uncased': True},
+    'specter2': {'model_id': "allenai/specter2_base", 'adapter': "allenai/specter2", 'max_length': 512, 'uncased': True},
+}
+
+# Model name -> (encoder family, database column)
+EMBEDDING_VARIANTS = {
+    'modernbert_concatenated': ('modernbert', "modernbert_concatenated_embedding"),
+    'modernbert_concatenated_with_keywords': ('modernbert', "modernbert_concatenated_embedding_with_keywords"),
+    'modernbert_averaged': ('modernbert', "modernbert_averaged_embedding"),
+    'modernbert_averaged_with_keywords': ('modernbert', "modernbert_averaged_embedding_with_keywords"),
+    'bert_averaged': ('bert', "bert_averaged_embedding"),
+    'bert_averaged_with_keywords': ('bert', "bert_averaged_embedding_with_keywords"),
+    'scibert_averaged': ('scibert', "scibert_averaged_embedding"),
+    'scibert_averaged_with_keywords': ('scibert', "scibert_averaged_embedding_with_keywords"),
+    'specter2_averaged': ('specter2', "specter2_averaged_embedding"),
+    'specter2_averaged_with_keywords': ('specter2', EMBEDDING_COLUMN),
+}
+
+def parse_served_models(value):
+    """
+    Parses a comma-separated list of model names, or "all", into a tuple of served models starting with DEFAULT_MODEL.
+    Raises ValueError for unknown model names.
+    """
+    if value.strip() == "all":
+        names = list(EMBEDDING_VARIANTS)
+    else:
+        names = [name.strip() for name in value.split(",") if name.strip()]
+
+    unknown = [name for name in names if name not in EMBEDDING_VARIANTS]
+    if unknown:
+        raise ValueError(f"Unknown models: {', '.join(unknown)}")
+    return (DEFAULT_MODEL,) + tuple(name for name in dict.fromkeys(names) if name != DEFAULT_MODEL)
+
+def model_family(model):
+    """
+    Returns the encoder family of a model.
+    """
+    return EMBEDDING_VARIANTS[model][0]
+
+def build_variant_indexes(supervisors, models, supervisor_uuids):
+    """
+    Builds the supervisor index of each of the given models, except DEFAULT_MODEL, which is the 'supervisors' index.
+    Each variant index also has 'abstract_rows', the row of each of its supervisors in the default supervisor index
+    (-1 if missing), so the top paper can be found in the abstract index of the default supervisors.
+
+    Returns a dictionary model -> variant index.
+    """
+    default_rows = {uuid: row for row, uuid in enumerate(supervisor_uuids)}
+    variants = {}
+    for model in models:
+        if model == DEFAULT_MODEL:
+            continue
+        variant_index = build_supervisor_index(supervisors, EMBEDDING_VARIANTS[model][1])
+        variant_index['abstract_rows'] = np.array(
+            [default_rows.get(uuid, -1) for uuid in variant_index['uuids']], dtype=np.int64,
+        )
+        variants[model] = variant_index
+    return variants
+
+def load_encoder(family):
+    """
+    Loads the tokenizer and query encoder of an encoder family from the Hugging Face hub.
+    """
+    from transformers import AutoModel, AutoTokenizer
+
+    config = ENCODER_FAMILIES[family]
+    tokenizer = AutoTokenizer.from_pretrained(config['model_id'])
+    if 'adapter' in config:
+        from adapters import AutoAdapterModel
+
+        model = AutoAdapterModel.from_pretrained(config['model_id'])
+        model.load_adapter(config['adapter'], source="hf", load_as=family, set_active=True)
+    else:
+        model = AutoModel.from_pretrained(config['model_id'])
+    model.eval()
+    return tokenizer, model
+
+def model_bytes(model):
+    """
+    Returns the memory used by the weights of a PyTorch model, or the file size of an ONNX model.
+    """
+    if hasattr(model, "parameters"):
+        return sum(parameter.numel() * parameter.element_size() for parameter in model.parameters())
+    path = getattr(model, "path", None)
+    return os.path.getsize(path) if path and os.path.exists(path) else 0
+
+class EncoderPool:
+    """
+    Holds the query encoders of the encoder families, loading each on first use.
+    When the loaded encoders use more than memory_budget bytes, the least recently used ones are evicted,
+    except the pinned encoders. Requests that still use an evicted encoder keep it alive until they finish.
+
+    Parameters:
+        load: Function that takes an encoder family and returns a tuple (tokenizer, model).
+        memory_budget: Maximum bytes of loaded encoder weights. None disables eviction.
+        pinned: Optional dictionary family -> (tokenizer, model) of preloaded encoders that are never evicted.
+    """
+
+    def __init__(self, load, memory_budget=None, pinned=None):
+        self._load = load
+        self._memory_budget = memory_budget
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._encoders = OrderedDict()
+        self._pinned = set(pinned or {})
+        self._loads = 0
+        self._evictions = 0
+
+        for family, (tokenizer, model) in (pinned or {}).items():
+            self._encoders[family] = (tokenizer, model, model_bytes(model))
+
+    def get(self, family):
+        """
+        Returns the tuple (tokenizer, model) of an encoder family, loading it if needed.
+        """
+        with self._lock:
+            if family in self._encoders:
+                self._encoders.move_to_end(family)
+                return self._encoders[family][:2]
+            loading = self._loading.setdefault(family, threading.Lock())
+
+        # Only one thread loads a family, other families stay available meanwhile
+        with loading:
+            with self._lock:
+                if family in self._encoders:
+                    self._encoders.move_to_end(family)
+                    return self._encoders[family][:2]
+
+            print(f"Loading the {family} query encoder")
+            tokenizer, model = self._load(family)
+
+            with self._lock:
+                self._encoders[family] = (tokenizer, model, model_bytes(model))
+                self._loads += 1
+                self._evict(keep=family)
+            return tokenizer, model
+
+    def _evict(self, keep):
+        if self._memory_budget is None:
+            return
+
+        for family in list(self._encoders):
+            if sum(size for _, _, size in self._encoders.values()) <= self._memory_budget:
+                break
+            if family == keep or family in self._pinned:
+                continue
+            print(f"Evicting the {family} query encoder")
+            del self._encoders[family]
+            self._evictions += 1
+
+    def stats(self):
+        """
+        Returns the loaded encoder families and their memory use.
+        """
+        with self._lock:
+            return {
+                'loaded': list(self._encoders),
+                'memory_bytes': sum(size for _, _, size in self._encoders.values()),
+                'memory_budget': self._memory_budget,
+                'loads': self._loads,
+                'evictions': self._evictions,
+            }
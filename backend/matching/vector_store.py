@@ -0,0 +1,197 @@
+import os
+import threading
+import numpy as np
+
+from backend.matching.index import build_abstract_index, build_supervisor_index
+from backend.matching.loader import build_indexes, fetch_supervisor_topics, fetch_supervisors
+from backend.matching.paging import fetch_rows
+
+"""
+Server-side vector search with pgvector (VECTOR_BACKEND=pgvector).
+The SPECTER 2 supervisor and abstract embeddings are stored in vector columns of the tables in pgvector/schema.sql,
+with an HNSW index on the supervisor embeddings, and the top supervisors of a query and their top papers are found
+inside the database by the match_supervisors function, so the app processes do not hold the embedding matrices.
+The function is called directly over a Postgres connection at PGVECTOR_DSN, or through the Supabase RPC endpoint.
+The app only loads the topic indexes from the supervisor table, like the NumPy backend: the supervisor-topic relations
+and the topics of the abstracts, without any embeddings, so the topic suggestions do not depend on the vector store.
+The tables are filled from the supervisor table by sync_pgvector.py.
+psycopg is only imported when a Postgres connection is used.
+"""
+
+VECTOR_BACKENDS = ("numpy", "pgvector")
+VECTOR_DIM = 768 # Dimension of the vector columns in pgvector/schema.sql
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "..", "pgvector", "schema.sql")
+
+MATCH_QUERY = "SELECT supervisor, similarity, paper, paper_similarity FROM match_supervisors(%s::vector, %s)"
+
+def create_vector_store():
+    """
+    Returns the vector store of the pgvector backend: a PgVectorStore on PGVECTOR_DSN if it is set,
+    or a SupabaseVectorStore calling the functions through the Supabase RPC endpoint.
+    """
+    dsn = os.getenv("PGVECTOR_DSN")
+    if dsn:
+        ef_search = os.getenv("PGVECTOR_EF_SEARCH")
+        return PgVectorStore(dsn, int(ef_search) if ef_search else None)
+
+    if os.getenv("DATABASE_BACKEND", "supabase") != "supabase":
+        raise ValueError("VECTOR_BACKEND=pgvector needs PGVECTOR_DSN or the Supabase database backend")
+    from supabase import create_client
+
+    return SupabaseVectorStore(
+        create_client(os.getenv("NEXT_PUBLIC_SUPABASE_URL"), os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY"))
+    )
+
+def vector_literal(vector):
+    """
+    Returns the pgvector text representation of a vector.
+    """
+    return "[" + ",".join(f"{value:.9g}" for value in np.asarray(vector, dtype=np.float32).reshape(-1)) + "]"
+
+def match_suggestion(supervisor, similarity, paper, paper_similarity):
+    """
+    Converts a row of match_supervisors into a suggestion in the format of calculate_suggestions.
+    """
+    return {
+        'supervisor': supervisor,
+        'similarity': float(similarity),
+        'top_paper': None if paper is None else {'uuid': paper, 'similarity': float(paper_similarity)},
+    }
+
+def fetch_vector_indexes(store, supabase):
+    """
+    Builds the matching indexes of the pgvector backend: the topic indexes from the available supervisors and
+    the supervisor-topic relations in the database, the same rows as the NumPy backend, and a supervisor index
+    with only the uuids of the supervisors in the vector store.
+    """
+    supervisors = fetch_supervisors(supabase, (), abstract_fields=("uuid", "topics"))
+    indexes = build_indexes(supervisors, fetch_supervisor_topics(supabase))
+    supervisor_uuids = store.supervisor_uuids()
+    indexes['supervisors'] = {
+        'uuids': np.array(supervisor_uuids, dtype=object),
+        'matrix': np.zeros((len(supervisor_uuids), 0), dtype=np.float32),
+    }
+    return indexes
+
+def sync_vectors(store, supervisors):
+    """
+    Replaces the contents of the vector store with the SPECTER 2 embeddings of the given supervisor rows
+    and of their abstracts.
+
+    Returns a tuple (number of supervisors, number of abstracts) written.
+    """
+    supervisor_index = build_supervisor_index(supervisors)
+    if supervisor_index['matrix'].shape[0] and supervisor_index['matrix'].shape[1] != VECTOR_DIM:
+        raise ValueError(f"Expected {VECTOR_DIM}-dimensional embeddings, got {supervisor_index['matrix'].shape[1]}")
+    abstract_index = build_abstract_index(supervisors, supervisor_index['uuids'])
+
+    abstracts = []
+    for row, supervisor_id in enumerate(supervisor_index['uuids']):
+        start = abstract_index['offsets'][row]
+        seen = set()
+        for position in range(start, start + abstract_index['lengths'][row]):
+            abstract_id = abstract_index['uuids'][position]
+            if abstract_id in seen:
+                continue
+            seen.add(abstract_id)
+            abstracts.append((supervisor_id, abstract_id, abstract_index['matrix'][position]))
+
+    store.replace(zip(supervisor_index['uuids'], supervisor_index['matrix']), abstracts)
+    return len(supervisor_index['uuids']), len(abstracts)
+
+class PgVectorStore:
+    """
+    Vector store on a Postgres database with pgvector, with one connection per thread.
+
+    Parameters:
+        dsn: Postgres connection string.
+        ef_search: hnsw.ef_search of the connections, higher is slower with better recall (pgvector default 40).
+    """
+
+    def __init__(self, dsn, ef_search=None):
+        self.dsn = dsn
+        self.ef_search = ef_search
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or connection.closed:
+            import psycopg
+
+            connection = psycopg.connect(self.dsn, autocommit=True)
+            if self.ef_search:
+                connection.execute(f"SET hnsw.ef_search = {int(self.ef_search)}")
+            self._local.connection = connection
+        return connection
+
+    def match_supervisors(self, query, k):
+        """
+        Returns the suggestions of the k supervisors most similar to a normalised query vector, with their top papers.
+        """
+        rows = self._connection().execute(MATCH_QUERY, (vector_literal(query), k)).fetchall()
+        return [match_suggestion(*row) for row in rows]
+
+    def match_supervisors_batch(self, queries, k):
+        """
+        Returns the suggestions for each of a batch of normalised query vectors, sent in one pipeline.
+        """
+        connection = self._connection()
+        with connection.pipeline():
+            cursors = [connection.execute(MATCH_QUERY, (vector_literal(query), k)) for query in queries]
+        return [[match_suggestion(*row) for row in cursor.fetchall()] for cursor in cursors]
+
+    def supervisor_uuids(self):
+        """
+        Returns the uuids of the stored supervisors.
+        """
+        return [uuid for uuid, in self._connection().execute("SELECT uuid FROM supervisor_embedding ORDER BY uuid")]
+
+    def apply_schema(self):
+        with open(SCHEMA_PATH) as f:
+            self._connection().execute(f.read())
+
+    def replace(self, supervisors, abstracts):
+        """
+        Replaces the stored embeddings in one transaction, with (uuid, vector) supervisor rows and
+        (supervisor_uuid, uuid, vector) abstract rows, and updates the planner statistics.
+        """
+        self.apply_schema()
+        connection = self._connection()
+        with connection.transaction():
+            connection.execute("TRUNCATE supervisor_embedding, abstract_embedding")
+            with connection.cursor() as cursor:
+                with cursor.copy("COPY supervisor_embedding (uuid, embedding) FROM STDIN") as copy:
+                    for supervisor_id, vector in supervisors:
+                        copy.write_row((supervisor_id, vector_literal(vector)))
+                with cursor.copy("COPY abstract_embedding (supervisor_uuid, uuid, embedding) FROM STDIN") as copy:
+                    for supervisor_id, abstract_id, vector in abstracts:
+                        copy.write_row((supervisor_id, abstract_id, vector_literal(vector)))
+        connection.execute("ANALYZE supervisor_embedding")
+        connection.execute("ANALYZE abstract_embedding")
+
+class SupabaseVectorStore:
+    """
+    Read-only vector store calling match_supervisors through the Supabase RPC endpoint.
+    The tables are filled with a PgVectorStore on the connection string of the Supabase database.
+
+    Parameters:
+        supabase: Supabase client.
+    """
+
+    def __init__(self, supabase):
+        self._supabase = supabase
+
+    def match_supervisors(self, query, k):
+        rows = self._supabase.rpc(
+            "match_supervisors", {'query_embedding': vector_literal(query), 'match_count': k},
+        ).execute().data or []
+        return [
+            match_suggestion(row['supervisor'], row['similarity'], row['paper'], row['paper_similarity'])
+            for row in rows
+        ]
+
+    def match_supervisors_batch(self, queries, k):
+        return [self.match_supervisors(query, k) for query in queries]
+
+    def supervisor_uuids(self):
+        return [row['uuid'] for row in fetch_rows(self._supabase, "supervisor_embedding", ("uuid",))]
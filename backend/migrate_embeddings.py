@@ -0,0 +1,48 @@
+import json
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.matching.database import create_database_client
+from backend.matching.embedding_codec import EMBEDDING_DTYPES, encode_supervisor_embeddings
+from backend.matching.loader import fetch_supervisors
+from backend.matching.variants import EMBEDDING_VARIANTS
+
+"""
+Migrates the stored supervisor and abstract embeddings from JSON lists to the binary embedding encoding.
+Run it once after deploying the binary encoding: python backend/migrate_embeddings.py [float32|float16]
+Rows that are already encoded are left as they are, so the migration can be resumed after an interruption.
+The readers decode both formats, so the server keeps working during the migration.
+All supervisors are fetched in parallel pages before the updates are written.
+"""
+
+load_dotenv(".env.local")
+
+BATCH_SIZE = 25 # Supervisors per upsert
+COLUMNS = [column for _, column in EMBEDDING_VARIANTS.values()]
+
+dtype = sys.argv[1] if len(sys.argv) > 1 else os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")
+if dtype not in EMBEDDING_DTYPES:
+    raise SystemExit(f"Unknown embedding dtype: {dtype}")
+
+supabase = create_database_client()
+
+size_before = 0
+size_after = 0
+
+supervisors = fetch_supervisors(supabase, COLUMNS, available_only=False)
+
+updates = []
+for supervisor in supervisors:
+    encoded = encode_supervisor_embeddings(supervisor, dtype)
+    if encoded != supervisor:
+        updates.append(encoded)
+    size_before += len(json.dumps(supervisor))
+    size_after += len(json.dumps(encoded))
+
+for i in range(0, len(updates), BATCH_SIZE):
+    supabase.table("supervisor").upsert(updates[i:i + BATCH_SIZE]).execute()
+
+print(f"Migrated {len(updates)} supervisors to {dtype} embeddings, "
+      f"{size_before / 2**20:.1f} MB -> {size_after / 2**20:.1f} MB of supervisor rows")
@@ -0,0 +1,44 @@
+-- Schema of the server-side vector search (VECTOR_BACKEND=pgvector), applied by sync_pgvector.py.
+-- The SPECTER 2 supervisor and abstract embeddings are stored L2-normalised, so 1 - cosine distance
+-- is the cosine similarity of the in-process NumPy path.
+
+create extension if not exists vector;
+
+create table if not exists supervisor_embedding (
+    uuid text primary key,
+    embedding vector(768) not null
+);
+
+create table if not exists abstract_embedding (
+    uuid text not null,
+    supervisor_uuid text not null references supervisor_embedding (uuid) on delete cascade,
+    embedding vector(768) not null,
+    primary key (supervisor_uuid, uuid)
+);
+
+-- The top-k supervisor search uses the HNSW index. The top paper is searched among the abstracts
+-- of a single supervisor, which the primary key finds, so the abstracts need no vector index.
+create index if not exists supervisor_embedding_hnsw
+    on supervisor_embedding using hnsw (embedding vector_cosine_ops);
+
+-- Returns the match_count most similar supervisors, each with its most similar abstract
+create or replace function match_supervisors(query_embedding vector(768), match_count int default 6)
+returns table (supervisor text, similarity double precision, paper text, paper_similarity double precision)
+language sql stable
+as $$
+    select top.uuid, top.similarity, paper.uuid, paper.similarity
+    from (
+        select s.uuid, 1 - (s.embedding <=> query_embedding) as similarity
+        from supervisor_embedding s
+        order by s.embedding <=> query_embedding
+        limit match_count
+    ) top
+    left join lateral (
+        select a.uuid, 1 - (a.embedding <=> query_embedding) as similarity
+        from abstract_embedding a
+        where a.supervisor_uuid = top.uuid
+        order by a.embedding <=> query_embedding, a.uuid
+        limit 1
+    ) paper on true
+    order by top.similarity desc;
+$$;
@@ -0,0 +1,26 @@
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.matching.database import create_database_client
+from backend.matching.loader import fetch_supervisors
+from backend.matching.vector_store import PgVectorStore, sync_vectors
+
+"""
+Copies the SPECTER 2 supervisor and abstract embeddings of the available supervisors into the pgvector tables
+used by VECTOR_BACKEND=pgvector, creating the tables and the match_supervisors function if needed.
+Run it after the supervisors have been updated with create_supervisors/main.py: python backend/sync_pgvector.py
+The tables at PGVECTOR_DSN are replaced in one transaction, so running servers keep answering during the sync.
+"""
+
+load_dotenv(".env.local")
+
+dsn = os.getenv("PGVECTOR_DSN")
+if not dsn:
+    raise SystemExit("Set PGVECTOR_DSN to the connection string of the Postgres database with pgvector")
+
+supervisors = fetch_supervisors(create_database_client())
+num_supervisors, num_abstracts = sync_vectors(PgVectorStore(dsn), supervisors)
+
+print(f"Synced {num_supervisors} supervisors and {num_abstracts} abstracts to pgvector")
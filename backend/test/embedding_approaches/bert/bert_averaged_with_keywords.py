@@ -1,9 +1,9 @@
-import json
-import numpy as np
 from transformers import BertTokenizer, BertModel
 import torch
 from sklearn.metrics.pairwise import cosine_similarity
 
+from backend.matching.index import parse_embedding
+
 # Models and tokenizers
 model_id = "bert-base-uncased"
 tokenizer = BertTokenizer.from_pretrained(model_id)
@@ -47,13 +47,11 @@ def bert_averaged_embeddings_with_keywords(supervisors, supervisors_db):
             if not embedding_str:
                 continue
 
-            embedding_list = json.loads(embedding_str)
-
-            try:
-                supervisor_embedding = np.array([float(x) for x in embedding_list]).reshape(1, -1)
-            except ValueError:
+            supervisor_embedding = parse_embedding(embedding_str)
+            if supervisor_embedding is None:
                 print('Error parsing supervisor embedding')
                 continue
+            supervisor_embedding = supervisor_embedding.reshape(1, -1)
 
             similarity = cosine_similarity(embedding, supervisor_embedding)
             supervisor["similarity"] = similarity.item()
@@ -1,5 +1,3 @@
-import json
-import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 import torch
 from transformers import AutoTokenizer
@@ -7,6 +5,8 @@ from adapters import AutoAdapterModel
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from backend.matching.index import parse_embedding
+
 specter_tokenizer = AutoTokenizer.from_pretrained('allenai/specter2_base')
 specter_model = AutoAdapterModel.from_pretrained('allenai/specter2_base')
 
@@ -55,13 +55,11 @@ def specter2_averaged_embeddings(supervisors, supervisors_db):
             if not embedding_str:
                 continue
 
-            embedding_list = json.loads(embedding_str)
-
-            try:
-                supervisor_embedding = np.array([float(x) for x in embedding_list]).reshape(1, -1)
-            except ValueError:
+            supervisor_embedding = parse_embedding(embedding_str)
+            if supervisor_embedding is None:
                 print('Error parsing supervisor embedding')
                 continue
+            supervisor_embedding = supervisor_embedding.reshape(1, -1)
 
             similarity = cosine_similarity(embedding, supervisor_embedding)
             supervisor["similarity"] = similarity.item()
@@ -1,10 +1,10 @@
-import json
-import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 import torch
 from transformers import AutoTokenizer
 from adapters import AutoAdapterModel
 
+from backend.matching.index import parse_embedding
+
 specter_tokenizer = AutoTokenizer.from_pretrained('allenai/specter2_base')
 specter_model = AutoAdapterModel.from_pretrained('allenai/specter2_base')
 
@@ -53,13 +53,11 @@ def specter2_averaged_embeddings_with_keywords(supervisors, supervisors_db):
             if not embedding_str:
                 continue
 
-            embedding_list = json.loads(embedding_str)
-
-            try:
-                supervisor_embedding = np.array([float(x) for x in embedding_list]).reshape(1, -1)
-            except ValueError:
+            supervisor_embedding = parse_embedding(embedding_str)
+            if supervisor_embedding is None:
                 print('Error parsing supervisor embedding')
                 continue
+            supervisor_embedding = supervisor_embedding.reshape(1, -1)
 
             similarity = cosine_similarity(embedding, supervisor_embedding)
             supervisor["similarity"] = similarity.item()
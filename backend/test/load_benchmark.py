@@ -0,0 +1,222 @@
+import argparse
+import importlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.matching.fixtures import synthetic_fixtures
+from backend.matching.loader import build_indexes
+from backend.matching.snapshot import load_snapshot, save_snapshot
+
+"""
+Load-testing and latency benchmark of the /api endpoint.
+This script sends a reproducible mix of "specific" requests, with the supervisor proposals and GPT-generated proposals
+as texts, and "general" requests, with random selections of the indexed topics, from a number of concurrent clients,
+and reports the throughput, the p50/p95/p99 latency per projectType and the peak RSS, also written as JSON
+so results can be compared between commits.
+By default the server runs in-process on an index snapshot of synthetic supervisors (see matching/fixtures.py),
+so no database or network is needed (except to download the encoder once). Pass --snapshot to use an exported
+snapshot of the real supervisors, or --url to benchmark a running server (e.g. uvicorn asgi:application) started on the same snapshot.
+
+Example: python backend/test/load_benchmark.py --concurrency 8 --requests 500 --output results/load.json
+"""
+
+PROPOSAL_PATHS = ["backend/test/proposals/proposals.csv", "backend/test/proposals/gpt_proposals.csv"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test of the /api endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=500, help="Number of measured requests")
+    parser.add_argument("--warmup-requests", type=int, default=20, help="Requests sent before measuring")
+    parser.add_argument("--specific-ratio", type=float, default=0.5, help="Fraction of 'specific' requests")
+    parser.add_argument("--max-topics", type=int, default=3, help="Maximum number of topics of a 'general' request")
+    parser.add_argument("--supervisors", type=int, default=2000, help="Number of synthetic supervisors")
+    parser.add_argument("--topics", type=int, default=50, help="Number of synthetic topics")
+    parser.add_argument("--snapshot", help="Existing index snapshot to use instead of synthetic supervisors")
+    parser.add_argument("--url", help="Base URL of a running server, instead of the in-process server")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the embedding and topic caches")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of the JSON results")
+    return parser.parse_args()
+
+def load_proposals():
+    """
+    Loads the proposal texts used by the 'specific' requests.
+    """
+    texts = []
+    for path in PROPOSAL_PATHS:
+        texts.extend(str(text) for text in pd.read_csv(path)['proposal'])
+    return texts
+
+def build_requests(count, texts, topic_ids, specific_ratio, max_topics, rng):
+    """
+    Builds a reproducible list of /api request bodies.
+    """
+    bodies = []
+    for _ in range(count):
+        if rng.random() < specific_ratio or not topic_ids:
+            bodies.append({'projectType': "specific", 'text': rng.choice(texts)})
+        else:
+            topics = rng.sample(topic_ids, rng.randint(1, min(max_topics, len(topic_ids))))
+            bodies.append({'projectType': "general", 'topics': [{'topicId': topic_id} for topic_id in topics]})
+    return bodies
+
+def in_process_client():
+    """
+    Imports the server with the configured environment, waits for its warm-up, and returns a function
+    that sends a request body to /api and returns the HTTP status code.
+    """
+    server = importlib.import_module("backend.app")
+    while not server.warmup_state['complete'] and server.warmup_state['error'] is None:
+        time.sleep(0.1)
+
+    clients = threading.local()
+
+    def send(body):
+        if not hasattr(clients, "client"):
+            clients.client = server.app.test_client()
+        return clients.client.post("/api", json=body).status_code
+    return send
+
+def http_client(url):
+    """
+    Returns a function that sends a request body to /api of a running server and returns the HTTP status code.
+    """
+    import requests
+
+    sessions = threading.local()
+
+    def send(body):
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        return sessions.session.post(f"{url.rstrip('/')}/api", json=body, timeout=60).status_code
+    return send
+
+def run(send, bodies, concurrency):
+    """
+    Sends the request bodies from concurrent clients.
+
+    Returns a tuple (results, seconds), with a tuple (projectType, latency in ms, status code) per request.
+    """
+    def timed_send(body):
+        start = time.perf_counter()
+        try:
+            status = send(body)
+        except Exception as e:
+            print(f"Request failed: {e}")
+            status = 0
+        return body['projectType'], (time.perf_counter() - start) * 1000, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_send, bodies))
+    return results, time.perf_counter() - start
+
+def summarize(results):
+    """
+    Returns the request count, error count and latency percentiles in ms per projectType and over all requests.
+    """
+    groups = {'all': results}
+    for project_type in sorted({project_type for project_type, _, _ in results}):
+        groups[project_type] = [result for result in results if result[0] == project_type]
+
+    summary = {}
+    for name, group in groups.items():
+        latencies = np.array([latency for _, latency, _ in group])
+        summary[name] = {
+            'requests': len(group),
+            'errors': sum(1 for _, _, status in group if status != 200),
+            'mean_ms': float(latencies.mean()),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'max_ms': float(latencies.max()),
+        }
+    return summary
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+
+    snapshot_path = args.snapshot
+    if snapshot_path is None:
+        snapshot_path = os.path.join(tempfile.mkdtemp(prefix="load-benchmark-"), "snapshot")
+        print(f"Writing a snapshot of {args.supervisors} synthetic supervisors to {snapshot_path}")
+        supervisors, _, supervisor_topics = synthetic_fixtures(args.supervisors, args.topics, args.seed)
+        save_snapshot(snapshot_path, build_indexes(supervisors, supervisor_topics))
+
+    indexes = load_snapshot(snapshot_path)
+    if indexes is None:
+        raise SystemExit(f"Could not load the index snapshot at {snapshot_path}")
+    topic_ids = sorted(int(topic_id) for topic_id in indexes['topics']['topics'])
+
+    if args.url:
+        send = http_client(args.url)
+    else:
+        # The server reads its configuration when it is imported
+        os.environ["INDEX_SNAPSHOT_PATH"] = snapshot_path
+        os.environ["INDEX_RELOAD_INTERVAL_SECONDS"] = "0"
+        if args.no_cache:
+            os.environ["EMBEDDING_CACHE_SIZE"] = "0"
+            os.environ["TOPIC_CACHE_SIZE"] = "0"
+        send = in_process_client()
+
+    texts = load_proposals()
+    warmup = build_requests(args.warmup_requests, texts, topic_ids, args.specific_ratio, args.max_topics, rng)
+    bodies = build_requests(args.requests, texts, topic_ids, args.specific_ratio, args.max_topics, rng)
+
+    run(send, warmup, args.concurrency)
+    results, seconds = run(send, bodies, args.concurrency)
+
+    report = {
+        'commit': git_commit(),
+        'created': time.time(),
+        'config': {
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'specific_ratio': args.specific_ratio,
+            'max_topics': args.max_topics,
+            'snapshot': args.snapshot,
+            'supervisors': len(indexes['supervisors']['uuids']),
+            'url': args.url,
+            'cache': not args.no_cache,
+            'seed': args.seed,
+        },
+        'seconds': seconds,
+        'throughput_rps': len(results) / seconds,
+        'latency': summarize(results),
+        # Only the in-process server is measured, ru_maxrss is in KB on Linux
+        'peak_rss_mb': None if args.url else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+    print(f"{len(results)} requests in {seconds:.1f} s, {report['throughput_rps']:.1f} requests/s")
+    for name, stats in report['latency'].items():
+        print(f"{name:>10}: {stats['requests']} requests, {stats['errors']} errors, p50 {stats['p50_ms']:.1f} ms, "
+              f"p95 {stats['p95_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms")
+    if report['peak_rss_mb'] is not None:
+        print(f"Peak RSS: {report['peak_rss_mb']:.0f} MB")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
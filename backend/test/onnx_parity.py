@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+from dotenv import load_dotenv
+import numpy as np
+import pandas as pd
+import requests
+from supabase import create_client, Client
+from transformers import AutoTokenizer
+from adapters import AutoAdapterModel
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.matching.encoder import encode_batch
+from backend.matching.index import build_supervisor_index, normalize_queries
+from backend.matching.loader import fetch_supervisors
+from backend.matching.onnx_backend import OnnxEncoder, ensure_onnx_model
+
+"""
+Parity check of the ONNX Runtime inference backends against the PyTorch query encoder.
+This script encodes the supervisor proposals and GPT-generated proposals with the PyTorch, ONNX and int8-quantized
+ONNX backends, and reports the cosine drift of the ONNX embeddings from the PyTorch embeddings, the encoding time,
+and the Mean Reciprocal Rank of each backend on the same proposals as workflow_1.py.
+"""
+
+load_dotenv("backend/.env.local")
+
+url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+key = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+PURE_API_KEY = os.environ.get("PURE_API_KEY")
+PURE_BASE_URL = os.environ.get("PURE_BASE_URL")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "backend/onnx")
+
+supabase: Client = create_client(url, key)
+
+def fetch_supervisor_name(uuid):
+    """
+    Fetches the name of a supervisor from the PURE API.
+    """
+    try:
+        person_url = f"{PURE_BASE_URL}/persons/{uuid}"
+        person_headers = {
+            "accept": "application/json",
+            "api-key": PURE_API_KEY,
+        }
+        response = requests.get(person_url, headers=person_headers)
+        response.raise_for_status()
+        return response.json().get("name", {})
+    except Exception as e:
+        print(f"Error fetching supervisor name: {e}")
+        return {}
+
+def load_specter_model():
+    model = AutoAdapterModel.from_pretrained('allenai/specter2_base')
+    model.load_adapter("allenai/specter2", source="hf", load_as="specter2", set_active=True)
+    return model
+
+def mean_reciprocal_rank(embeddings, proposals, supervisor_index, names):
+    """
+    Calculates the MRR of the proposal embeddings, ranking all supervisors for each proposal.
+    """
+    scores = normalize_queries(embeddings) @ supervisor_index['matrix'].T
+    reciprocal_ranks = []
+
+    for (_, row), proposal_scores in zip(proposals.iterrows(), scores):
+        ranking = np.argsort(-proposal_scores, kind="stable")
+        for rank, supervisor_row in enumerate(ranking, 1):
+            name = names.get(supervisor_index['uuids'][supervisor_row], {})
+            if name.get('firstName') == row['firstName'] and name.get('lastName') == row['lastName']:
+                reciprocal_ranks.append(1.0 / rank)
+                break
+
+    return sum(reciprocal_ranks) / len(reciprocal_ranks) if reciprocal_ranks else 0
+
+supervisors_db = fetch_supervisors(
+    supabase, ("specter2_averaged_embedding_with_keywords",), abstract_fields=(), available_only=False,
+)
+
+print(f"Fetched total rows: {len(supervisors_db)}")
+
+supervisor_index = build_supervisor_index(supervisors_db)
+names = {uuid: fetch_supervisor_name(uuid) for uuid in tqdm(supervisor_index['uuids'], desc="Fetching supervisor names")}
+
+tokenizer = AutoTokenizer.from_pretrained('allenai/specter2_base')
+pytorch_model = load_specter_model()
+backends = {
+    "pytorch": pytorch_model,
+    "onnx": OnnxEncoder(ensure_onnx_model(ONNX_MODEL_DIR, False, lambda: pytorch_model, tokenizer)),
+    "onnx-int8": OnnxEncoder(ensure_onnx_model(ONNX_MODEL_DIR, True, lambda: pytorch_model, tokenizer)),
+}
+
+for label, path in [("supervisor_proposals", "backend/test/proposals/proposals.csv"), ("gpt_proposals", "backend/test/proposals/gpt_proposals.csv")]:
+    proposals = pd.read_csv(path)
+    texts = [str(text) for text in proposals['proposal']]
+
+    print("__" * 50)
+    print(f"\nEvaluating {label} ({len(texts)} proposals)...")
+
+    reference = None
+    for backend, model in backends.items():
+        start = time.perf_counter()
+        embeddings = encode_batch(tokenizer, model, texts, max_length=512)
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference = normalize_queries(embeddings)
+        drift = 1 - np.sum(normalize_queries(embeddings) * reference, axis=1)
+
+        mrr = mean_reciprocal_rank(embeddings, proposals, supervisor_index, names)
+        print(f"{backend:>10}: MRR {mrr:.4f}, cosine drift mean {drift.mean():.2e} max {drift.max():.2e}, "
+              f"{elapsed * 1000 / len(texts):.1f} ms per proposal")
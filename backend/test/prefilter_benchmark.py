@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+from dotenv import load_dotenv
+import numpy as np
+import pandas as pd
+from transformers import AutoTokenizer
+from adapters import AutoAdapterModel
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.matching.database import create_database_client
+from backend.matching.encoder import encode_batch
+from backend.matching.index import normalize_queries, normalize_rows, rank_supervisors_batch
+from backend.matching.loader import fetch_indexes
+from backend.matching.retrieval import build_prefilter_index, fit_projection, load_projection, search_prefilter
+from backend.matching.snapshot import load_snapshot
+
+"""
+Benchmark of the reduced-dimension prefilter against the exact scan of the supervisor matrix.
+This script encodes the supervisor proposals and GPT-generated proposals with SPECTER 2, and reports for each
+projection (the fitted one from create_supervisors, and PCA and random projections to several dimensions) and number
+of re-scored candidates the time per proposal, the speedup over the exact scan and the recall@6 of the exact top 6.
+To simulate a multi-institution deployment, pass a number of supervisors, and the supervisor matrix is scaled up to it
+with perturbed copies of the real supervisors: python backend/test/prefilter_benchmark.py 100000
+"""
+
+load_dotenv("backend/.env.local")
+
+SNAPSHOT_PATH = os.getenv("INDEX_SNAPSHOT_PATH", "backend/snapshot")
+PROJECTION_PATH = os.getenv("PROJECTION_PATH", "backend/projection.npz")
+NUM_OF_SUPERVISORS = 6
+DIMS = [64, 128, 256]
+CANDIDATES = [32, 64, 128, 256, 512]
+REPEATS = 5
+
+def load_supervisor_matrix():
+    """
+    Loads the supervisor matrix from the index snapshot, or from the database if there is none.
+    """
+    indexes = load_snapshot(SNAPSHOT_PATH)
+    if indexes is None:
+        indexes = fetch_indexes(create_database_client())
+    return np.asarray(indexes['supervisors']['matrix'])
+
+def scale_matrix(matrix, size, noise=0.05, seed=0):
+    """
+    Scales the supervisor matrix up to size rows with normalised, perturbed copies of its rows.
+    """
+    rng = np.random.default_rng(seed)
+    copies = matrix[rng.integers(0, matrix.shape[0], size - matrix.shape[0])]
+    copies = copies + rng.normal(scale=noise / np.sqrt(matrix.shape[1]), size=copies.shape).astype(np.float32)
+    return np.ascontiguousarray(np.vstack([matrix, normalize_rows(copies.astype(np.float32))]))
+
+def timed_ms(function):
+    """
+    Returns the result of function and its mean duration over REPEATS runs in milliseconds.
+    """
+    result = function()
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        function()
+    return result, (time.perf_counter() - start) * 1000 / REPEATS
+
+def recall(rows, exact_rows):
+    """
+    Returns the mean fraction of the exact top rows that were retrieved.
+    """
+    return np.mean([len(set(found) & set(exact)) / len(exact) for found, exact in zip(rows, exact_rows)])
+
+matrix = load_supervisor_matrix()
+if len(sys.argv) > 1 and int(sys.argv[1]) > matrix.shape[0]:
+    matrix = scale_matrix(matrix, int(sys.argv[1]))
+print(f"Supervisor matrix: {matrix.shape[0]} x {matrix.shape[1]}")
+
+tokenizer = AutoTokenizer.from_pretrained('allenai/specter2_base')
+model = AutoAdapterModel.from_pretrained('allenai/specter2_base')
+model.load_adapter("allenai/specter2", source="hf", load_as="specter2", set_active=True)
+
+texts = []
+for path in ["backend/test/proposals/proposals.csv", "backend/test/proposals/gpt_proposals.csv"]:
+    texts.extend(str(text) for text in pd.read_csv(path)['proposal'])
+queries = normalize_queries(encode_batch(tokenizer, model, texts, max_length=512))
+print(f"Queries: {len(texts)} proposals")
+
+(exact_rows, _), exact_ms = timed_ms(lambda: rank_supervisors_batch(queries, {'matrix': matrix}, NUM_OF_SUPERVISORS))
+print(f"{'exact':>22}: {exact_ms / len(texts):.3f} ms per proposal")
+
+projections = {}
+fitted = load_projection(PROJECTION_PATH)
+if fitted is not None:
+    projections[f"fitted {fitted['method']} {fitted['components'].shape[0]}"] = fitted
+for dim in DIMS:
+    projections[f"pca {dim}"] = fit_projection(matrix, dim, "pca")
+    projections[f"random {dim}"] = fit_projection(matrix, dim, "random")
+
+print("__" * 50)
+for label, projection in projections.items():
+    prefilter = build_prefilter_index(matrix, projection)
+    for candidates in CANDIDATES:
+        (rows, _), ms = timed_ms(lambda: search_prefilter(queries, matrix, prefilter, NUM_OF_SUPERVISORS, candidates))
+        print(f"{label:>15} top {candidates:>3}: {ms / len(texts):.3f} ms per proposal, "
+              f"speedup {exact_ms / ms:.2f}x, recall@6 {recall(rows, exact_rows):.4f}")
+
+# Scoring in float16 needs a conversion per query in NumPy, which is reported for comparison
+prefilter = build_prefilter_index(matrix, projections["pca 128"])
+half_matrix = prefilter['matrix'].astype(np.float16)
+_, half_ms = timed_ms(lambda: (queries @ prefilter['components'].T) @ half_matrix.astype(np.float32).T)
+print(f"{'pca 128 float16':>15} first stage only: {half_ms / len(texts):.3f} ms per proposal, "
+      f"speedup {exact_ms / half_ms:.2f}x")
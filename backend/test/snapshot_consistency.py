@@ -0,0 +1,99 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.matching.fixtures import synthetic_fixtures
+from backend.matching.loader import build_indexes
+from backend.matching.snapshot import load_snapshot, save_snapshot, snapshot_lock
+
+"""
+Consistency check of index snapshots that are loaded while another process rewrites them.
+A writer process alternately saves the indexes of two sets of synthetic supervisors (see matching/fixtures.py)
+with the same number of supervisors as the snapshot, under the snapshot lock like a triggered reload,
+while this process keeps loading the snapshot memory-mapped like a scheduled poll. Every load is checked
+for supervisor and abstract uuids paired with the matrix rows of the other set, which keep their shapes.
+Exits with status 1 if any load was mixed or failed. Pass --no-lock to load without the shared lock and see the race.
+
+Example: python backend/test/snapshot_consistency.py --seconds 10
+"""
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Loads index snapshots while they are rewritten")
+    parser.add_argument("--supervisors", type=int, default=500, help="Number of synthetic supervisors of each set")
+    parser.add_argument("--topics", type=int, default=20, help="Number of synthetic topics")
+    parser.add_argument("--seconds", type=float, default=10, help="Duration of the check")
+    parser.add_argument("--no-lock", action="store_true", help="Load the snapshot without the shared lock")
+    return parser.parse_args()
+
+def fixture_indexes(num_supervisors, num_topics, seed):
+    supervisors, _, supervisor_topics = synthetic_fixtures(num_supervisors, num_topics, seed, models=())
+    return build_indexes(supervisors, supervisor_topics)
+
+def rewrite_snapshots(path, index_sets, stop):
+    """
+    Saves the index sets in turn to the snapshot at path until stop is set.
+    """
+    saves = 0
+    while not stop.is_set():
+        with snapshot_lock(path):
+            save_snapshot(path, index_sets[saves % len(index_sets)])
+        saves += 1
+
+def expected_rows(index_sets, name):
+    """
+    Returns the rows of the given index of all index sets by uuid.
+    """
+    return {
+        str(uuid): row
+        for indexes in index_sets
+        for uuid, row in zip(indexes[name]['uuids'], indexes[name]['matrix'])
+    }
+
+def is_consistent(indexes, expected):
+    """
+    Checks that every uuid of the supervisor and abstract indexes is paired with its own matrix row.
+    """
+    for name in ('supervisors', 'abstracts'):
+        for uuid, row in zip(indexes[name]['uuids'], indexes[name]['matrix']):
+            if not np.array_equal(expected[name][str(uuid)], row):
+                return False
+    return True
+
+def main():
+    args = parse_args()
+    index_sets = [fixture_indexes(args.supervisors, args.topics, seed) for seed in (0, 1)]
+    expected = {name: expected_rows(index_sets, name) for name in ('supervisors', 'abstracts')}
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "snapshot")
+        save_snapshot(path, index_sets[0])
+
+        stop = multiprocessing.Event()
+        writer = multiprocessing.Process(target=rewrite_snapshots, args=(path, index_sets, stop))
+        writer.start()
+
+        loads = 0
+        failed = 0
+        mixed = 0
+        deadline = time.perf_counter() + args.seconds
+        while time.perf_counter() < deadline:
+            indexes = load_snapshot(path, mmap=True, lock=not args.no_lock)
+            loads += 1
+            if indexes is None:
+                failed += 1
+            elif not is_consistent(indexes, expected):
+                mixed += 1
+
+        stop.set()
+        writer.join()
+
+    print(f"{loads} loads: {mixed} mixed snapshots, {failed} failed loads")
+    sys.exit(1 if mixed or failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,7 @@ import os
 from tqdm import tqdm
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.matching.loader import fetch_supervisors
 from backend.test.embedding_approaches.modernbert.modernbert_averaged_embeddings import modernbert_averaged_embeddings
 from backend.test.embedding_approaches.modernbert.modernbert_averaged_embeddings_with_keywords import modernbert_averaged_embeddings_with_keywords
 from backend.test.embedding_approaches.modernbert.modernbert_concatenated_embeddings import modernbert_concatenated_embeddings
@@ -163,36 +164,23 @@ def evaluate_proposals(proposals, supervisors_db, label):
 proposals = pd.read_csv("backend/test/proposals/proposals.csv")
 gpt_proposals = pd.read_csv("backend/test/proposals/gpt_proposals.csv")
 
-BATCH_SIZE = 20
-offset = 0
-supervisors_db = []
-
-while True:
-    response = (
-        supabase.table("supervisor")
-        .select(
-            "uuid",
-            "abstracts",
-            "modernbert_concatenated_embedding", 
-            "modernbert_averaged_embedding", 
-            "modernbert_concatenated_embedding_with_keywords", 
-            "modernbert_averaged_embedding_with_keywords", 
-            "bert_averaged_embedding", 
-            "bert_averaged_embedding_with_keywords",
-            "scibert_averaged_embedding",
-            "scibert_averaged_embedding_with_keywords",
-            "specter2_averaged_embedding",
-            "specter2_averaged_embedding_with_keywords",
-        )
-        .range(offset, offset + BATCH_SIZE - 1)
-        .execute()
-    )
-    batch = response.data or []
-    if not batch:
-        break
-
-    supervisors_db.extend(batch)
-    offset += BATCH_SIZE
+supervisors_db = fetch_supervisors(
+    supabase,
+    (
+        "modernbert_concatenated_embedding",
+        "modernbert_averaged_embedding",
+        "modernbert_concatenated_embedding_with_keywords",
+        "modernbert_averaged_embedding_with_keywords",
+        "bert_averaged_embedding",
+        "bert_averaged_embedding_with_keywords",
+        "scibert_averaged_embedding",
+        "scibert_averaged_embedding_with_keywords",
+        "specter2_averaged_embedding",
+        "specter2_averaged_embedding_with_keywords",
+    ),
+    abstract_fields=("uuid",), # Only the uuids are used, to fetch the abstract texts from PURE
+    available_only=False,
+)
 
 for db_supervisor in tqdm(supervisors_db, desc="Fetching supervisor names and abstracts"):
         name, keywords = fetch_supervisor_name_and_keywords(db_supervisor['uuid'])
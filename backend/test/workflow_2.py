@@ -14,6 +14,8 @@ from supabase import create_client, Client
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.matching.loader import fetch_supervisor_topics, fetch_supervisors
+from backend.matching.paging import fetch_rows
 
 """
 This evaluation fetches supervisors and their topics from the database, retrieves researchers from PURE,
@@ -30,39 +32,12 @@ PURE_BASE_URL = os.environ.get("PURE_BASE_URL")
 supabase: Client = create_client(url, key)
 
 # Fetching supervisors from the database
-BATCH_SIZE = 50
-offset = 0
-supervisors_db = []
-
-while True:
-    response = (
-        supabase.table("supervisor")
-        .select("uuid")
-        .range(offset, offset + BATCH_SIZE - 1)
-        .execute()
-    )
-    batch = response.data or []
-    if not batch:
-        break
-
-    supervisors_db.extend(batch)
-    offset += BATCH_SIZE
+supervisors_db = fetch_supervisors(supabase, (), abstract_fields=(), available_only=False)
 
 print(f"Fetched total rows: {len(supervisors_db)}")
 
-response = (
-    supabase.table("supervisor_topic")
-    .select("*")
-    .execute()
-)
-supervisors_db_topics = response.data
-
-response = (
-    supabase.table("topic")
-    .select("*")
-    .execute()
-)
-topics_db = response.data
+supervisors_db_topics = fetch_supervisor_topics(supabase)
+topics_db = fetch_rows(supabase, "topic", ("*",), order=("topic_id",))
 
 # Fetching researchers from PURE
 person_url = f"{PURE_BASE_URL}/persons"